@@ -8,7 +8,8 @@ from flask_migrate import Migrate
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config import Config
-from models import db
+from models import db, upgrade_schema
+from commands import register_commands
 from routes.auth import auth_bp
 from routes.chat import chat_bp
 from routes.conversations import conversations_bp
@@ -18,15 +19,27 @@ from routes.export import export_bp
 from routes.search import search_bp
 from routes.stats import stats_bp
 from routes.api_keys import api_keys_bp
+from routes.batch import batch_bp
+from services.vector_search import preload_vector_search_service
+from services.vector_store import validate_quantization
+from services.indexing_pipeline import init_indexing_pipeline
+from services.batch_runner import init_batch_runner
+from services.full_text import setup_full_text_search
+from services.serializers import ORJSONProvider, ORJSON_AVAILABLE
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Fail at startup rather than on the first search
+    validate_quantization(app.config['VECTOR_QUANTIZATION'])
+    if ORJSON_AVAILABLE:
+        app.json = ORJSONProvider(app)
     
     # Initialize extensions
     db.init_app(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
     migrate = Migrate(app, db)
+    register_commands(app)
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -38,6 +51,7 @@ def create_app(config_class=Config):
     app.register_blueprint(search_bp, url_prefix='/api/search')
     app.register_blueprint(stats_bp, url_prefix='/api/stats')
     app.register_blueprint(api_keys_bp, url_prefix='/api/api-keys')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
     
     # Health check
     @app.route('/api/health')
@@ -48,10 +62,22 @@ def create_app(config_class=Config):
     with app.app_context():
         try:
             db.create_all()
+            upgrade_schema()
+            if app.config.get('FULL_TEXT_SEARCH_ENABLED'):
+                setup_full_text_search()
         except Exception as e:
             print(f"Warning: Could not create database tables: {e}")
             print("Make sure PostgreSQL is running and DATABASE_URL is correct in .env")
     
+    if app.config.get('INDEXING_ENABLED'):
+        init_indexing_pipeline(app)
+    
+    if app.config.get('BATCH_ENABLED'):
+        init_batch_runner(app)
+    
+    if app.config.get('VECTOR_SEARCH_PRELOAD'):
+        preload_vector_search_service()
+    
     return app
 
 # App instance for Flask CLI
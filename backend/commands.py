@@ -0,0 +1,165 @@
+import json
+import os
+import click
+from flask import Flask
+from flask.cli import AppGroup
+from config import Config
+from models import db, Conversation, Message, MessageEmbedding
+from services.vector_store import pack_embedding
+
+embeddings_cli = AppGroup('embeddings', help='Manage stored message embeddings.')
+
+@embeddings_cli.command('migrate-json')
+@click.option('--batch-size', default=500, show_default=True, help='Messages converted per transaction.')
+@click.option('--model', default=None, help='Embedding model that produced the JSON vectors (default: EMBEDDING_MODEL).')
+def migrate_json_embeddings(batch_size, model):
+    """Convert legacy JSON Message.embedding values to packed float32 rows
+
+    Vectors are recorded as produced by --model. When that is the current
+    EMBEDDING_MODEL, vectors of another dimension can't be from it: they are
+    left in the JSON column (and reported) instead of being mislabelled.
+    """
+    model = model or Config.EMBEDDING_MODEL
+    expected_dim = None
+    if model == Config.EMBEDDING_MODEL:
+        from services.vector_search import get_vector_search_service
+        embedding_model = get_vector_search_service().embedding_model
+        if embedding_model is not None:
+            expected_dim = embedding_model.get_sentence_embedding_dimension()
+        else:
+            click.echo(f"Warning: {model} is not loaded, so vector dimensions can't be checked")
+
+    last_id = 0
+    converted = 0
+    skipped = 0
+
+    while True:
+        rows = db.session.query(Message, Conversation.user_id).join(
+            Conversation, Message.conversation_id == Conversation.id
+        ).filter(
+            Message.id > last_id,
+            Message.embedding.isnot(None)
+        ).order_by(Message.id.asc()).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        for message, user_id in rows:
+            if message.embedding and expected_dim is not None and len(message.embedding) != expected_dim:
+                skipped += 1
+                continue
+            if message.embedding:
+                db.session.merge(MessageEmbedding(
+                    message_id=message.id,
+                    user_id=user_id,
+                    model=model,
+                    dim=len(message.embedding),
+                    vector=pack_embedding(message.embedding)
+                ))
+                converted += 1
+            # SQL NULL rather than JSON 'null' so the row drops out of the filter above
+            message.embedding = db.null()
+
+        last_id = rows[-1][0].id
+        db.session.commit()
+        db.session.expunge_all()
+        click.echo(f"Converted {converted} embeddings (up to message {last_id})")
+
+    click.echo(f"Done. {converted} embeddings migrated.")
+    if skipped:
+        click.echo(f"Skipped {skipped} vectors whose dimension isn't {expected_dim}; re-run with "
+                   f"--model set to the model that produced them, or re-embed with 'flask embeddings reindex'.")
+
+@embeddings_cli.command('reindex')
+@click.option('--chunk-size', default=1000, show_default=True, help='Messages fetched, encoded and upserted per chunk.')
+@click.option('--workers', default=1, show_default=True, help='Encoder processes (1 encodes in this process).')
+@click.option('--restart', is_flag=True, help='Re-embed everything instead of resuming from SearchIndex progress.')
+@click.option('--user', 'user_id', default=None, help='Only reindex this user.')
+def reindex_command(chunk_size, workers, restart, user_id):
+    """Build or resume the vector index for all messages"""
+    from services.reindex import reindex_messages
+    from services.vector_search import get_vector_search_service
+
+    service = get_vector_search_service()
+    if not service.embedding_model:
+        raise click.ClickException('Embedding model is not available; install sentence-transformers.')
+    reindex_messages(service, chunk_size=chunk_size, workers=workers, restart=restart,
+                     user_id=user_id, report=click.echo)
+
+@embeddings_cli.command('benchmark-ann')
+@click.option('--rows', default=100000, show_default=True, help='Synthetic vectors in the shard.')
+@click.option('--dim', default=384, show_default=True)
+@click.option('--queries', default=200, show_default=True)
+@click.option('--k', default=10, show_default=True)
+@click.option('--nprobe', 'nprobes', multiple=True, type=int, default=(4, 16, 64), show_default=True)
+def benchmark_ann_command(rows, dim, queries, k, nprobes):
+    """Recall@k and latency of the local IVF index vs. brute force"""
+    from services.benchmarks import benchmark_ann
+    report = benchmark_ann(rows=rows, dim=dim, queries=queries, k=k, nprobes=nprobes)
+    click.echo(json.dumps(report, indent=2))
+
+@embeddings_cli.command('benchmark-quantization')
+@click.option('--rows', default=100000, show_default=True, help='Synthetic vectors per mode.')
+@click.option('--dim', default=384, show_default=True)
+@click.option('--queries', default=200, show_default=True)
+@click.option('--k', default=10, show_default=True)
+@click.option('--rescore', 'rescore_candidates', default=200, show_default=True, help='Candidates rescored in float32.')
+def benchmark_quantization_command(rows, dim, queries, k, rescore_candidates):
+    """Recall@k and memory of int8/binary codes vs. float32"""
+    from services.benchmarks import benchmark_quantization
+    report = benchmark_quantization(rows=rows, dim=dim, queries=queries, k=k,
+                                    rescore_candidates=rescore_candidates)
+    click.echo(json.dumps(report, indent=2))
+
+perf_cli = AppGroup('perf', help='Query performance checks.')
+
+@perf_cli.command('explain')
+@click.option('--users', default=20, show_default=True, help='Seeded users.')
+@click.option('--conversations', 'conversations_per_user', default=200, show_default=True, help='Seeded conversations per user.')
+@click.option('--messages', 'messages_per_conversation', default=10, show_default=True, help='Seeded messages per conversation.')
+def explain_command(users, conversations_per_user, messages_per_conversation):
+    """Run EXPLAIN QUERY PLAN on every statement the main endpoints issue; fail on full table scans"""
+    import tempfile
+    from app import create_app
+    from services.query_plans import audit_query_plans
+
+    with tempfile.TemporaryDirectory() as directory:
+        class AuditConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, 'audit.db')}"
+            INDEXING_ENABLED = False
+            BATCH_ENABLED = False
+            VECTOR_SEARCH_PRELOAD = False
+            QUERY_BUDGET_ENFORCED = True
+
+        audit_app = create_app(AuditConfig)
+        with audit_app.app_context():
+            results = audit_query_plans(
+                audit_app, report=click.echo, users=users,
+                conversations_per_user=conversations_per_user,
+                messages_per_conversation=messages_per_conversation
+            )
+            db.engine.dispose()
+
+    failed = [result for result in results if result['violations'] or result['status'] >= 400]
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} requests failed the query plan audit")
+    click.echo(f"All {len(results)} requests use indexed plans.")
+
+cache_cli = AppGroup('cache', help='Manage the chat response and embedding caches.')
+
+@cache_cli.command('prune')
+def prune_response_cache():
+    """Delete expired entries from the response_cache and embedding_cache tables"""
+    from services.response_cache import get_response_cache
+    from services.embedding_cache import EmbeddingCache
+
+    deleted = get_response_cache().prune()
+    click.echo(f"Deleted {deleted} expired response cache entries.")
+    deleted = EmbeddingCache(Config.EMBEDDING_MODEL).prune()
+    click.echo(f"Deleted {deleted} expired embedding cache entries.")
+
+def register_commands(app: Flask):
+    """Attach the backend's CLI command groups to the app"""
+    app.cli.add_command(embeddings_cli)
+    app.cli.add_command(perf_cli)
+    app.cli.add_command(cache_cli)
@@ -20,16 +20,109 @@ class Config:
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = False  # Set to timedelta for production
+
+    # Firebase ID token verification: with a project id, tokens are checked (RS256) against
+    # Google's JWKS, cached and refreshed in the background after AUTH_JWKS_TTL seconds (or
+    # the endpoint's max-age); without one they are only decoded, for development
+    FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', '')
+    AUTH_JWKS_URL = os.getenv('AUTH_JWKS_URL', 'https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com')
+    AUTH_JWKS_TTL = float(os.getenv('AUTH_JWKS_TTL', 3600))
+    # Verified tokens and their users kept in-process: entries, and seconds each stays
+    # (never past the token's own expiry)
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+    AUTH_TOKEN_CACHE_TTL = float(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
     
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5001').split(',')
     
+    # Conversation list: largest page size, and how far `include_total` counts before estimating
+    CONVERSATIONS_MAX_PER_PAGE = int(os.getenv('CONVERSATIONS_MAX_PER_PAGE', 100))
+    CONVERSATIONS_COUNT_LIMIT = int(os.getenv('CONVERSATIONS_COUNT_LIMIT', 1000))
+    
+    # Fail requests that exceed their @query_budget (always on in debug mode)
+    QUERY_BUDGET_ENFORCED = os.getenv('QUERY_BUDGET_ENFORCED', 'false').lower() == 'true'
+    
     # AI API Keys (user-specific, stored in database)
     # These are defaults for testing
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
     ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')
     GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', '')
     
+    # Per-process cache of users' (decrypted) API keys: users kept, the longest an entry lives
+    # (seconds), and how often api_key_versions is polled for changes made by other workers
+    API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 10000))
+    API_KEY_CACHE_TTL = float(os.getenv('API_KEY_CACHE_TTL', 300))
+    API_KEY_CACHE_POLL_INTERVAL = float(os.getenv('API_KEY_CACHE_POLL_INTERVAL', 1.0))
+    
+    # Chat context: most prompt tokens sent per turn, tokens left free for the reply, and an
+    # optional rolling summary that stands in for messages that no longer fit
+    CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', 32000))
+    CONTEXT_RESPONSE_RESERVE = int(os.getenv('CONTEXT_RESPONSE_RESERVE', 4096))
+    CONTEXT_SUMMARY_ENABLED = os.getenv('CONTEXT_SUMMARY_ENABLED', 'false').lower() == 'true'
+    CONTEXT_SUMMARY_MIN_MESSAGES = int(os.getenv('CONTEXT_SUMMARY_MIN_MESSAGES', 10))
+    CONTEXT_SUMMARY_MAX_MESSAGES = int(os.getenv('CONTEXT_SUMMARY_MAX_MESSAGES', 200))
+    
+    # Provider SDK clients: cached per (platform, key), sharing one connection pool per platform
+    PROVIDER_CLIENT_CACHE_SIZE = int(os.getenv('PROVIDER_CLIENT_CACHE_SIZE', 256))
+    PROVIDER_CLIENT_IDLE_TIMEOUT = float(os.getenv('PROVIDER_CLIENT_IDLE_TIMEOUT', 600))  # Seconds
+    PROVIDER_MAX_CONNECTIONS = int(os.getenv('PROVIDER_MAX_CONNECTIONS', 100))
+    PROVIDER_MAX_KEEPALIVE = int(os.getenv('PROVIDER_MAX_KEEPALIVE', 20))
+    PROVIDER_REQUEST_TIMEOUT = float(os.getenv('PROVIDER_REQUEST_TIMEOUT', 120))  # Seconds
+    
+    # Provider gateway: request rate per (API key, model) with a burst allowance and the longest
+    # wait for a slot (seconds), retries with jittered backoff, and the per-platform circuit
+    # breaker (consecutive failures to open it, seconds before a probe call)
+    PROVIDER_RATE_LIMIT_RPM = float(os.getenv('PROVIDER_RATE_LIMIT_RPM', 120))
+    PROVIDER_RATE_LIMIT_BURST = float(os.getenv('PROVIDER_RATE_LIMIT_BURST', 20))
+    PROVIDER_RATE_LIMIT_MAX_WAIT = float(os.getenv('PROVIDER_RATE_LIMIT_MAX_WAIT', 30))
+    PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', 3))
+    PROVIDER_BACKOFF_BASE = float(os.getenv('PROVIDER_BACKOFF_BASE', 0.5))
+    PROVIDER_BACKOFF_MAX = float(os.getenv('PROVIDER_BACKOFF_MAX', 20))
+    PROVIDER_BREAKER_THRESHOLD = int(os.getenv('PROVIDER_BREAKER_THRESHOLD', 5))
+    PROVIDER_BREAKER_RESET = float(os.getenv('PROVIDER_BREAKER_RESET', 30))
+    
+    # Async chat (/api/chat/jobs): provider calls run on an event loop instead of holding a
+    # request worker; per-provider concurrency, call timeout (seconds) and a cap on queued calls
+    ASYNC_PROVIDER_CONCURRENCY = int(os.getenv('ASYNC_PROVIDER_CONCURRENCY', 100))
+    ASYNC_OPENAI_CONCURRENCY = int(os.getenv('ASYNC_OPENAI_CONCURRENCY', ASYNC_PROVIDER_CONCURRENCY))
+    ASYNC_ANTHROPIC_CONCURRENCY = int(os.getenv('ASYNC_ANTHROPIC_CONCURRENCY', ASYNC_PROVIDER_CONCURRENCY))
+    ASYNC_GOOGLE_CONCURRENCY = int(os.getenv('ASYNC_GOOGLE_CONCURRENCY', ASYNC_PROVIDER_CONCURRENCY))
+    ASYNC_PROVIDER_TIMEOUT = float(os.getenv('ASYNC_PROVIDER_TIMEOUT', 120))
+    ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', 5000))
+    # Seconds after which a still-pending job is reported failed (its worker restarted mid-call)
+    ASYNC_JOB_EXPIRY = float(os.getenv('ASYNC_JOB_EXPIRY', 600))
+    # Most (platform, model) targets one /api/chat/fanout request may send to
+    FANOUT_MAX_TARGETS = int(os.getenv('FANOUT_MAX_TARGETS', 8))
+    
+    # Opt-in ("cache": true) exact-match reply cache: in-process LRU entries, and how long
+    # replies stay valid (seconds) in both tiers; the response_cache table tier can be disabled
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 86400))
+    RESPONSE_CACHE_PERSIST = os.getenv('RESPONSE_CACHE_PERSIST', 'true').lower() == 'true'
+    
+    # Batch prompt jobs (/api/batch), off unless enabled: worker threads per process, items running
+    # at once per platform, largest batch, idle poll interval and lease (seconds; keep it longer
+    # than the slowest provider call, or the result is discarded and the item retried), and
+    # attempts per item
+    BATCH_ENABLED = os.getenv('BATCH_ENABLED', 'false').lower() == 'true'
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 8))
+    BATCH_PROVIDER_CONCURRENCY = int(os.getenv('BATCH_PROVIDER_CONCURRENCY', 4))
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 1000))
+    BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', 2))
+    BATCH_LEASE_TIMEOUT = float(os.getenv('BATCH_LEASE_TIMEOUT', 600))
+    BATCH_MAX_ATTEMPTS = int(os.getenv('BATCH_MAX_ATTEMPTS', 3))
+    
+    # Deterministic stand-in provider (platform 'local') for tests and dry runs: replies echo the
+    # prompt, model 'fail' raises, and each call sleeps LOCAL_PROVIDER_LATENCY seconds
+    LOCAL_PROVIDER_ENABLED = os.getenv('LOCAL_PROVIDER_ENABLED', 'false').lower() == 'true'
+    LOCAL_PROVIDER_LATENCY = float(os.getenv('LOCAL_PROVIDER_LATENCY', 0))
+    
+    # Provider model lists: fresh for TTL, served stale (refreshing in the background) until
+    # STALE_TTL, and failed lookups remembered for NEGATIVE_TTL (all in seconds)
+    MODEL_CATALOG_TTL = float(os.getenv('MODEL_CATALOG_TTL', 3600))
+    MODEL_CATALOG_STALE_TTL = float(os.getenv('MODEL_CATALOG_STALE_TTL', 86400))
+    MODEL_CATALOG_NEGATIVE_TTL = float(os.getenv('MODEL_CATALOG_NEGATIVE_TTL', 60))
+    
     # Vector Search
     PINECONE_API_KEY = os.getenv('PINECONE_API_KEY', '')
     PINECONE_ENVIRONMENT = os.getenv('PINECONE_ENVIRONMENT', '')
@@ -38,9 +131,45 @@ class Config:
     QDRANT_URL = os.getenv('QDRANT_URL', 'http://localhost:6333')
     QDRANT_API_KEY = os.getenv('QDRANT_API_KEY', '')
     
-    # Vector Search Provider (pinecone or qdrant)
+    # Vector Search Provider (pinecone, qdrant or local)
     VECTOR_SEARCH_PROVIDER = os.getenv('VECTOR_SEARCH_PROVIDER', 'qdrant')
     
     # Embedding Model
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+    # Load the embedding model when the app starts instead of on the first search
+    VECTOR_SEARCH_PRELOAD = os.getenv('VECTOR_SEARCH_PRELOAD', 'false').lower() == 'true'
+    # Seconds before a failed embedding model load is tried again
+    EMBEDDING_MODEL_RETRY_INTERVAL = float(os.getenv('EMBEDDING_MODEL_RETRY_INTERVAL', 60))
+    # Embedding cache: in-process LRU size, whether to share vectors through the database, and
+    # how long (seconds) a table row lives before `flask cache prune` removes it
+    EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 10000))
+    EMBEDDING_CACHE_PERSIST = os.getenv('EMBEDDING_CACHE_PERSIST', 'true').lower() == 'true'
+    EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', 7 * 86400))
+    # Number of users whose embedding matrices the in-memory fallback keeps warm
+    VECTOR_MEMORY_MAX_USERS = int(os.getenv('VECTOR_MEMORY_MAX_USERS', 256))
+    # Keep in-memory vectors as 'int8' or 'binary' codes and rescore the top candidates in float32;
+    # unset, the rescore pool depends on the mode (200 for int8, 2000 for binary, whose codes rank worse)
+    VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'none')
+    VECTOR_RESCORE_CANDIDATES = int(os.getenv('VECTOR_RESCORE_CANDIDATES', 0)) or None
+    # Local approximate-nearest-neighbour (IVF) shards for large histories
+    LOCAL_ANN_ENABLED = os.getenv('LOCAL_ANN_ENABLED', 'true').lower() == 'true'
+    LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'vector_index'))
+    LOCAL_ANN_MIN_ROWS = int(os.getenv('LOCAL_ANN_MIN_ROWS', 20000))
+    LOCAL_ANN_NPROBE = int(os.getenv('LOCAL_ANN_NPROBE', 32))
+    # Background indexing of new chat messages
+    INDEXING_ENABLED = os.getenv('INDEXING_ENABLED', 'true').lower() == 'true'
+    INDEXING_QUEUE_SIZE = int(os.getenv('INDEXING_QUEUE_SIZE', 10000))
+    INDEXING_BATCH_SIZE = int(os.getenv('INDEXING_BATCH_SIZE', 64))
+    INDEXING_MAX_WAIT = float(os.getenv('INDEXING_MAX_WAIT', 0.5))  # Seconds to wait for a batch to fill
+    # Native full-text index (SQLite FTS5 / PostgreSQL tsvector); ILIKE is used when disabled
+    FULL_TEXT_SEARCH_ENABLED = os.getenv('FULL_TEXT_SEARCH_ENABLED', 'true').lower() == 'true'
+    
+    # Hybrid search: reciprocal rank fusion weights for the BM25 and vector stages
+    HYBRID_LEXICAL_WEIGHT = float(os.getenv('HYBRID_LEXICAL_WEIGHT', 1.0))
+    HYBRID_SEMANTIC_WEIGHT = float(os.getenv('HYBRID_SEMANTIC_WEIGHT', 1.0))
+    HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', 60))
+    HYBRID_MAX_LIMIT = int(os.getenv('HYBRID_MAX_LIMIT', 100))
+    # Per-process BM25 fallback, used only without a full-text index; rebuilt after MAX_AGE seconds
+    LEXICAL_INDEX_MAX_USERS = int(os.getenv('LEXICAL_INDEX_MAX_USERS', 128))
+    LEXICAL_INDEX_MAX_AGE = float(os.getenv('LEXICAL_INDEX_MAX_AGE', 300))
 
@@ -31,6 +31,16 @@ class APIKey(db.Model):
     
     __table_args__ = (db.UniqueConstraint('user_id', 'platform', name='unique_user_platform'),)
 
+class APIKeyVersion(db.Model):
+    __tablename__ = 'api_key_versions'
+    
+    # Bumped with every change to a user's api_keys, so each process's key cache can tell it's stale
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (db.Index('ix_api_key_versions_updated_at', 'updated_at'),)
+
 class Folder(db.Model):
     __tablename__ = 'folders'
     
@@ -45,6 +55,11 @@ class Folder(db.Model):
     # Relationships
     conversations = db.relationship('Conversation', backref='folder', lazy=True)
     children = db.relationship('Folder', backref=db.backref('parent', remote_side=[id]), lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_folders_user_id', 'user_id'),
+        db.Index('ix_folders_parent_id', 'parent_id'),
+    )
 
 class Tag(db.Model):
     __tablename__ = 'tags'
@@ -74,11 +89,21 @@ class Conversation(db.Model):
     # Relationships
     messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan', order_by='Message.created_at')
     tags = db.relationship('Tag', secondary='conversation_tags', lazy='subquery', backref=db.backref('conversations', lazy=True))
+    
+    # Serve the newest-first conversation list (and its filters) with a keyset cursor
+    __table_args__ = (
+        db.Index('ix_conversations_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_conversations_user_platform', 'user_id', 'platform', 'updated_at', 'id'),
+        db.Index('ix_conversations_user_model', 'user_id', 'model', 'updated_at', 'id'),
+        db.Index('ix_conversations_folder_id', 'folder_id'),
+    )
 
 # Association table for many-to-many relationship
 conversation_tags = db.Table('conversation_tags',
     db.Column('conversation_id', db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    # The primary key covers lookups by conversation; this covers filtering by tag
+    db.Index('ix_conversation_tags_tag_id', 'tag_id', 'conversation_id')
 )
 
 class Message(db.Model):
@@ -91,9 +116,142 @@ class Message(db.Model):
     tokens = db.Column(db.Integer)
     cost = db.Column(db.Numeric(10, 6))  # Cost in USD
     message_metadata = db.Column(JSON)  # Additional metadata (model version, etc.) - renamed from 'metadata' (reserved)
-    # Embedding: Use JSON for both SQLite and PostgreSQL (compatible with both)
-    embedding = db.Column(JSON)  # Vector embedding for search (stored as JSON array)
+    # Legacy JSON embedding; new vectors live in MessageEmbedding (see `flask embeddings migrate-json`)
+    embedding = db.Column(JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Loads a conversation's messages in order; also backs the conversation_id foreign key
+    __table_args__ = (db.Index('ix_messages_conversation_created', 'conversation_id', 'created_at', 'id'),)
+
+class MessageEmbedding(db.Model):
+    __tablename__ = 'message_embeddings'
+    
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    model = db.Column(db.String(255), nullable=False)  # Embedding model that produced the vector
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # Packed little-endian float32, read with np.frombuffer
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    message = db.relationship('Message', backref=db.backref('embedding_row', uselist=False, cascade='all, delete-orphan'))
+
+class MessageTokenCount(db.Model):
+    __tablename__ = 'message_token_counts'
+    
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True)
+    tokenizer = db.Column(db.String(50), nullable=False)  # Counts from another tokenizer are recomputed
+    tokens = db.Column(db.Integer, nullable=False)
+
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summaries'
+    
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), primary_key=True)
+    content = db.Column(db.Text, nullable=False)
+    through_message_id = db.Column(db.Integer, nullable=False)  # Last message folded into the summary
+    tokens = db.Column(db.Integer, nullable=False)
+    model = db.Column(db.String(100))  # Model that wrote the summary
+    # Provider usage of every summary call so far (also counted in the conversation's totals)
+    total_tokens = db.Column(db.Integer, default=0)
+    total_cost = db.Column(db.Numeric(10, 6), default=0)  # Cost in USD
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChatJob(db.Model):
+    __tablename__ = 'chat_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4, handed to the client for polling
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False)
+    user_message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
+    assistant_message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='SET NULL'))
+    fanout_id = db.Column(db.String(36), db.ForeignKey('fanouts.id', ondelete='CASCADE'))  # Set for /fanout targets
+    platform = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_chat_jobs_fanout_id', 'fanout_id'),)
+
+class Fanout(db.Model):
+    __tablename__ = 'fanouts'
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    jobs = db.relationship('ChatJob', backref='fanout', lazy=True, order_by='ChatJob.conversation_id')  # Target order
+
+class BatchJob(db.Model):
+    __tablename__ = 'batch_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(255))
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id', ondelete='SET NULL'))  # Where result conversations go
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    items = db.relationship('BatchJobItem', backref='batch', lazy=True, cascade='all, delete-orphan', order_by='BatchJobItem.position')
+    
+    __table_args__ = (db.Index('ix_batch_jobs_user_created', 'user_id', 'created_at'),)
+
+class BatchJobItem(db.Model):
+    __tablename__ = 'batch_job_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(36), db.ForeignKey('batch_jobs.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # Order in the submitted list
+    platform = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed, cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime)  # Not claimed before this (set when a provider asks us to back off)
+    claimed_at = db.Column(db.DateTime)  # Lease start; stale running items are reclaimed after a restart
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='SET NULL'))
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='SET NULL'))  # The assistant reply
+    error = db.Column(db.Text)
+    completed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_batch_job_items_batch_position', 'batch_id', 'position'),
+        db.Index('ix_batch_job_items_status_id', 'status', 'id'),
+    )
+
+class EmbeddingCacheEntry(db.Model):
+    __tablename__ = 'embedding_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the embedded text
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # Packed float32, same format as MessageEmbedding
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)  # NULL only for rows written before expiry existed; pruned like expired ones
+    
+    __table_args__ = (
+        db.UniqueConstraint('model', 'content_hash', name='unique_model_content_hash'),
+        db.Index('ix_embedding_cache_expires_at', 'expires_at'),
+    )
+
+class ResponseCacheEntry(db.Model):
+    __tablename__ = 'response_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False, unique=True)  # sha256 of user, platform, model, messages, parameters
+    # Replies are only served back to the user whose call produced them; NULL on rows from before that
+    user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'))
+    platform = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    tokens = db.Column(db.Integer)  # Usage of the original (billed) call
+    cost = db.Column(db.Numeric(10, 6))
+    response_metadata = db.Column(db.Text)  # JSON metadata of the original call
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (db.Index('ix_response_cache_expires_at', 'expires_at'),)
 
 class SearchIndex(db.Model):
     __tablename__ = 'search_index'
@@ -102,5 +260,97 @@ class SearchIndex(db.Model):
     user_id = db.Column(db.String(128), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
     vector_id = db.Column(db.String(255))  # ID in vector database (Pinecone/Qdrant)
+    provider = db.Column(db.String(50))  # pinecone, qdrant or local
+    model = db.Column(db.String(255))  # Embedding model used for the vector
+    indexed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_search_index_user_id', 'user_id'),
+        # One progress row per message (a unique index, so upgrade_schema() can add it to old tables)
+        db.Index('uq_search_index_message_id', 'message_id', unique=True),
+    )
+
+def add_missing_columns():
+    """ALTER TABLE ... ADD COLUMN for model columns that tables created by an older version lack
+
+    create_all() never alters existing tables. Columns added to an existing
+    model must be nullable (or have a server_default) so old rows stay valid;
+    other missing columns are reported and skipped.
+    """
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    print(f"Warning: Cannot add NOT NULL column {table.name}.{column.name} to existing rows; add it by hand")
+                    continue
+                ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+                      f"{column.type.compile(dialect=db.engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                for foreign_key in column.foreign_keys:
+                    target = foreign_key.column
+                    ddl += f" REFERENCES {preparer.format_table(target.table)} ({preparer.format_column(target)})"
+                    if foreign_key.ondelete:
+                        ddl += f" ON DELETE {foreign_key.ondelete}"
+                connection.execute(db.text(ddl))
+                print(f"Added column {table.name}.{column.name}")
+
+def create_missing_indexes():
+    """Create indexes declared on models that create_all() skipped because their table already existed"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def upgrade_schema():
+    """Bring tables created by an older version up to the current models (idempotent; runs at startup)"""
+    add_missing_columns()
+    
+    # search_index.message_id became unique; older tables may hold several rows per message
+    if 'uq_search_index_message_id' not in {index['name'] for index in db.inspect(db.engine).get_indexes('search_index')}:
+        with db.engine.begin() as connection:
+            connection.execute(db.text(
+                "DELETE FROM search_index WHERE id NOT IN "
+                "(SELECT MAX(id) FROM search_index GROUP BY message_id)"
+            ))
+    
+    # Keyset pagination orders by (updated_at, id); rows written without the ORM default have no updated_at
+    with db.engine.begin() as connection:
+        connection.execute(db.text(
+            "UPDATE conversations SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) "
+            "WHERE updated_at IS NULL"
+        ))
+    
+    create_missing_indexes()
+
+def insert_ignore(table, rows, session=None):
+    """Insert rows, skipping any that violate a unique constraint
 
+    Runs in its own transaction unless a session is given, in which case it
+    joins that session's transaction (needed when the session already holds
+    SQLite's write lock).
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).on_conflict_do_nothing()
+    else:
+        statement = table.insert().prefix_with('IGNORE')
+    if session is not None:
+        session.execute(statement, rows)
+        return
+    with db.engine.begin() as connection:
+        connection.execute(statement, rows)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from routes.auth import require_auth
 from models import db, APIKey
+from services.api_key_cache import get_api_key_cache
 from datetime import datetime
 
 api_keys_bp = Blueprint('api_keys', __name__)
@@ -46,7 +47,10 @@ def create_api_key(user):
         )
         db.session.add(existing)
     
+    cache = get_api_key_cache()
+    cache.bump_version(user.id)
     db.session.commit()
+    cache.invalidate(user.id)
     
     return jsonify({
         'id': existing.id,
@@ -64,7 +68,10 @@ def delete_api_key(user, key_id):
     ).first_or_404()
     
     db.session.delete(key)
+    cache = get_api_key_cache()
+    cache.bump_version(user.id)
     db.session.commit()
+    cache.invalidate(user.id)
     
     return jsonify({'message': 'API key deleted'})
 
@@ -79,7 +86,10 @@ def toggle_api_key(user, key_id):
     
     key.is_active = not key.is_active
     key.updated_at = datetime.utcnow()
+    cache = get_api_key_cache()
+    cache.bump_version(user.id)
     db.session.commit()
+    cache.invalidate(user.id)
     
     return jsonify({
         'id': key.id,
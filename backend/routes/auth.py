@@ -1,13 +1,65 @@
 from flask import Blueprint, request, jsonify
 from functools import wraps
+from datetime import datetime
+import time
 import jwt
-from models import db, User
+from models import db, User, insert_ignore
+from services.auth_cache import decode_token, get_token_cache, get_user_cache, token_key
 from config import Config
 
 auth_bp = Blueprint('auth', __name__)
 
+def _identity_from_token(token):
+    """Identity claims ({'id', 'email', 'name'}) and seconds they may be cached, or (None, 0)"""
+    # Handle mock tokens for development
+    if token.startswith('mock_token_'):
+        # Extract user ID from mock token (format: mock_token_1234567890)
+        # For simplicity, use a consistent user ID for mock tokens
+        identity = {'id': 'demo_user_123', 'email': 'demo@example.com', 'name': 'Demo User'}
+        return identity, Config.AUTH_TOKEN_CACHE_TTL
+    
+    # Decode as JWT (for real Firebase tokens), verifying it when FIREBASE_PROJECT_ID is set
+    try:
+        decoded = decode_token(token)
+    except jwt.InvalidTokenError:
+        # Not a valid JWT, might be a different token format
+        return None, 0
+    if not decoded:
+        return None, 0
+    
+    user_id = decoded.get('user_id') or decoded.get('sub')
+    if not user_id:
+        return None, 0
+    
+    ttl = Config.AUTH_TOKEN_CACHE_TTL
+    if decoded.get('exp'):
+        ttl = min(ttl, decoded['exp'] - time.time())
+    identity = {'id': user_id, 'email': decoded.get('email', ''), 'name': decoded.get('name', '')}
+    return identity, ttl
+
+def _user_for_identity(identity):
+    """The user row for an identity, created on first sight; None if it can't be created"""
+    user = db.session.get(User, identity['id'])
+    if user is None:
+        # Concurrent first requests for a new user all insert; only one row results
+        now = datetime.utcnow()
+        insert_ignore(User.__table__, [{
+            'id': identity['id'],
+            'email': identity['email'],
+            'name': identity['name'],
+            'created_at': now,
+            'updated_at': now
+        }])
+        user = db.session.get(User, identity['id'])
+    return user
+
 def get_user_from_token():
-    """Extract user from Firebase JWT token or mock token"""
+    """Extract user from Firebase JWT token or mock token
+    
+    Tokens are verified and users loaded once per AUTH_TOKEN_CACHE_TTL; in
+    between, a request's authentication is two in-memory lookups and the
+    cached user is attached to the session without a query.
+    """
     token = request.headers.get('Authorization')
     if not token:
         return None
@@ -17,48 +69,28 @@ def get_user_from_token():
         if token.startswith('Bearer '):
             token = token[7:]
         
-        # Handle mock tokens for development
-        if token.startswith('mock_token_'):
-            # Extract user ID from mock token (format: mock_token_1234567890)
-            # For simplicity, use a consistent user ID for mock tokens
-            user_id = 'demo_user_123'
-            
-            # Get or create demo user
-            user = User.query.get(user_id)
-            if not user:
-                user = User(
-                    id=user_id,
-                    email='demo@example.com',
-                    name='Demo User'
-                )
-                db.session.add(user)
-                db.session.commit()
-            
-            return user
-        
-        # Try to decode as JWT (for real Firebase tokens)
-        try:
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            user_id = decoded.get('user_id') or decoded.get('sub')
-            
-            if not user_id:
+        key = token_key(token)
+        token_cache = get_token_cache()
+        identity = token_cache.get(key)
+        if identity is None:
+            identity, ttl = _identity_from_token(token)
+            if identity is None:
                 return None
-            
-            # Get or create user
-            user = User.query.get(user_id)
-            if not user:
-                user = User(
-                    id=user_id,
-                    email=decoded.get('email', ''),
-                    name=decoded.get('name', '')
-                )
-                db.session.add(user)
-                db.session.commit()
-            
-            return user
-        except jwt.DecodeError:
-            # Not a valid JWT, might be a different token format
+            token_cache.put(key, identity, ttl)
+        
+        user_cache = get_user_cache()
+        cached = user_cache.get(identity['id'])
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+        
+        user = _user_for_identity(identity)
+        if user is None:
+            # e.g. the email already belongs to another account
+            token_cache.pop(key)
             return None
+        db.session.expunge(user)
+        user_cache.put(user.id, user, Config.AUTH_TOKEN_CACHE_TTL)
+        return db.session.merge(user, load=False)
         
     except Exception as e:
         print(f"Auth error: {e}")
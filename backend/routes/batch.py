@@ -0,0 +1,172 @@
+from flask import Blueprint, request, jsonify
+from routes.auth import require_auth
+from models import db, BatchJob, BatchJobItem, Message
+from services.ai_service import LOCAL_PLATFORM
+from services.batch_runner import get_batch_runner
+from services.api_key_cache import get_api_key_cache
+from config import Config
+from sqlalchemy import func, insert
+import uuid
+
+batch_bp = Blueprint('batch', __name__)
+
+PLATFORMS = ('openai', 'anthropic', 'google')
+
+def _status_counts(batch_ids):
+    """{batch_id: {status: count}} in one query"""
+    counts = {batch_id: {} for batch_id in batch_ids}
+    rows = db.session.query(BatchJobItem.batch_id, BatchJobItem.status, func.count(BatchJobItem.id)).filter(
+        BatchJobItem.batch_id.in_(batch_ids)
+    ).group_by(BatchJobItem.batch_id, BatchJobItem.status).all()
+    for batch_id, status, count in rows:
+        counts[batch_id][status] = count
+    return counts
+
+def _batch_status(counts):
+    if counts.get('pending') or counts.get('running'):
+        started = counts.get('running') or counts.get('completed') or counts.get('failed')
+        return 'running' if started else 'queued'
+    if counts.get('completed'):
+        return 'completed'
+    if counts.get('failed'):
+        return 'failed'
+    return 'cancelled'
+
+def _batch_payload(batch, counts):
+    return {
+        'id': batch.id,
+        'name': batch.name,
+        'folder_id': batch.folder_id,
+        'status': _batch_status(counts),
+        'total': sum(counts.values()),
+        'counts': counts,
+        'created_at': batch.created_at.isoformat()
+    }
+
+@batch_bp.route('', methods=['POST'])
+@require_auth
+def create_batch(user):
+    """Queue prompts to run in the background
+
+    Body: items (prompt strings, or {prompt, platform, model} objects),
+    platform and model (defaults for items that don't set them), optional
+    name and folder_id. Each finished item becomes a conversation.
+    """
+    data = request.json or {}
+    entries = data.get('items') or []
+
+    if not entries:
+        return jsonify({'error': 'items are required'}), 400
+    if not isinstance(entries, list):
+        return jsonify({'error': 'items must be a list'}), 400
+    if len(entries) > Config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {Config.BATCH_MAX_ITEMS} items per batch'}), 400
+
+    allowed = PLATFORMS + ((LOCAL_PLATFORM,) if Config.LOCAL_PROVIDER_ENABLED else ())
+    items = []
+    for position, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {'prompt': entry}
+        if not isinstance(entry, dict):
+            return jsonify({'error': f'Item {position} must be a prompt or an object'}), 400
+        item = {
+            'position': position,
+            'prompt': entry.get('prompt'),
+            'platform': entry.get('platform') or data.get('platform'),
+            'model': entry.get('model') or data.get('model')
+        }
+        if not all(isinstance(item[field], str) and item[field] for field in ('prompt', 'platform', 'model')):
+            return jsonify({'error': f'Item {position} needs a prompt, platform and model (strings)'}), 400
+        if item['platform'] not in allowed:
+            return jsonify({'error': f"Unsupported platform: {item['platform']}"}), 400
+        items.append(item)
+
+    platforms = {item['platform'] for item in items} - {LOCAL_PLATFORM}
+    missing = sorted(platforms - set(get_api_key_cache().keys(user.id))) if platforms else []
+    if missing:
+        return jsonify({'error': f"API key not configured for {', '.join(missing)}"}), 400
+
+    runner = get_batch_runner()
+    if runner is None:
+        return jsonify({'error': 'Batch jobs are disabled'}), 503
+
+    batch = BatchJob(id=str(uuid.uuid4()), user_id=user.id, name=data.get('name'), folder_id=data.get('folder_id'))
+    db.session.add(batch)
+    db.session.flush()
+    db.session.execute(insert(BatchJobItem), [dict(item, batch_id=batch.id, status='pending', attempts=0) for item in items])
+    db.session.commit()
+
+    runner.wake()
+
+    return jsonify(_batch_payload(batch, {'pending': len(items)})), 202
+
+@batch_bp.route('', methods=['GET'])
+@require_auth
+def list_batches(user):
+    """The user's most recent batches with item counts by status"""
+    batches = BatchJob.query.filter_by(user_id=user.id).order_by(BatchJob.created_at.desc()).limit(50).all()
+    counts = _status_counts([batch.id for batch in batches]) if batches else {}
+    return jsonify([_batch_payload(batch, counts[batch.id]) for batch in batches])
+
+@batch_bp.route('/<batch_id>', methods=['GET'])
+@require_auth
+def get_batch(user, batch_id):
+    """A batch with every item's status and, for finished items, the reply (optionally ?status=...)"""
+    batch = BatchJob.query.filter_by(id=batch_id, user_id=user.id).first_or_404()
+
+    query = db.session.query(BatchJobItem, Message.content).outerjoin(
+        Message, Message.id == BatchJobItem.message_id
+    ).filter(BatchJobItem.batch_id == batch.id)
+    if request.args.get('status'):
+        query = query.filter(BatchJobItem.status == request.args['status'])
+    rows = query.order_by(BatchJobItem.position).all()
+
+    payload = _batch_payload(batch, _status_counts([batch.id])[batch.id])
+    payload['items'] = [{
+        'id': item.id,
+        'position': item.position,
+        'platform': item.platform,
+        'model': item.model,
+        'prompt': item.prompt,
+        'status': item.status,
+        'attempts': item.attempts,
+        'error': item.error,
+        'conversation_id': item.conversation_id,
+        'message_id': item.message_id,
+        'result': content,
+        'completed_at': item.completed_at.isoformat() if item.completed_at else None
+    } for item, content in rows]
+    return jsonify(payload)
+
+@batch_bp.route('/<batch_id>/cancel', methods=['POST'])
+@require_auth
+def cancel_batch(user, batch_id):
+    """Cancel items that haven't started (running items finish normally)"""
+    batch = BatchJob.query.filter_by(id=batch_id, user_id=user.id).first_or_404()
+    cancelled = BatchJobItem.query.filter_by(batch_id=batch.id, status='pending').update(
+        {'status': 'cancelled'}, synchronize_session=False
+    )
+    db.session.commit()
+    return jsonify({'cancelled': cancelled})
+
+@batch_bp.route('/<batch_id>/retry', methods=['POST'])
+@require_auth
+def retry_batch(user, batch_id):
+    """Queue the batch's failed (and cancelled) items again"""
+    batch = BatchJob.query.filter_by(id=batch_id, user_id=user.id).first_or_404()
+    requeued = BatchJobItem.query.filter(
+        BatchJobItem.batch_id == batch.id,
+        BatchJobItem.status.in_(['failed', 'cancelled'])
+    ).update({
+        'status': 'pending',
+        'attempts': 0,
+        'error': None,
+        'available_at': None,
+        'completed_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+
+    runner = get_batch_runner()
+    if requeued and runner is not None:
+        runner.wake()
+    return jsonify({'requeued': requeued})
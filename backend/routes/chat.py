@@ -1,18 +1,33 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from routes.auth import require_auth, get_user_from_token
-from models import db, Conversation, Message, APIKey
+from models import db, Conversation, Message, ChatJob, Fanout
+from sqlalchemy import func
 from services.ai_service import AIService
-from datetime import datetime
+from services.async_executor import get_async_executor, ExecutorSaturated
+from services.provider_gateway import get_provider_gateway, GatewayError, RateLimitedError
+from services.indexing_pipeline import enqueue_for_indexing
+from services.context_builder import build_context, maybe_refresh_summary
+from services.response_cache import get_response_cache, cache_key
+from services.api_key_cache import get_api_key_cache
+from services.model_catalog import get_model_catalog
+from config import Config
+from datetime import datetime, timedelta
+from decimal import Decimal
 import json
+import math
+import queue
+import time
+import uuid
 
 chat_bp = Blueprint('chat', __name__)
 
-@chat_bp.route('/send', methods=['POST'])
-@require_auth
-def send_message(user):
-    """Send a message to an AI model and get response"""
-    data = request.json
-    
+def _start_turn(user, data):
+    """Validate a send request, then save the user's message
+
+    Returns ((conversation, user_message, api_key, context), None), or
+    (None, error_response) when the request can't be sent. `context` is
+    build_context()'s result; its 'messages' go to the provider.
+    """
     conversation_id = data.get('conversation_id')
     platform = data.get('platform')  # openai, anthropic, google
     model = data.get('model')
@@ -20,17 +35,13 @@ def send_message(user):
     folder_id = data.get('folder_id')
     
     if not all([platform, model, message]):
-        return jsonify({'error': 'platform, model, and message are required'}), 400
+        return None, (jsonify({'error': 'platform, model, and message are required'}), 400)
     
     # Get user's API key for the platform
-    api_key_record = APIKey.query.filter_by(
-        user_id=user.id,
-        platform=platform,
-        is_active=True
-    ).first()
+    api_key = get_api_key_cache().get(user.id, platform)
     
-    if not api_key_record:
-        return jsonify({'error': f'API key not configured for {platform}'}), 400
+    if not api_key:
+        return None, (jsonify({'error': f'API key not configured for {platform}'}), 400)
     
     # Get or create conversation
     if conversation_id:
@@ -39,7 +50,7 @@ def send_message(user):
             user_id=user.id
         ).first()
         if not conversation:
-            return jsonify({'error': 'Conversation not found'}), 404
+            return None, (jsonify({'error': 'Conversation not found'}), 404)
     else:
         conversation = Conversation(
             user_id=user.id,
@@ -60,70 +71,542 @@ def send_message(user):
     db.session.add(user_message)
     db.session.flush()
     
-    # Get conversation history for context
-    previous_messages = Message.query.filter_by(
-        conversation_id=conversation.id
-    ).order_by(Message.created_at.asc()).all()
+    # The most recent history that fits the model's token budget
+    context = build_context(conversation.id, model)
     
-    # Prepare messages for AI API
-    messages_for_ai = [
-        {'role': msg.role, 'content': msg.content}
-        for msg in previous_messages
-    ]
+    return (conversation, user_message, api_key, context), None
+
+def _save_assistant_message(conversation, response_data):
+    """Add the assistant reply and roll its usage into the conversation totals (caller commits)"""
+    assistant_message = Message(
+        conversation_id=conversation.id,
+        role='assistant',
+        content=response_data['content'],
+        tokens=response_data.get('tokens'),
+        cost=response_data.get('cost'),
+        message_metadata=json.dumps(response_data.get('metadata', {}))
+    )
+    db.session.add(assistant_message)
+    
+    # Update conversation stats in SQL, so replies saved concurrently for one conversation all count
+    conversation.total_tokens = func.coalesce(Conversation.total_tokens, 0) + (response_data.get('tokens', 0) or 0)
+    # Numeric columns hold Decimal, which won't add to the float costs providers report
+    conversation.total_cost = func.coalesce(Conversation.total_cost, 0) + Decimal(str(response_data.get('cost', 0) or 0))
+    conversation.updated_at = datetime.utcnow()
+    return assistant_message
+
+def _failed_metadata(error):
+    """message_metadata of a user turn whose reply failed; build_context leaves such turns out"""
+    return json.dumps({
+        'status': 'failed',
+        'error': str(error),
+        'failed_at': datetime.utcnow().isoformat()
+    })
+
+def _mark_failed(message_id, error):
+    """Record on an already committed user turn that its reply failed (instead of rolling the turn back)"""
+    db.session.rollback()
+    Message.query.filter_by(id=message_id).update({'message_metadata': _failed_metadata(error)}, synchronize_session=False)
+    db.session.commit()
+
+def _message_payload(message):
+    return {
+        'id': message.id,
+        'role': message.role,
+        'content': message.content,
+        'tokens': message.tokens,
+        'created_at': message.created_at.isoformat()
+    }
+
+def _cached_response(cached, key):
+    """A response cache hit in send_message's shape: nothing billed, and where the reply came from"""
+    return {
+        'content': cached['content'],
+        'tokens': 0,
+        'cost': 0,
+        'metadata': dict(cached['metadata'], cache={
+            'hit': True,
+            'tier': cached['tier'],
+            'key': key,
+            'cached_at': cached['cached_at'].isoformat(),
+            'original_tokens': cached['tokens'],
+            'original_cost': cached['cost'],
+            'marginal_cost': 0
+        })
+    }
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/send', methods=['POST'])
+@require_auth
+def send_message(user):
+    """Send a message to an AI model and get response
+
+    The user's turn is committed before the provider is called, so no
+    transaction (or SQLite write lock) stays open while the model answers;
+    the reply and the conversation totals are saved in a second short
+    transaction. If the call fails, the user's turn is kept and marked
+    failed.
+
+    With "cache": true, an identical earlier request (same platform, model
+    and context) is answered from the response cache without calling the
+    provider; the reply's metadata records the hit.
+    """
+    turn, error = _start_turn(user, request.json)
+    if error:
+        return error
+    conversation, user_message, api_key, context = turn
+    platform = request.json.get('platform')
+    model = request.json.get('model')
+    use_cache = bool(request.json.get('cache'))
+    
+    cached = None
+    if use_cache:
+        key = cache_key(user.id, platform, model, context['messages'])
+        cached = get_response_cache().lookup(key, user.id)
+    
+    # Phase one: commit the user's turn; the session hands its connection back to the pool
+    conversation.updated_at = datetime.utcnow()
+    conversation_id, user_message_id = conversation.id, user_message.id
+    db.session.commit()
     
     # Call AI service
     ai_service = AIService()
     try:
-        response_data = ai_service.send_message(
-            platform=platform,
-            model=model,
-            api_key=api_key_record.api_key,
-            messages=messages_for_ai
-        )
+        if cached:
+            response_data = _cached_response(cached, key)
+        else:
+            response_data = ai_service.send_message(
+                platform=platform,
+                model=model,
+                api_key=api_key,
+                messages=context['messages']
+            )
+    except GatewayError as e:
+        # Refused before reaching the provider (rate limit or open circuit): tell the client when to retry
+        _mark_failed(user_message_id, e)
+        status = 429 if isinstance(e, RateLimitedError) else 503
+        return jsonify({
+            'error': str(e),
+            'conversation_id': conversation_id,
+            'user_message_id': user_message_id
+        }), status, {'Retry-After': str(math.ceil(e.retry_after))}
+    except Exception as e:
+        return _send_failed(e, conversation_id, user_message_id)
+    
+    # Phase two: one short transaction for the reply, the totals and the cache entry
+    try:
+        if use_cache and not cached:
+            get_response_cache().store(key, user.id, platform, model, response_data)
+            response_data['metadata'] = dict(response_data.get('metadata', {}), cache={'hit': False, 'key': key})
         
         # Save assistant response
-        assistant_message = Message(
-            conversation_id=conversation.id,
-            role='assistant',
-            content=response_data['content'],
-            tokens=response_data.get('tokens'),
-            cost=response_data.get('cost'),
-            message_metadata=json.dumps(response_data.get('metadata', {}))
-        )
-        db.session.add(assistant_message)
-        
-        # Update conversation stats
-        conversation.total_tokens = (conversation.total_tokens or 0) + (response_data.get('tokens', 0) or 0)
-        conversation.total_cost = (conversation.total_cost or 0) + (response_data.get('cost', 0) or 0)
-        conversation.updated_at = datetime.utcnow()
+        assistant_message = _save_assistant_message(conversation, response_data)
         
         db.session.commit()
+    except Exception as e:
+        return _send_failed(e, conversation_id, user_message_id)
+    
+    # Embed both turns in the background so search picks them up
+    enqueue_for_indexing([user_message, assistant_message], user.id)
+    maybe_refresh_summary(current_app._get_current_object(), conversation_id, platform, model, api_key, context)
+    
+    return jsonify({
+        'conversation_id': conversation_id,
+        'message': _message_payload(assistant_message),
+        'cached': cached is not None
+    })
+
+def _send_failed(e, conversation_id, user_message_id):
+    import traceback
+    error_trace = traceback.format_exc()
+    print(f"Error in send_message: {str(e)}")
+    print(error_trace)
+    _mark_failed(user_message_id, e)
+    return jsonify({
+        'error': str(e),
+        'conversation_id': conversation_id,
+        'user_message_id': user_message_id,
+        'details': error_trace if current_app.debug else None
+    }), 500
+
+@chat_bp.route('/stream', methods=['POST'])
+@require_auth
+def stream_message(user):
+    """Send a message and stream the reply as Server-Sent Events
+
+    Events: 'start' (conversation and user message ids), 'delta' (text
+    chunks), then 'done' (the saved assistant message) or 'error'.
+    """
+    turn, error = _start_turn(user, request.json)
+    if error:
+        return error
+    conversation, user_message, api_key, context = turn
+    platform = request.json.get('platform')
+    model = request.json.get('model')
+    app = current_app._get_current_object()
+    
+    # Commit the user's turn up front so it survives a failed or abandoned stream
+    conversation.updated_at = datetime.utcnow()
+    user_message_id = user_message.id
+    db.session.commit()
+    
+    def generate():
+        upstream = None
+        parts = []
+        finished = False
+        try:
+            yield _sse('start', {'conversation_id': conversation.id, 'user_message_id': user_message.id})
+            upstream = AIService().stream_message(
+                platform=platform,
+                model=model,
+                api_key=api_key,
+                messages=context['messages']
+            )
+            for event in upstream:
+                if event['type'] == 'delta':
+                    parts.append(event['content'])
+                    yield _sse('delta', {'content': event['content']})
+                    continue
+                
+                assistant_message = _save_assistant_message(conversation, event)
+                db.session.commit()
+                finished = True
+                break
+        except GeneratorExit:
+            # Client disconnected: keep what was generated so far
+            if parts and not finished:
+                assistant_message = _save_assistant_message(conversation, {
+                    'content': ''.join(parts),
+                    'metadata': {'model': model, 'finish_reason': 'client_disconnected', 'partial': True}
+                })
+                db.session.commit()
+                enqueue_for_indexing([user_message, assistant_message], user.id)
+            raise
+        except Exception as e:
+            print(f"Error in stream_message: {str(e)}")
+            _mark_failed(user_message_id, e)
+            payload = {'error': str(e)}
+            if isinstance(e, GatewayError):
+                payload['retry_after'] = math.ceil(e.retry_after)
+            yield _sse('error', payload)
+        finally:
+            # Stops the upstream request if we're leaving before it finished
+            if upstream is not None:
+                upstream.close()
+        if not finished:
+            return
         
-        return jsonify({
+        # The turn is saved; nothing past this point may report it as failed
+        enqueue_for_indexing([user_message, assistant_message], user.id)
+        maybe_refresh_summary(app, conversation.id, platform, model, api_key, context)
+        yield _sse('done', {
             'conversation_id': conversation.id,
-            'message': {
-                'id': assistant_message.id,
-                'role': assistant_message.role,
-                'content': assistant_message.content,
-                'tokens': assistant_message.tokens,
-                'created_at': assistant_message.created_at.isoformat()
-            }
+            'message': _message_payload(assistant_message)
         })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _job_payload(job, assistant_message=None):
+    payload = {
+        'job_id': job.id,
+        'status': job.status,
+        'conversation_id': job.conversation_id,
+        'user_message_id': job.user_message_id,
+        'platform': job.platform,
+        'model': job.model,
+        'created_at': job.created_at.isoformat(),
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    }
+    if assistant_message is not None:
+        payload['message'] = _message_payload(assistant_message)
+    if job.error:
+        payload['error'] = job.error
+    return payload
+
+def _complete_job(app, job_id, api_key, context, response_data):
+    """Executor callback: save the reply and mark the job completed"""
+    with app.app_context():
+        job = db.session.get(ChatJob, job_id)
+        conversation = db.session.get(Conversation, job.conversation_id) if job else None
+        if conversation is None:
+            return None  # Deleted while the provider was answering
         
-    except Exception as e:
-        db.session.rollback()
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in send_message: {str(e)}")
-        print(error_trace)
-        return jsonify({'error': str(e), 'details': error_trace if current_app.debug else None}), 500
+        assistant_message = _save_assistant_message(conversation, response_data)
+        db.session.flush()
+        job.assistant_message_id = assistant_message.id
+        job.status = 'completed'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        
+        user_message = db.session.get(Message, job.user_message_id)
+        enqueue_for_indexing([user_message, assistant_message], job.user_id)
+        maybe_refresh_summary(app, conversation.id, job.platform, job.model, api_key, context)
+        return _job_payload(job, assistant_message)
+
+def _fail_job(app, job_id, error):
+    """Executor callback: record why the provider call failed"""
+    print(f"Error in chat job {job_id}: {str(error)}")
+    with app.app_context():
+        job = db.session.get(ChatJob, job_id)
+        if job is None:
+            return None
+        job.status = 'failed'
+        job.error = str(error)
+        job.completed_at = datetime.utcnow()
+        Message.query.filter_by(id=job.user_message_id).update({
+            'message_metadata': _failed_metadata(error)
+        }, synchronize_session=False)
+        db.session.commit()
+        return _job_payload(job)
+
+def _submit_job(app, job, api_key, context, notify=None, reserved=False):
+    """Hand a committed job's provider call to the async executor
+
+    notify, if given, is called with the finished job's payload (or None if
+    its conversation was deleted meanwhile). Raises ExecutorSaturated unless
+    the executor slot was `reserved` beforehand.
+    """
+    job_id, platform, model = job.id, job.platform, job.model
+    messages = context['messages']
+    
+    def on_result(response_data):
+        try:
+            payload = _complete_job(app, job_id, api_key, context, response_data)
+        except Exception as e:
+            payload = _fail_job(app, job_id, e)
+        if notify:
+            notify(payload)
+    
+    def on_error(error):
+        payload = _fail_job(app, job_id, error)
+        if notify:
+            notify(payload)
+    
+    get_async_executor().submit(
+        platform,
+        lambda: AIService().send_message_async(platform=platform, model=model, api_key=api_key, messages=messages),
+        on_result=on_result,
+        on_error=on_error,
+        reserved=reserved
+    )
+
+@chat_bp.route('/jobs', methods=['POST'])
+@require_auth
+def submit_message(user):
+    """Send a message without waiting for the reply
+
+    Saves the user's turn and answers 202 with a job id straight away. The
+    provider call runs on the async executor, so it holds no request worker
+    while the model responds; poll GET /jobs/<job_id> for the reply.
+    """
+    # Take the executor slot before saving anything, so a 503 leaves no orphaned user turn
+    executor = get_async_executor()
+    try:
+        executor.reserve()
+    except ExecutorSaturated:
+        return jsonify({'error': 'Too many chats in progress, please retry shortly'}), 503, {'Retry-After': '5'}
+    
+    submitted = False
+    try:
+        turn, error = _start_turn(user, request.json)
+        if error:
+            return error
+        conversation, user_message, api_key, context = turn
+        app = current_app._get_current_object()
+        
+        job = ChatJob(
+            id=str(uuid.uuid4()),
+            user_id=user.id,
+            conversation_id=conversation.id,
+            user_message_id=user_message.id,
+            platform=request.json.get('platform'),
+            model=request.json.get('model')
+        )
+        db.session.add(job)
+        conversation.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        _submit_job(app, job, api_key, context, reserved=True)
+        submitted = True
+    finally:
+        if not submitted:
+            executor.release()
+    
+    return jsonify(_job_payload(job)), 202, {'Location': f"{request.script_root}/api/chat/jobs/{job.id}"}
+
+@chat_bp.route('/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_job(user, job_id):
+    """Status of a message sent through POST /jobs, with the reply once it's saved"""
+    job = ChatJob.query.filter_by(id=job_id, user_id=user.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status == 'pending' and job.created_at < datetime.utcnow() - timedelta(seconds=Config.ASYNC_JOB_EXPIRY):
+        # The process running it exited before the call finished
+        job.status = 'failed'
+        job.error = 'Job expired before the provider responded'
+        job.completed_at = datetime.utcnow()
+        Message.query.filter_by(id=job.user_message_id).update({
+            'message_metadata': _failed_metadata(job.error)
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    if job.status == 'pending':
+        return jsonify(_job_payload(job)), 200, {'Retry-After': '1'}
+    
+    assistant_message = db.session.get(Message, job.assistant_message_id) if job.assistant_message_id else None
+    return jsonify(_job_payload(job, assistant_message))
+
+@chat_bp.route('/fanout', methods=['POST'])
+@require_auth
+def fanout_message(user):
+    """Send one prompt to several models at once, each answer in its own new conversation
+
+    Body: message, targets ([{platform, model}, ...]), optional folder_id
+    and stream. All calls run concurrently on the async executor, so the
+    request takes as long as the slowest model rather than the sum. The
+    conversations stay linked through the fanout id (GET /fanout/<id>).
+    With stream, results arrive as Server-Sent Events in completion order:
+    'start' (the jobs), one 'result' per target, then 'done'.
+    """
+    data = request.json or {}
+    message = data.get('message')
+    targets = data.get('targets') or []
+    folder_id = data.get('folder_id')
+    
+    if not message or not targets:
+        return jsonify({'error': 'message and targets are required'}), 400
+    if len(targets) > Config.FANOUT_MAX_TARGETS:
+        return jsonify({'error': f'At most {Config.FANOUT_MAX_TARGETS} targets per request'}), 400
+    if not all(isinstance(target, dict) and target.get('platform') and target.get('model') for target in targets):
+        return jsonify({'error': 'Each target needs a platform and a model'}), 400
+    
+    platforms = {target['platform'] for target in targets}
+    api_keys = get_api_key_cache().keys(user.id)
+    missing = sorted(platforms - set(api_keys))
+    if missing:
+        return jsonify({'error': f"API key not configured for {', '.join(missing)}"}), 400
+    
+    fanout = Fanout(id=str(uuid.uuid4()), user_id=user.id, prompt=message)
+    conversations = [Conversation(
+        user_id=user.id,
+        platform=target['platform'],
+        model=target['model'],
+        folder_id=folder_id,
+        title=message[:100]
+    ) for target in targets]
+    db.session.add(fanout)
+    db.session.add_all(conversations)
+    db.session.flush()
+    
+    user_messages = [Message(conversation_id=conversation.id, role='user', content=message) for conversation in conversations]
+    db.session.add_all(user_messages)
+    db.session.flush()
+    
+    jobs = [ChatJob(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        conversation_id=conversation.id,
+        user_message_id=user_message.id,
+        fanout_id=fanout.id,
+        platform=conversation.platform,
+        model=conversation.model
+    ) for conversation, user_message in zip(conversations, user_messages)]
+    db.session.add_all(jobs)
+    db.session.commit()
+    
+    app = current_app._get_current_object()
+    started = time.monotonic()
+    fanout_id = fanout.id
+    pending = [_job_payload(job) for job in jobs]
+    order = {payload['job_id']: index for index, payload in enumerate(pending)}
+    # Fresh conversations: the prompt is the whole context
+    context = {'messages': [{'role': 'user', 'content': message}], 'truncated': False}
+    
+    results = queue.Queue()
+    for job in jobs:
+        try:
+            _submit_job(app, job, api_keys[job.platform], context, notify=results.put)
+        except ExecutorSaturated as e:
+            results.put(_fail_job(app, job.id, e))
+    
+    def finished():
+        """Job payloads in completion order; stops early if a callback never arrives"""
+        for _ in jobs:
+            try:
+                payload = results.get(timeout=Config.ASYNC_JOB_EXPIRY)
+            except queue.Empty:
+                return
+            if payload is not None:
+                payload['index'] = order[payload['job_id']]
+                yield payload
+    
+    if data.get('stream'):
+        def generate():
+            yield _sse('start', {'fanout_id': fanout_id, 'jobs': pending})
+            for payload in finished():
+                yield _sse('result', payload)
+            yield _sse('done', {'fanout_id': fanout_id, 'elapsed_ms': int((time.monotonic() - started) * 1000)})
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    by_index = {index: dict(payload, index=index) for index, payload in enumerate(pending)}
+    for payload in finished():
+        by_index[payload['index']] = payload
+    
+    return jsonify({
+        'fanout_id': fanout_id,
+        'results': [by_index[index] for index in range(len(pending))],
+        'elapsed_ms': int((time.monotonic() - started) * 1000)
+    })
+
+@chat_bp.route('/fanout/<fanout_id>', methods=['GET'])
+@require_auth
+def get_fanout(user, fanout_id):
+    """The conversations a fan-out created, with each model's answer so far"""
+    fanout = Fanout.query.filter_by(id=fanout_id, user_id=user.id).first()
+    if not fanout:
+        return jsonify({'error': 'Fan-out not found'}), 404
+    
+    jobs = fanout.jobs
+    message_ids = [job.assistant_message_id for job in jobs if job.assistant_message_id]
+    messages = {message.id: message for message in Message.query.filter(Message.id.in_(message_ids))} if message_ids else {}
+    
+    return jsonify({
+        'fanout_id': fanout.id,
+        'prompt': fanout.prompt,
+        'created_at': fanout.created_at.isoformat(),
+        'results': [
+            dict(_job_payload(job, messages.get(job.assistant_message_id)), index=index)
+            for index, job in enumerate(jobs)
+        ]
+    })
+
+@chat_bp.route('/gateway', methods=['GET'])
+@require_auth
+def gateway_stats(user):
+    """Provider gateway counters and circuit breaker state per platform, plus async executor and API key cache load"""
+    return jsonify({
+        'gateway': get_provider_gateway().stats(),
+        'executor': get_async_executor().stats(),
+        'api_keys': get_api_key_cache().stats()
+    })
 
 @chat_bp.route('/models', methods=['GET'])
 @require_auth
 def get_available_models(user):
     """Get available models for each platform"""
-    from services.ai_service import AIService
-    
     # Get Google models dynamically if API key is available
     # Start with gemini-pro as it's the most widely supported
     google_models = [
@@ -136,21 +619,14 @@ def get_available_models(user):
     ]
     
     # Try to get actual available models from Google API
-    api_key_record = APIKey.query.filter_by(
-        user_id=user.id,
-        platform='google',
-        is_active=True
-    ).first()
+    google_api_key = get_api_key_cache().get(user.id, 'google')
     
-    if api_key_record:
-        try:
-            ai_service = AIService()
-            available_models = ai_service._list_google_models(api_key_record.api_key)
-            if available_models:
-                # Replace with actual available models
-                google_models = [{'id': m, 'name': m.replace('gemini-', 'Gemini ').title()} for m in available_models]
-        except Exception as e:
-            print(f"Could not fetch Google models: {e}")
+    if google_api_key:
+        # Cached per key; [] while listing fails, so the defaults above stand
+        available_models = get_model_catalog().get('google', google_api_key, AIService().fetch_google_models)
+        if available_models:
+            # Replace with actual available models
+            google_models = [{'id': m, 'name': m.replace('gemini-', 'Gemini ').title()} for m in available_models]
     
     return jsonify({
         'openai': [
@@ -1,72 +1,91 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, abort
 from routes.auth import require_auth
 from models import db, Conversation, Message, Tag
-from sqlalchemy import or_, func
+from config import Config
+from services.vector_search import discard_message_vectors
+from services.full_text import matching_message_ids
+from services.pagination import keyset_page, capped_count, InvalidCursor
+from services.serializers import CONVERSATION_COLUMNS, load_conversation_rows, serialize_conversation, serialize_conversations
+from services.query_audit import query_budget
+from sqlalchemy import or_
 from datetime import datetime
 
 conversations_bp = Blueprint('conversations', __name__)
 
 @conversations_bp.route('', methods=['GET'])
 @require_auth
+@query_budget(3)
 def get_conversations(user):
     """Get all conversations for the user"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor')
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), Config.CONVERSATIONS_MAX_PER_PAGE)
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
     folder_id = request.args.get('folder_id', type=int)
     tag_id = request.args.get('tag_id', type=int)
     platform = request.args.get('platform')
     model = request.args.get('model')
     search = request.args.get('search')
     
-    query = Conversation.query.filter_by(user_id=user.id)
+    query = db.session.query(*CONVERSATION_COLUMNS).filter(Conversation.user_id == user.id)
     
     # Filters
     if folder_id:
-        query = query.filter_by(folder_id=folder_id)
+        query = query.filter(Conversation.folder_id == folder_id)
     
     if tag_id:
         query = query.join(Conversation.tags).filter(Tag.id == tag_id)
     
     if platform:
-        query = query.filter_by(platform=platform)
+        query = query.filter(Conversation.platform == platform)
     
     if model:
-        query = query.filter_by(model=model)
+        query = query.filter(Conversation.model == model)
     
     if search:
-        query = query.join(Message).filter(
+        # Message matches come from the full-text index; a subquery (not a join) keeps one row per conversation
+        matching_conversations = db.select(Message.conversation_id).where(
+            Message.id.in_(matching_message_ids(search))
+        )
+        query = query.filter(
             or_(
                 Conversation.title.ilike(f'%{search}%'),
-                Message.content.ilike(f'%{search}%')
+                Conversation.id.in_(matching_conversations)
             )
         )
     
-    # Get total count
-    total = query.count()
+    try:
+        conversations, next_cursor = keyset_page(
+            query, Conversation.updated_at, Conversation.id, cursor, per_page,
+            fallback_column=Conversation.created_at
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    response = {
+        'conversations': serialize_conversations(conversations),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'per_page': per_page
+    }
     
-    # Paginate
-    conversations = query.order_by(Conversation.updated_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Counting is opt-in and capped so it can't dominate the cost of a page
+    if include_total:
+        response['total'], response['total_exact'] = capped_count(
+            query, Conversation.id, Config.CONVERSATIONS_COUNT_LIMIT
+        )
     
-    return jsonify({
-        'conversations': [conv.to_dict() for conv in conversations.items],
-        'total': total,
-        'page': page,
-        'per_page': per_page,
-        'pages': conversations.pages
-    })
+    return jsonify(response)
 
 @conversations_bp.route('/<int:conversation_id>', methods=['GET'])
 @require_auth
+@query_budget(3)
 def get_conversation(user, conversation_id):
     """Get a specific conversation with messages"""
-    conversation = Conversation.query.filter_by(
-        id=conversation_id,
-        user_id=user.id
-    ).first_or_404()
+    rows = load_conversation_rows(user.id, [conversation_id])
+    if not rows:
+        abort(404)
     
-    return jsonify(conversation.to_dict(include_messages=True))
+    return jsonify(serialize_conversation(rows[0], include_messages=True))
 
 @conversations_bp.route('/<int:conversation_id>', methods=['PUT'])
 @require_auth
@@ -94,7 +113,7 @@ def update_conversation(user, conversation_id):
     conversation.updated_at = datetime.utcnow()
     db.session.commit()
     
-    return jsonify(conversation.to_dict())
+    return jsonify(serialize_conversation(conversation))
 
 @conversations_bp.route('/<int:conversation_id>', methods=['DELETE'])
 @require_auth
@@ -105,58 +124,24 @@ def delete_conversation(user, conversation_id):
         user_id=user.id
     ).first_or_404()
     
+    message_ids = [row.id for row in db.session.query(Message.id).filter_by(conversation_id=conversation.id)]
+    
     db.session.delete(conversation)
     db.session.commit()
     
+    discard_message_vectors(user.id, message_ids)
+    
     return jsonify({'message': 'Conversation deleted'})
 
 @conversations_bp.route('/compare', methods=['POST'])
 @require_auth
+@query_budget(3)
 def compare_conversations(user):
     """Compare multiple conversations side by side"""
     conversation_ids = request.json.get('conversation_ids', [])
     
-    conversations = Conversation.query.filter(
-        Conversation.id.in_(conversation_ids),
-        Conversation.user_id == user.id
-    ).all()
+    conversations = load_conversation_rows(user.id, conversation_ids)
     
     return jsonify({
-        'conversations': [conv.to_dict(include_messages=True) for conv in conversations]
+        'conversations': serialize_conversations(conversations, include_messages=True)
     })
-
-# Add to_dict method to Conversation model
-def conversation_to_dict(self, include_messages=False):
-    """Convert conversation to dictionary"""
-    data = {
-        'id': self.id,
-        'title': self.title,
-        'platform': self.platform,
-        'model': self.model,
-        'folder_id': self.folder_id,
-        'total_tokens': self.total_tokens,
-        'total_cost': float(self.total_cost) if self.total_cost else 0,
-        'tags': [{'id': tag.id, 'name': tag.name, 'color': tag.color} for tag in self.tags],
-        'created_at': self.created_at.isoformat(),
-        'updated_at': self.updated_at.isoformat()
-    }
-    
-    if include_messages:
-        data['messages'] = [
-            {
-                'id': msg.id,
-                'role': msg.role,
-                'content': msg.content,
-                'tokens': msg.tokens,
-                'cost': float(msg.cost) if msg.cost else 0,
-                'created_at': msg.created_at.isoformat()
-            }
-            for msg in self.messages
-        ]
-    
-    return data
-
-# Attach method to Conversation model
-Conversation.to_dict = conversation_to_dict
-
-
@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, abort
 from routes.auth import require_auth
-from models import Conversation, Message
+from services.serializers import load_conversation_rows, load_messages, serialize_conversation, serialize_conversations
+from services.query_audit import query_budget
 import json
 import csv
 import io
@@ -9,24 +10,27 @@ export_bp = Blueprint('export', __name__)
 
 @export_bp.route('/conversation/<int:conversation_id>', methods=['GET'])
 @require_auth
+@query_budget(3)
 def export_conversation(user, conversation_id):
     """Export a conversation in various formats"""
     format_type = request.args.get('format', 'json')  # json, csv, markdown
     
-    conversation = Conversation.query.filter_by(
-        id=conversation_id,
-        user_id=user.id
-    ).first_or_404()
+    rows = load_conversation_rows(user.id, [conversation_id])
+    if not rows:
+        abort(404)
+    conversation = rows[0]
     
     if format_type == 'json':
-        return jsonify(conversation.to_dict(include_messages=True))
+        return jsonify(serialize_conversation(conversation, include_messages=True))
     
-    elif format_type == 'csv':
+    messages = load_messages([conversation.id]).get(conversation.id, [])
+    
+    if format_type == 'csv':
         output = io.StringIO()
         writer = csv.writer(output)
         writer.writerow(['Role', 'Content', 'Tokens', 'Created At'])
         
-        for message in conversation.messages:
+        for message in messages:
             writer.writerow([
                 message.role,
                 message.content,
@@ -47,7 +51,7 @@ def export_conversation(user, conversation_id):
         md += f"**Created:** {conversation.created_at.isoformat()}  \n\n"
         md += "---\n\n"
         
-        for message in conversation.messages:
+        for message in messages:
             role_emoji = "👤" if message.role == "user" else "🤖"
             md += f"## {role_emoji} {message.role.capitalize()}\n\n"
             md += f"{message.content}\n\n"
@@ -64,28 +68,27 @@ def export_conversation(user, conversation_id):
 
 @export_bp.route('/bulk', methods=['POST'])
 @require_auth
+@query_budget(3)
 def export_bulk(user):
     """Export multiple conversations"""
     data = request.json
     conversation_ids = data.get('conversation_ids', [])
     format_type = data.get('format', 'json')
     
-    conversations = Conversation.query.filter(
-        Conversation.id.in_(conversation_ids),
-        Conversation.user_id == user.id
-    ).all()
+    conversations = load_conversation_rows(user.id, conversation_ids)
     
     if format_type == 'json':
         return jsonify({
-            'conversations': [conv.to_dict(include_messages=True) for conv in conversations]
+            'conversations': serialize_conversations(conversations, include_messages=True)
         })
     
     elif format_type == 'markdown':
+        messages = load_messages([conv.id for conv in conversations])
         md = "# Exported Conversations\n\n"
         for conv in conversations:
             md += f"## {conv.title or f'Conversation {conv.id}'}\n\n"
             md += f"**Platform:** {conv.platform} | **Model:** {conv.model}  \n\n"
-            for msg in conv.messages:
+            for msg in messages.get(conv.id, []):
                 role_emoji = "👤" if msg.role == "user" else "🤖"
                 md += f"### {role_emoji} {msg.role.capitalize()}\n\n{msg.content}\n\n"
             md += "---\n\n"
@@ -1,7 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from routes.auth import require_auth
 from models import db, Message, Conversation
-from services.vector_search import VectorSearchService
+from config import Config
+from services.vector_search import get_vector_search_service
+from services.indexing_pipeline import get_indexing_pipeline
+from services.hybrid_search import hybrid_search
+from services.full_text import full_text_backend, full_text_search
 
 search_bp = Blueprint('search', __name__)
 
@@ -16,43 +20,105 @@ def semantic_search(user):
     if not query:
         return jsonify({'error': 'Query is required'}), 400
     
-    vector_service = VectorSearchService()
+    vector_service = get_vector_search_service()
     
     try:
         results = vector_service.search(user.id, query, limit)
-        
-        # Get full conversation context for each result
-        message_ids = [r['message_id'] for r in results]
-        messages = Message.query.filter(Message.id.in_(message_ids)).all()
-        
-        # Group by conversation
-        conversation_ids = set(msg.conversation_id for msg in messages)
-        conversations = Conversation.query.filter(
-            Conversation.id.in_(conversation_ids),
-            Conversation.user_id == user.id
-        ).all()
-        
-        conv_dict = {conv.id: conv for conv in conversations}
-        
-        search_results = []
-        for result in results:
-            msg = next((m for m in messages if m.id == result['message_id']), None)
-            if msg and msg.conversation_id in conv_dict:
-                search_results.append({
-                    'message_id': msg.id,
-                    'conversation_id': msg.conversation_id,
-                    'conversation_title': conv_dict[msg.conversation_id].title,
-                    'content': msg.content[:200] + '...' if len(msg.content) > 200 else msg.content,
-                    'role': msg.role,
-                    'score': result.get('score', 0),
-                    'created_at': msg.created_at.isoformat()
-                })
-        
-        return jsonify({'results': search_results})
+        return jsonify({'results': _hydrate_results(user, results)})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/hybrid', methods=['POST'])
+@require_auth
+def hybrid(user):
+    """Lexical (BM25) + semantic search merged with reciprocal rank fusion"""
+    data = request.json or {}
+    query = data.get('query')
+    limit = data.get('limit', 10)
+    weights = data.get('weights') or {}
+    
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 0 < limit <= Config.HYBRID_MAX_LIMIT:
+        return jsonify({'error': f'limit must be an integer from 1 to {Config.HYBRID_MAX_LIMIT}'}), 400
+    
+    if not isinstance(weights, dict):
+        return jsonify({'error': 'weights must be an object'}), 400
+    try:
+        weights = {
+            'lexical': float(weights.get('lexical', Config.HYBRID_LEXICAL_WEIGHT)),
+            'semantic': float(weights.get('semantic', Config.HYBRID_SEMANTIC_WEIGHT))
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'weights must be numbers'}), 400
+    if not all(0 <= weight < float('inf') for weight in weights.values()):
+        return jsonify({'error': 'weights must be finite and non-negative'}), 400
+    
+    rrf_k = data.get('rrf_k', Config.HYBRID_RRF_K)
+    if isinstance(rrf_k, bool) or not isinstance(rrf_k, (int, float)) or not 0 < rrf_k < float('inf'):
+        return jsonify({'error': 'rrf_k must be a positive number'}), 400
+    
+    outcome = hybrid_search(
+        current_app._get_current_object(),
+        user.id,
+        query,
+        limit,
+        weights,
+        rrf_k=rrf_k
+    )
+    
+    return jsonify({
+        'results': _hydrate_results(user, outcome['results']),
+        'weights': weights,
+        'timings': outcome['timings'],
+        'errors': outcome['errors']
+    })
+
+def _hydrate_results(user, results):
+    """Attach message and conversation details to ranked {'message_id', 'score'} results"""
+    message_ids = [r['message_id'] for r in results]
+    messages = Message.query.filter(Message.id.in_(message_ids)).all()
+    
+    # Group by conversation
+    conversation_ids = set(msg.conversation_id for msg in messages)
+    conversations = Conversation.query.filter(
+        Conversation.id.in_(conversation_ids),
+        Conversation.user_id == user.id
+    ).all()
+    
+    conv_dict = {conv.id: conv for conv in conversations}
+    msg_dict = {msg.id: msg for msg in messages}
+    
+    search_results = []
+    for result in results:
+        msg = msg_dict.get(result['message_id'])
+        if msg and msg.conversation_id in conv_dict:
+            item = {
+                'message_id': msg.id,
+                'conversation_id': msg.conversation_id,
+                'conversation_title': conv_dict[msg.conversation_id].title,
+                'content': msg.content[:200] + '...' if len(msg.content) > 200 else msg.content,
+                'role': msg.role,
+                'score': result.get('score', 0),
+                'created_at': msg.created_at.isoformat()
+            }
+            if 'ranks' in result:
+                item['ranks'] = result['ranks']
+                item['stage_scores'] = result['stage_scores']
+            search_results.append(item)
+    
+    return search_results
+
+@search_bp.route('/health', methods=['GET'])
+def search_health():
+    """Readiness of the semantic search service (model + vector store)"""
+    status = get_vector_search_service().health()
+    pipeline = get_indexing_pipeline()
+    status['indexing'] = pipeline.stats() if pipeline else None
+    return jsonify(status), 200 if status['ready'] else 503
+
 @search_bp.route('/text', methods=['GET'])
 @require_auth
 def text_search(user):
@@ -63,7 +129,15 @@ def text_search(user):
     if not query:
         return jsonify({'error': 'Query parameter q is required'}), 400
     
-    # Simple text search
+    if full_text_backend():
+        ranked = full_text_search(user.id, query, limit)
+        snippets = {r['message_id']: r['snippet'] for r in ranked}
+        results = _hydrate_results(user, ranked)
+        for result in results:
+            result['snippet'] = snippets.get(result['message_id'])
+        return jsonify({'results': results})
+    
+    # No native index: fall back to a simple substring scan
     messages = Message.query.join(Conversation).filter(
         Conversation.user_id == user.id,
         Message.content.ilike(f'%{query}%')
@@ -81,5 +155,3 @@ def text_search(user):
         })
     
     return jsonify({'results': results})
-
-
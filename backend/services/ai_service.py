@@ -1,7 +1,15 @@
+import asyncio
+import time
 import openai
-from anthropic import Anthropic
 import google.generativeai as genai
-from typing import List, Dict
+from typing import List, Dict, Iterator
+from services.provider_clients import get_provider_clients
+from services.model_catalog import get_model_catalog
+from services.provider_gateway import get_provider_gateway, GatewayError
+from config import Config
+
+# Stand-in platform for tests and batch dry runs (see LOCAL_PROVIDER_ENABLED)
+LOCAL_PLATFORM = 'local'
 
 class AIService:
     """Service for interacting with different AI platforms"""
@@ -18,6 +26,39 @@ class AIService:
             return self._anthropic_chat(model, api_key, messages)
         elif platform == 'google':
             return self._google_chat(model, api_key, messages)
+        elif platform == LOCAL_PLATFORM and Config.LOCAL_PROVIDER_ENABLED:
+            time.sleep(Config.LOCAL_PROVIDER_LATENCY)
+            return self._local_chat(model, messages)
+        else:
+            raise ValueError(f"Unsupported platform: {platform}")
+    
+    async def send_message_async(self, platform: str, model: str, api_key: str, messages: List[Dict]) -> Dict:
+        """Async send_message for the async executor's event loop (see services/async_executor.py)"""
+        
+        if platform == 'openai':
+            return await self._openai_chat_async(model, api_key, messages)
+        elif platform == 'anthropic':
+            return await self._anthropic_chat_async(model, api_key, messages)
+        elif platform == 'google':
+            return await self._google_chat_async(model, api_key, messages)
+        elif platform == LOCAL_PLATFORM and Config.LOCAL_PROVIDER_ENABLED:
+            await asyncio.sleep(Config.LOCAL_PROVIDER_LATENCY)
+            return self._local_chat(model, messages)
+        else:
+            raise ValueError(f"Unsupported platform: {platform}")
+    
+    def stream_message(self, platform: str, model: str, api_key: str, messages: List[Dict]) -> Iterator[Dict]:
+        """Stream a response as {'type': 'delta', 'content'} events, then one {'type': 'done', ...}
+
+        The 'done' event carries the same fields as send_message. Closing the
+        generator early (client went away) closes the upstream connection.
+        """
+        if platform == 'openai':
+            return self._openai_stream(model, api_key, messages)
+        elif platform == 'anthropic':
+            return self._anthropic_stream(model, api_key, messages)
+        elif platform == 'google':
+            return self._google_stream(model, api_key, messages)
         else:
             raise ValueError(f"Unsupported platform: {platform}")
     
@@ -26,68 +67,147 @@ class AIService:
         if not api_key:
             raise ValueError("OpenAI API key is required")
         
-        client = openai.OpenAI(api_key=api_key)
+        client = get_provider_clients().get('openai', api_key)
         
         try:
-            response = client.chat.completions.create(
+            response = get_provider_gateway().call('openai', api_key, model, lambda: client.chat.completions.create(
                 model=model,
                 messages=messages
-            )
-            
-            if not response.choices or len(response.choices) == 0:
-                raise ValueError("No response from OpenAI")
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from OpenAI")
-            
-            tokens = response.usage.total_tokens if response.usage else 0
-            
-            # Calculate cost (approximate pricing)
-            cost = self._calculate_openai_cost(model, tokens)
-            
-            return {
-                'content': content,
-                'tokens': tokens,
-                'cost': cost,
-                'metadata': {
-                    'model': model,
-                    'finish_reason': response.choices[0].finish_reason
-                }
+            ))
+            return self._openai_result(model, response)
+        except Exception as e:
+            raise self._openai_error(e)
+    
+    async def _openai_chat_async(self, model: str, api_key: str, messages: List[Dict]) -> Dict:
+        """Chat with OpenAI without blocking the event loop"""
+        if not api_key:
+            raise ValueError("OpenAI API key is required")
+        
+        client = get_provider_clients().get('openai', api_key, asynchronous=True)
+        
+        try:
+            response = await get_provider_gateway().call_async('openai', api_key, model, lambda: client.chat.completions.create(
+                model=model,
+                messages=messages
+            ))
+            return self._openai_result(model, response)
+        except Exception as e:
+            raise self._openai_error(e)
+    
+    def _openai_result(self, model: str, response) -> Dict:
+        if not response.choices or len(response.choices) == 0:
+            raise ValueError("No response from OpenAI")
+        
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError("Empty response from OpenAI")
+        
+        tokens = response.usage.total_tokens if response.usage else 0
+        
+        # Calculate cost (approximate pricing)
+        cost = self._calculate_openai_cost(model, tokens)
+        
+        return {
+            'content': content,
+            'tokens': tokens,
+            'cost': cost,
+            'metadata': {
+                'model': model,
+                'finish_reason': response.choices[0].finish_reason
             }
+        }
+    
+    def _openai_error(self, e: Exception) -> ValueError:
+        if isinstance(e, GatewayError):
+            return e
+        elif isinstance(e, openai.AuthenticationError):
+            return ValueError(f"OpenAI authentication failed: {str(e)}. Please check your API key.")
+        elif isinstance(e, openai.RateLimitError):
+            return ValueError(f"OpenAI rate limit exceeded: {str(e)}")
+        elif isinstance(e, openai.APIError):
+            return ValueError(f"OpenAI API error: {str(e)}")
+        return ValueError(f"Error calling OpenAI: {str(e)}")
+    
+    def _openai_stream(self, model: str, api_key: str, messages: List[Dict]) -> Iterator[Dict]:
+        """Stream from OpenAI"""
+        if not api_key:
+            raise ValueError("OpenAI API key is required")
+        
+        client = get_provider_clients().get('openai', api_key)
+        
+        try:
+            stream = get_provider_gateway().call('openai', api_key, model, lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True
+            ))
+        except GatewayError:
+            raise
         except openai.AuthenticationError as e:
             raise ValueError(f"OpenAI authentication failed: {str(e)}. Please check your API key.")
         except openai.RateLimitError as e:
             raise ValueError(f"OpenAI rate limit exceeded: {str(e)}")
         except openai.APIError as e:
             raise ValueError(f"OpenAI API error: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"Error calling OpenAI: {str(e)}")
+        
+        parts = []
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                    yield {'type': 'delta', 'content': choice.delta.content}
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        finally:
+            # Drops the HTTP response so OpenAI stops generating if we stopped reading
+            stream.response.close()
+        
+        content = ''.join(parts)
+        # Streamed chat completions don't report usage; estimate ~4 characters per token
+        tokens = self._estimate_tokens(messages, content)
+        yield {
+            'type': 'done',
+            'content': content,
+            'tokens': tokens,
+            'cost': self._calculate_openai_cost(model, tokens),
+            'metadata': {
+                'model': model,
+                'finish_reason': finish_reason,
+                'tokens_estimated': True
+            }
+        }
     
     def _anthropic_chat(self, model: str, api_key: str, messages: List[Dict]) -> Dict:
         """Chat with Anthropic"""
-        client = Anthropic(api_key=api_key)
-        
-        # Convert messages format (Anthropic uses different format)
-        system_message = None
-        conversation_messages = []
-        
-        for msg in messages:
-            if msg['role'] == 'system':
-                system_message = msg['content']
-            else:
-                conversation_messages.append({
-                    'role': msg['role'],
-                    'content': msg['content']
-                })
+        client = get_provider_clients().get('anthropic', api_key)
+        system_message, conversation_messages = self._anthropic_messages(messages)
         
-        response = client.messages.create(
+        response = get_provider_gateway().call('anthropic', api_key, model, lambda: client.messages.create(
             model=model,
             max_tokens=4096,
             system=system_message,
             messages=conversation_messages
-        )
+        ))
+        return self._anthropic_result(model, response)
+    
+    async def _anthropic_chat_async(self, model: str, api_key: str, messages: List[Dict]) -> Dict:
+        """Chat with Anthropic without blocking the event loop"""
+        client = get_provider_clients().get('anthropic', api_key, asynchronous=True)
+        system_message, conversation_messages = self._anthropic_messages(messages)
         
+        response = await get_provider_gateway().call_async('anthropic', api_key, model, lambda: client.messages.create(
+            model=model,
+            max_tokens=4096,
+            system=system_message,
+            messages=conversation_messages
+        ))
+        return self._anthropic_result(model, response)
+    
+    def _anthropic_result(self, model: str, response) -> Dict:
         content = response.content[0].text
         tokens = response.usage.input_tokens + response.usage.output_tokens
         
@@ -104,116 +224,262 @@ class AIService:
             }
         }
     
-    def _list_google_models(self, api_key: str) -> List[str]:
-        """List available Google Gemini models"""
+    def _anthropic_stream(self, model: str, api_key: str, messages: List[Dict]) -> Iterator[Dict]:
+        """Stream from Anthropic"""
+        client = get_provider_clients().get('anthropic', api_key)
+        system_message, conversation_messages = self._anthropic_messages(messages)
+        
+        manager = client.messages.stream(
+            model=model,
+            max_tokens=4096,
+            system=system_message,
+            messages=conversation_messages
+        )
+        # Entering the manager sends the request; only that part can be retried
+        stream = get_provider_gateway().call('anthropic', api_key, model, manager.__enter__)
         try:
-            genai.configure(api_key=api_key)
-            models = genai.list_models()
-            available_models = []
-            for m in models:
-                if 'generateContent' in m.supported_generation_methods:
-                    # Remove 'models/' prefix if present
-                    model_name = m.name.replace('models/', '')
-                    available_models.append(model_name)
-            return available_models
-        except Exception as e:
-            print(f"Error listing models: {e}")
-            return []
+            for text in stream.text_stream:
+                yield {'type': 'delta', 'content': text}
+            response = stream.get_final_message()
+        finally:
+            # Runs on GeneratorExit too, closing the HTTP stream
+            manager.__exit__(None, None, None)
+        
+        content = ''.join(block.text for block in response.content if getattr(block, 'text', None))
+        tokens = response.usage.input_tokens + response.usage.output_tokens
+        yield {
+            'type': 'done',
+            'content': content,
+            'tokens': tokens,
+            'cost': self._calculate_anthropic_cost(model, tokens),
+            'metadata': {
+                'model': model,
+                'stop_reason': response.stop_reason
+            }
+        }
+    
+    def _anthropic_messages(self, messages: List[Dict]):
+        """Split out the system prompt (Anthropic takes it separately from the turns)"""
+        system_message = None
+        conversation_messages = []
+        
+        for msg in messages:
+            if msg['role'] == 'system':
+                system_message = msg['content']
+            else:
+                conversation_messages.append({
+                    'role': msg['role'],
+                    'content': msg['content']
+                })
+        return system_message, conversation_messages
+    
+    def _list_google_models(self, api_key: str) -> List[str]:
+        """List available Google Gemini models (cached per key; [] if listing fails)"""
+        return get_model_catalog().get('google', api_key, self.fetch_google_models)
+    
+    def fetch_google_models(self, api_key: str) -> List[str]:
+        """Ask Google which models this key can call generateContent on (uncached; see ModelCatalog)"""
+        models = genai.list_models(client=get_provider_clients().get('google', api_key).models)
+        available_models = []
+        for m in models:
+            if 'generateContent' in m.supported_generation_methods:
+                # Remove 'models/' prefix if present
+                model_name = m.name.replace('models/', '')
+                available_models.append(model_name)
+        return available_models
     
     def _google_chat(self, model: str, api_key: str, messages: List[Dict]) -> Dict:
         """Chat with Google Gemini"""
+        messages = self._google_messages(messages)
         try:
-            genai.configure(api_key=api_key)
-            
-            # Map model names to actual working model names
-            # Try to list available models first
-            available_models = self._list_google_models(api_key)
-            
-            actual_model = None
-            
-            if available_models:
-                # Use available models - try to match requested model
-                if model in available_models:
-                    actual_model = model
-                elif 'pro' in model.lower():
-                    pro_models = [m for m in available_models if 'pro' in m.lower()]
-                    actual_model = pro_models[0] if pro_models else available_models[0]
-                elif 'flash' in model.lower():
-                    flash_models = [m for m in available_models if 'flash' in m.lower()]
-                    actual_model = flash_models[0] if flash_models else available_models[0]
-                else:
-                    actual_model = available_models[0]
-            else:
-                # Fallback: use simple model name mapping
-                # Most APIs support 'gemini-pro' as the basic model name
-                model_mapping = {
-                    'gemini-1.5-pro': 'gemini-pro',
-                    'gemini-1.5-pro-latest': 'gemini-pro',
-                    'gemini-1.5-flash': 'gemini-pro',  # Fallback to pro if flash not available
-                    'gemini-1.5-flash-latest': 'gemini-pro',
-                    'gemini-pro': 'gemini-pro',
-                }
-                actual_model = model_mapping.get(model, 'gemini-pro')
-            
-            model_instance = genai.GenerativeModel(actual_model)
-            
-            # Convert messages to Google format
-            # Google Gemini expects alternating user/model messages in history
-            history = []
-            for i in range(len(messages) - 1):
-                msg = messages[i]
-                if msg['role'] == 'user':
-                    history.append({'role': 'user', 'parts': [msg['content']]})
-                elif msg['role'] == 'assistant':
-                    history.append({'role': 'model', 'parts': [msg['content']]})
-            
-            # Start chat with history (if any)
-            if history:
-                chat = model_instance.start_chat(history=history)
-            else:
-                chat = model_instance.start_chat(history=[])
+            actual_model, chat = self._google_start_chat(model, api_key, messages)
             
             # Send the last message
             last_message = messages[-1]['content']
-            response = chat.send_message(last_message)
-            
-            content = response.text
-            tokens = response.usage_metadata.total_token_count if hasattr(response, 'usage_metadata') else 0
-            
-            # Calculate cost
-            cost = self._calculate_google_cost(actual_model, tokens)
-            
-            return {
-                'content': content,
-                'tokens': tokens,
-                'cost': cost,
-                'metadata': {
-                    'model': actual_model
-                }
+            response = get_provider_gateway().call('google', api_key, actual_model, lambda: chat.send_message(last_message))
+            return self._google_result(actual_model, response)
+        except Exception as e:
+            raise self._google_error(model, api_key, e)
+    
+    async def _google_chat_async(self, model: str, api_key: str, messages: List[Dict]) -> Dict:
+        """Chat with Google Gemini without blocking the event loop"""
+        messages = self._google_messages(messages)
+        try:
+            # Listing models is a blocking call; warm the catalog on a thread so the lookup below is a cache hit
+            await asyncio.get_running_loop().run_in_executor(None, self._list_google_models, api_key)
+            actual_model, chat = self._google_start_chat(model, api_key, messages, asynchronous=True)
+            response = await get_provider_gateway().call_async(
+                'google', api_key, actual_model, lambda: chat.send_message_async(messages[-1]['content'])
+            )
+            return self._google_result(actual_model, response)
+        except Exception as e:
+            raise self._google_error(model, api_key, e)
+    
+    def _google_result(self, actual_model: str, response) -> Dict:
+        content = response.text
+        tokens = response.usage_metadata.total_token_count if hasattr(response, 'usage_metadata') else 0
+        
+        # Calculate cost
+        cost = self._calculate_google_cost(actual_model, tokens)
+        
+        return {
+            'content': content,
+            'tokens': tokens,
+            'cost': cost,
+            'metadata': {
+                'model': actual_model
             }
+        }
+    
+    def _google_stream(self, model: str, api_key: str, messages: List[Dict]) -> Iterator[Dict]:
+        """Stream from Google Gemini"""
+        messages = self._google_messages(messages)
+        try:
+            actual_model, chat = self._google_start_chat(model, api_key, messages)
+            response = get_provider_gateway().call(
+                'google', api_key, actual_model, lambda: chat.send_message(messages[-1]['content'], stream=True)
+            )
         except Exception as e:
-            error_msg = str(e)
-            
-            # Try to get available models for better error message
-            try:
-                available_models = self._list_google_models(api_key)
-                available_msg = f"\n\nAvailable models: {', '.join(available_models) if available_models else 'Could not list models. Check API key permissions.'}"
-            except:
-                available_msg = "\n\nCould not retrieve available models. Please check your API key and ensure Generative Language API is enabled."
-            
-            if '404' in error_msg or 'not found' in error_msg.lower():
-                raise ValueError(
-                    f"Gemini model '{model}' not found.{available_msg}\n\n"
-                    f"Please try:\n"
-                    f"1. Use 'gemini-pro' (most widely supported)\n"
-                    f"2. Check your Google Cloud Console - ensure Generative Language API is enabled\n"
-                    f"3. Verify your API key has access to Gemini models\n"
-                    f"4. Original error: {error_msg}"
-                )
-            elif 'API key' in error_msg or 'authentication' in error_msg.lower():
-                raise ValueError(f"Gemini authentication failed: {error_msg}\n\nPlease check:\n1. Your API key is correct\n2. Generative Language API is enabled in Google Cloud Console\n3. Your billing account is active")
+            raise self._google_error(model, api_key, e)
+        
+        parts = []
+        # The SDK exposes no cancel hook; returning stops pulling chunks from the response
+        for chunk in response:
+            text = chunk.text if chunk.parts else ''
+            if text:
+                parts.append(text)
+                yield {'type': 'delta', 'content': text}
+        
+        content = ''.join(parts)
+        usage = getattr(response, 'usage_metadata', None)
+        tokens = usage.total_token_count if usage else self._estimate_tokens(messages, content)
+        yield {
+            'type': 'done',
+            'content': content,
+            'tokens': tokens,
+            'cost': self._calculate_google_cost(actual_model, tokens),
+            'metadata': {
+                'model': actual_model
+            }
+        }
+    
+    def _google_messages(self, messages: List[Dict]) -> List[Dict]:
+        """Fold system messages (such as the context summary) into the first turn; Gemini chats have no system role"""
+        system = [msg['content'] for msg in messages if msg['role'] == 'system']
+        turns = [msg for msg in messages if msg['role'] != 'system']
+        if not system or not turns:
+            return turns or messages
+        turns[0] = {'role': turns[0]['role'], 'content': '\n\n'.join(system + [turns[0]['content']])}
+        return turns
+    
+    def _google_start_chat(self, model: str, api_key: str, messages: List[Dict], asynchronous: bool = False):
+        """Resolve the requested model to one the key can use and start a chat with the prior turns"""
+        # Map model names to actual working model names
+        # Try to list available models first
+        available_models = self._list_google_models(api_key)
+        
+        actual_model = None
+        
+        if available_models:
+            # Use available models - try to match requested model
+            if model in available_models:
+                actual_model = model
+            elif 'pro' in model.lower():
+                pro_models = [m for m in available_models if 'pro' in m.lower()]
+                actual_model = pro_models[0] if pro_models else available_models[0]
+            elif 'flash' in model.lower():
+                flash_models = [m for m in available_models if 'flash' in m.lower()]
+                actual_model = flash_models[0] if flash_models else available_models[0]
             else:
-                raise ValueError(f"Error calling Gemini API: {error_msg}{available_msg}")
+                actual_model = available_models[0]
+        else:
+            # Fallback: use simple model name mapping
+            # Most APIs support 'gemini-pro' as the basic model name
+            model_mapping = {
+                'gemini-1.5-pro': 'gemini-pro',
+                'gemini-1.5-pro-latest': 'gemini-pro',
+                'gemini-1.5-flash': 'gemini-pro',  # Fallback to pro if flash not available
+                'gemini-1.5-flash-latest': 'gemini-pro',
+                'gemini-pro': 'gemini-pro',
+            }
+            actual_model = model_mapping.get(model, 'gemini-pro')
+        
+        model_instance = genai.GenerativeModel(actual_model)
+        # Per-key client instead of genai.configure(), which is global to the process. The SDK
+        # has no public way to pass one, so this sets the private attribute GenerativeModel
+        # reads its client from; google-generativeai is pinned in requirements.txt for that
+        attribute = '_async_client' if asynchronous else '_client'
+        if not hasattr(model_instance, attribute):
+            raise RuntimeError(
+                f"This google-generativeai version has no GenerativeModel.{attribute}; "
+                "install the version pinned in requirements.txt"
+            )
+        setattr(model_instance, attribute, get_provider_clients().get('google', api_key, asynchronous=asynchronous).generative)
+        
+        # Convert messages to Google format
+        # Google Gemini expects alternating user/model messages in history
+        history = []
+        for i in range(len(messages) - 1):
+            msg = messages[i]
+            if msg['role'] == 'user':
+                history.append({'role': 'user', 'parts': [msg['content']]})
+            elif msg['role'] == 'assistant':
+                history.append({'role': 'model', 'parts': [msg['content']]})
+        
+        # Start chat with history (if any)
+        if history:
+            chat = model_instance.start_chat(history=history)
+        else:
+            chat = model_instance.start_chat(history=[])
+        
+        return actual_model, chat
+    
+    def _google_error(self, model: str, api_key: str, e: Exception) -> ValueError:
+        """Turn a Gemini failure into a ValueError with troubleshooting hints"""
+        if isinstance(e, GatewayError):
+            return e
+        error_msg = str(e)
+        
+        # Try to get available models for better error message
+        try:
+            available_models = self._list_google_models(api_key)
+            available_msg = f"\n\nAvailable models: {', '.join(available_models) if available_models else 'Could not list models. Check API key permissions.'}"
+        except:
+            available_msg = "\n\nCould not retrieve available models. Please check your API key and ensure Generative Language API is enabled."
+        
+        if '404' in error_msg or 'not found' in error_msg.lower():
+            return ValueError(
+                f"Gemini model '{model}' not found.{available_msg}\n\n"
+                f"Please try:\n"
+                f"1. Use 'gemini-pro' (most widely supported)\n"
+                f"2. Check your Google Cloud Console - ensure Generative Language API is enabled\n"
+                f"3. Verify your API key has access to Gemini models\n"
+                f"4. Original error: {error_msg}"
+            )
+        elif 'API key' in error_msg or 'authentication' in error_msg.lower():
+            return ValueError(f"Gemini authentication failed: {error_msg}\n\nPlease check:\n1. Your API key is correct\n2. Generative Language API is enabled in Google Cloud Console\n3. Your billing account is active")
+        else:
+            return ValueError(f"Error calling Gemini API: {error_msg}{available_msg}")
+    
+    def _local_chat(self, model: str, messages: List[Dict]) -> Dict:
+        """Deterministic reply without a network call: echoes the last message ('fail' model raises)"""
+        if model == 'fail':
+            raise ValueError("Local provider failure (model 'fail')")
+        content = f"[{model}] {messages[-1]['content']}"
+        return {
+            'content': content,
+            'tokens': self._estimate_tokens(messages, content),
+            'cost': 0,
+            'metadata': {
+                'model': model,
+                'local': True
+            }
+        }
+    
+    def _estimate_tokens(self, messages: List[Dict], content: str) -> int:
+        """Rough token count (~4 characters each) for responses that don't report usage"""
+        characters = sum(len(msg['content']) for msg in messages) + len(content)
+        return max(1, characters // 4)
     
     def _calculate_openai_cost(self, model: str, tokens: int) -> float:
         """Calculate cost for OpenAI (approximate)"""
@@ -0,0 +1,466 @@
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from services.vector_store import UserVectorMatrix, normalize_rows, top_k
+
+RECORD_DELETE = 0
+RECORD_INSERT = 1
+
+
+def shard_name(user_id: str) -> str:
+    """Filesystem-safe shard directory name for a user"""
+    return hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()[:20]
+
+
+def record_dtype(dim: int) -> np.dtype:
+    """Layout of one append-only log record (insert or delete)"""
+    return np.dtype([('id', '<i8'), ('op', '<i8'), ('vector', '<f4', (dim,))])
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Index of the closest centroid (by inner product) for every row"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assignments[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of unit vectors"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * 64)
+    sample = np.asarray(vectors[rng.choice(len(vectors), sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind='stable')
+        lists, starts = np.unique(assignments[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+
+        # Reseed empty lists from random sample points
+        empty = np.setdiff1d(np.arange(nlist), lists)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+def default_nlist(count: int) -> int:
+    """Number of inverted lists for `count` vectors (about 4 * sqrt(n))"""
+    return int(max(1, min(count, round(4 * np.sqrt(count)))))
+
+
+class IVFShard:
+    """Memory-mapped inverted-file (IVF) index over one user's embeddings
+
+    The base index is a set of .npy files, vectors sorted by inverted list
+    and opened with mmap so only probed lists are paged in. Inserts and
+    deletes go to an append-only log that every process replays before
+    searching; compact() folds the log into a new base generation. The
+    previous generation's files are kept until the next build, so readers
+    that saw the old meta.json can still open them. meta.json records the
+    embedding model and dimension, so stores can ignore incompatible shards.
+    """
+
+    def __init__(self, path: str, nprobe: int = 16):
+        self.path = path
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._meta_version = None
+        self._load()
+
+    # ---- files ---------------------------------------------------------
+
+    def _file(self, name: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{name}-{generation}")
+
+    @staticmethod
+    def _read_meta(path: str) -> dict:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+
+    @classmethod
+    def build(cls, path: str, message_ids: Iterable[int], vectors: np.ndarray,
+              nprobe: int = 16, centroids: Optional[np.ndarray] = None, model: Optional[str] = None) -> 'IVFShard':
+        """Write a new base generation for `path` and return the opened shard
+
+        `model` names the embedding model that produced `vectors`; it
+        defaults to the model recorded by the previous generation.
+        """
+        os.makedirs(path, exist_ok=True)
+        ids = np.asarray(list(message_ids), dtype=np.int64)
+        vectors = normalize_rows(vectors)
+        dim = vectors.shape[1]
+
+        try:
+            meta = cls._read_meta(path)
+            generation = meta['generation'] + 1
+            trained_count = meta.get('trained_count', 0)
+            model = model or meta.get('model')
+        except (OSError, ValueError, KeyError):
+            meta = None
+            generation = 1
+            trained_count = 0
+
+        if centroids is None or len(ids) > 4 * max(trained_count, 1) or centroids.shape[1] != dim:
+            centroids = train_centroids(vectors, default_nlist(max(len(ids), 1))) if len(ids) else np.zeros((1, dim), dtype=np.float32)
+            trained_count = len(ids)
+
+        assignments = assign_lists(vectors, centroids) if len(ids) else np.zeros(0, dtype=np.int64)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+
+        def target(name):
+            return os.path.join(path, f"{name}-{generation}")
+
+        np.save(target('centroids') + '.npy', centroids.astype(np.float32))
+        np.save(target('offsets') + '.npy', offsets)
+        np.save(target('ids') + '.npy', ids[order])
+        np.save(target('vectors') + '.npy', vectors[order])
+        open(target('log') + '.bin', 'ab').close()
+
+        new_meta = {
+            'generation': generation,
+            'dim': int(dim),
+            'model': model,
+            'count': int(len(ids)),
+            'trained_count': int(trained_count)
+        }
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(new_meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+        # Keep the generation just replaced: a reader may have read its meta but not opened
+        # its files yet. Anything older has had a whole build's time to be picked up.
+        cls._remove_generations_before(path, generation - 1)
+
+        return cls(path, nprobe=nprobe)
+
+    @staticmethod
+    def _remove_generations_before(path: str, generation: int):
+        for filename in os.listdir(path):
+            name, _, suffix = filename.partition('-')
+            number = suffix.split('.', 1)[0]
+            if name in ('centroids', 'offsets', 'ids', 'vectors', 'log') and number.isdigit() and int(number) < generation:
+                try:
+                    os.remove(os.path.join(path, filename))
+                except OSError:
+                    pass
+
+    def _load(self, attempts: int = 3):
+        for attempt in range(attempts):
+            meta_stat = os.stat(os.path.join(self.path, 'meta.json'))
+            meta = self._read_meta(self.path)
+            try:
+                centroids = np.load(self._file('centroids', meta['generation']) + '.npy')
+                offsets = np.load(self._file('offsets', meta['generation']) + '.npy')
+                ids = np.load(self._file('ids', meta['generation']) + '.npy', mmap_mode='r')
+                vectors = np.load(self._file('vectors', meta['generation']) + '.npy', mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # Two builds finished between reading meta.json and opening its files
+                if attempt == attempts - 1:
+                    raise
+
+        self._meta_version = (meta_stat.st_ino, meta_stat.st_mtime_ns)
+        self.generation = meta['generation']
+        self.dim = meta['dim']
+        self.model = meta.get('model')
+        self.count = meta['count']
+        self.trained_count = meta.get('trained_count', self.count)
+
+        self.centroids, self.offsets, self.ids, self.vectors = centroids, offsets, ids, vectors
+        self._sorted_base_ids = np.sort(self.ids)
+
+        self._record_dtype = record_dtype(self.dim)
+        self._log_offset = 0
+        self._delta = UserVectorMatrix(self.dim)
+        self._hidden: set = set()
+        self._hidden_array = np.zeros(0, dtype=np.int64)
+        self._replay_log()
+
+    def _replay_log(self):
+        """Apply log records appended since the last replay (by any process)"""
+        log_path = self._file('log') + '.bin'
+        try:
+            size = os.path.getsize(log_path)
+        except OSError:
+            return
+        record_size = self._record_dtype.itemsize
+        available = (size - self._log_offset) // record_size
+        if available <= 0:
+            return
+
+        records = np.fromfile(log_path, dtype=self._record_dtype, count=available, offset=self._log_offset)
+        self._log_offset += available * record_size
+
+        # Any base row touched by the log is superseded (re-inserted) or deleted
+        record_ids = records['id']
+        positions = np.searchsorted(self._sorted_base_ids, record_ids)
+        if len(self._sorted_base_ids):
+            in_base = self._sorted_base_ids[np.minimum(positions, len(self._sorted_base_ids) - 1)] == record_ids
+            self._hidden.update(int(i) for i in record_ids[in_base])
+
+        # Only the last record per id matters; apply them as one remove and one add,
+        # since each call copies the delta buffers
+        _, last_from_end = np.unique(record_ids[::-1], return_index=True)
+        latest = records[len(records) - 1 - last_from_end]
+        inserts = latest[latest['op'] == RECORD_INSERT]
+        self._delta.remove(latest['id'][latest['op'] != RECORD_INSERT])
+        self._delta.add(inserts['id'], inserts['vector'])
+        self._hidden_array = np.fromiter(self._hidden, dtype=np.int64, count=len(self._hidden))
+
+    def refresh(self):
+        """Pick up a new generation or new log records written by other processes"""
+        with self._lock:
+            try:
+                meta_stat = os.stat(os.path.join(self.path, 'meta.json'))
+            except OSError:
+                return
+            if (meta_stat.st_ino, meta_stat.st_mtime_ns) != self._meta_version:
+                self._load()
+            else:
+                self._replay_log()
+
+    # ---- mutation ------------------------------------------------------
+
+    def _append(self, records: np.ndarray):
+        # Shared lock: appends run concurrently but never while compact() swaps generations
+        with open(os.path.join(self.path, 'compact.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                self.refresh()
+                # One write per batch; O_APPEND keeps concurrent writers from interleaving records
+                with open(self._file('log') + '.bin', 'ab') as f:
+                    f.write(records.tobytes())
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.refresh()
+
+    def append(self, message_ids: Iterable[int], vectors: np.ndarray):
+        """Insert or replace vectors"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        records = np.zeros(len(message_ids), dtype=self._record_dtype)
+        records['id'] = message_ids
+        records['op'] = RECORD_INSERT
+        records['vector'] = normalize_rows(vectors)
+        with self._lock:
+            self._append(records)
+
+    def delete(self, message_ids: Iterable[int]):
+        """Remove vectors"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        records = np.zeros(len(message_ids), dtype=self._record_dtype)
+        records['id'] = message_ids
+        records['op'] = RECORD_DELETE
+        with self._lock:
+            self._append(records)
+
+    def pending_changes(self) -> int:
+        """Rows in the log that are not yet part of the base generation"""
+        return len(self._delta) + len(self._hidden)
+
+    def needs_compaction(self, min_changes: int = 1024, ratio: float = 0.1) -> bool:
+        return self.pending_changes() >= max(min_changes, int(self.count * ratio))
+
+    def compact(self) -> 'IVFShard':
+        """Fold the log into a new base generation (serialized across processes)"""
+        lock_path = os.path.join(self.path, 'compact.lock')
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    self.refresh()
+                    keep = ~np.isin(self.ids, self._hidden_array)
+                    delta_ids, delta_vectors = self._delta.snapshot()
+                    ids = np.concatenate([np.asarray(self.ids)[keep], delta_ids])
+                    vectors = np.concatenate([np.asarray(self.vectors)[keep], delta_vectors])
+                    shard = IVFShard.build(self.path, ids, vectors, nprobe=self.nprobe, centroids=self.centroids,
+                                           model=self.model)
+                    return shard
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---- search --------------------------------------------------------
+
+    def __len__(self):
+        return self.count - len(self._hidden) + len(self._delta)
+
+    def search(self, query_vector: np.ndarray, limit: int, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Approximate top-k (message_id, cosine score) pairs, best first"""
+        self.refresh()
+        query = normalize_rows(query_vector)[0]
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+
+        with self._lock:
+            centroids, offsets = self.centroids, self.offsets
+            base_ids, base_vectors = self.ids, self.vectors
+            hidden = self._hidden_array
+            delta = self._delta
+
+        centroid_scores = centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < len(centroids) else np.arange(len(centroids))
+
+        candidate_ids = []
+        candidate_scores = []
+        for list_id in probe:
+            start, end = offsets[list_id], offsets[list_id + 1]
+            if start == end:
+                continue
+            candidate_ids.append(base_ids[start:end])
+            candidate_scores.append(base_vectors[start:end] @ query)
+
+        delta_ids, delta_vectors = delta.snapshot()
+        if len(delta_ids):
+            candidate_ids.append(delta_ids)
+            candidate_scores.append(delta_vectors @ query)
+
+        if not candidate_ids:
+            return []
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if len(hidden) and len(delta_ids) < len(ids):
+            # Hidden ids may have a newer copy in the delta; only mask base rows
+            base_count = len(ids) - len(delta_ids)
+            mask = np.ones(len(ids), dtype=bool)
+            mask[:base_count] = ~np.isin(ids[:base_count], hidden)
+            ids, scores = ids[mask], scores[mask]
+
+        return top_k(ids, scores, limit)
+
+
+class LocalANNStore:
+    """Per-user IVF shards under one directory, opened lazily
+
+    Shards are only built for users with at least `min_rows` embeddings;
+    smaller histories are served faster by the exact in-memory matrix.
+    Shards built by another embedding `model` (or of another dimension)
+    are treated as missing, so the caller falls back and rebuilds them.
+    """
+
+    def __init__(self, root: str, nprobe: int = 16, min_rows: int = 20000, max_open: int = 64,
+                 model: Optional[str] = None):
+        self.root = root
+        self.model = model
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self._max_open = max_open
+        self._shards: 'OrderedDict[str, IVFShard]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: set = set()
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.root, shard_name(user_id))
+
+    def _remember(self, user_id: str, shard: IVFShard):
+        with self._lock:
+            self._shards[user_id] = shard
+            self._shards.move_to_end(user_id)
+            while len(self._shards) > self._max_open:
+                self._shards.popitem(last=False)
+
+    def get(self, user_id: str, dim: Optional[int] = None) -> Optional[IVFShard]:
+        """Open the user's shard if one has been built for this model (and `dim`)"""
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                self._shards.move_to_end(user_id)
+
+        if shard is None:
+            path = self._path(user_id)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                return None
+            shard = IVFShard(path, nprobe=self.nprobe)
+            self._remember(user_id, shard)
+        else:
+            shard.refresh()
+
+        if shard.model != self.model or (dim is not None and shard.dim != dim):
+            return None
+        return shard
+
+    def build(self, user_id: str, message_ids: Iterable[int], vectors: np.ndarray) -> IVFShard:
+        """(Re)build a user's shard from scratch"""
+        shard = IVFShard.build(self._path(user_id), message_ids, vectors, nprobe=self.nprobe, model=self.model)
+        self._remember(user_id, shard)
+        return shard
+
+    def build_in_background(self, user_id: str, message_ids: np.ndarray, vectors: np.ndarray,
+                            on_built: Optional[Callable[[IVFShard], None]] = None):
+        """Build a shard off the request thread; no-op if one is already building
+
+        `on_built(shard)` runs once the shard is live, so the caller can
+        forward rows that changed while the build was running.
+        """
+        with self._lock:
+            if user_id in self._building:
+                return
+            self._building.add(user_id)
+
+        def run():
+            try:
+                shard = self.build(user_id, message_ids, vectors)
+                if on_built is not None:
+                    on_built(shard)
+            except Exception as e:
+                print(f"Warning: Could not build ANN index for user {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._building.discard(user_id)
+
+        threading.Thread(target=run, name='ann-build', daemon=True).start()
+
+    def _maybe_compact(self, user_id: str, shard: IVFShard):
+        if not shard.needs_compaction():
+            return
+        with self._lock:
+            if user_id in self._building:
+                return
+            self._building.add(user_id)
+
+        def run():
+            try:
+                self._remember(user_id, shard.compact())
+            except Exception as e:
+                print(f"Warning: Could not compact ANN index for user {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._building.discard(user_id)
+
+        threading.Thread(target=run, name='ann-compact', daemon=True).start()
+
+    def add(self, user_id: str, message_ids: Iterable[int], vectors: np.ndarray) -> bool:
+        """Append to the user's shard; returns False if the user has no shard"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        shard = self.get(user_id, dim=vectors.shape[-1])
+        if shard is None:
+            return False
+        shard.append(message_ids, vectors)
+        self._maybe_compact(user_id, shard)
+        return True
+
+    def remove(self, user_id: str, message_ids: Iterable[int]) -> bool:
+        """Delete from the user's shard; returns False if the user has no shard"""
+        shard = self.get(user_id)
+        if shard is None:
+            return False
+        shard.delete(message_ids)
+        self._maybe_compact(user_id, shard)
+        return True
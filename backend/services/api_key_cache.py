@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+import threading
+import time
+from config import Config
+from models import db, APIKey, APIKeyVersion, insert_ignore
+
+# How far back each poll of api_key_versions looks beyond the previous one, so changes
+# committed slightly late (or stamped by a worker with a lagging clock) are still seen
+_POLL_OVERLAP = timedelta(seconds=10)
+
+
+def decrypt_api_key(stored: str) -> str:
+    """Plaintext of an api_keys.api_key value
+
+    Keys are stored as given today; at-rest encryption only needs to change
+    this function, and the cache keeps its cost to once per load.
+    """
+    return stored
+
+
+class APIKeyCache:
+    """Per-process cache of each user's active API keys, decrypted, by platform
+
+    Entries are dropped by the api_keys routes of this process as soon as
+    they commit, and in other processes through api_key_versions: every
+    change bumps the user's version, and each process polls for recently
+    changed rows at most every `poll_interval` seconds, on the next lookup.
+    `ttl` bounds how long an entry can be served in any case.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, poll_interval: float = 1.0,
+                 decrypt: Callable[[str], str] = decrypt_api_key):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.decrypt = decrypt
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()  # user_id -> {'version', 'keys', 'expires_at'}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._polled_at = float('-inf')
+        self._poll_since: Optional[datetime] = None
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id: str, platform: str) -> Optional[str]:
+        """The user's active key for `platform`, decrypted, or None"""
+        return self.keys(user_id).get(platform)
+
+    def keys(self, user_id: str) -> Dict[str, str]:
+        """{platform: decrypted key} for the user's active keys"""
+        self._poll()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry['expires_at'] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry['keys']
+            self._stats['misses'] += 1
+
+        # The version is read first: a change committed in between makes the entry look stale, never fresh
+        version = db.session.query(APIKeyVersion.version).filter_by(user_id=user_id).scalar() or 0
+        keys = {record.platform: self.decrypt(record.api_key) for record in APIKey.query.filter_by(
+            user_id=user_id,
+            is_active=True
+        )}
+        with self._lock:
+            self._entries[user_id] = {'version': version, 'keys': keys, 'expires_at': time.monotonic() + self.ttl}
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return keys
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def bump_version(self, user_id: str, session=None):
+        """Record a change to the user's keys; call in the transaction that makes it"""
+        session = session or db.session
+        values = {'version': APIKeyVersion.version + 1, 'updated_at': datetime.utcnow()}
+        if not session.query(APIKeyVersion).filter_by(user_id=user_id).update(values, synchronize_session=False):
+            # First change for this user; a concurrent first change may insert the row too
+            insert_ignore(APIKeyVersion.__table__, [{
+                'user_id': user_id,
+                'version': 0,
+                'updated_at': datetime.utcnow()
+            }], session=session)
+            session.query(APIKeyVersion).filter_by(user_id=user_id).update(values, synchronize_session=False)
+
+    def _poll(self):
+        """Drop entries whose version changed in another process since the last poll"""
+        if time.monotonic() - self._polled_at < self.poll_interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # another thread is polling
+        try:
+            now = datetime.utcnow()
+            since = self._poll_since - _POLL_OVERLAP if self._poll_since else now - _POLL_OVERLAP
+            changed = db.session.query(APIKeyVersion.user_id, APIKeyVersion.version).filter(
+                APIKeyVersion.updated_at >= since
+            ).all()
+            with self._lock:
+                for user_id, version in changed:
+                    entry = self._entries.get(user_id)
+                    if entry is not None and entry['version'] != version:
+                        del self._entries[user_id]
+                        self._stats['invalidations'] += 1
+            self._poll_since = now
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not poll api_key_versions: {e}")
+        finally:
+            self._polled_at = time.monotonic()
+            self._poll_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+_cache: Optional[APIKeyCache] = None
+_cache_lock = threading.Lock()
+
+def get_api_key_cache() -> APIKeyCache:
+    """Return the process-wide API key cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = APIKeyCache(
+                max_entries=Config.API_KEY_CACHE_SIZE,
+                ttl=Config.API_KEY_CACHE_TTL,
+                poll_interval=Config.API_KEY_CACHE_POLL_INTERVAL
+            )
+        return _cache
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import threading
+from config import Config
+
+
+class ExecutorSaturated(RuntimeError):
+    """The executor is already running its maximum number of calls"""
+
+
+class AsyncExecutor:
+    """Runs provider calls as coroutines on one background event loop
+
+    A waiting call costs a coroutine, not a thread or a request worker, so
+    a process can hold thousands of them. Calls to each provider are capped
+    by a semaphore and bounded by a timeout. Result and error callbacks are
+    synchronous (they write to the database) and run on a small thread
+    pool, off the loop.
+    """
+
+    def __init__(self, concurrency: Dict[str, int], default_concurrency: int = 100,
+                 timeout: float = 120.0, max_in_flight: int = 5000, callback_workers: int = 8):
+        self.concurrency = concurrency
+        self.default_concurrency = default_concurrency
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix='async-callback')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-executor', daemon=True)
+        self._thread.start()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}  # Only touched on the loop
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def reserve(self):
+        """Claim an in-flight slot ahead of submit(..., reserved=True)
+
+        Lets a caller refuse work before writing anything for it. Raises
+        ExecutorSaturated; call release() if the call is never submitted.
+        """
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                raise ExecutorSaturated(f"{self.in_flight} calls already in flight")
+            self.in_flight += 1
+
+    def release(self):
+        """Give back a reserve()d slot that won't be used"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def submit(self, provider: str, call: Callable[[], Awaitable],
+               on_result: Callable, on_error: Callable[[Exception], None], reserved: bool = False):
+        """Schedule call() under the provider's limit and return immediately
+
+        Raises ExecutorSaturated instead of queueing past max_in_flight,
+        unless the slot was already taken with reserve().
+        """
+        if not reserved:
+            self.reserve()
+        asyncio.run_coroutine_threadsafe(self._run(provider, call, on_result, on_error), self._loop)
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            limit = self.concurrency.get(provider, self.default_concurrency)
+            semaphore = self._semaphores[provider] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def _run(self, provider: str, call, on_result, on_error):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                async with self._semaphore(provider):
+                    # The timeout covers the provider call, not time spent waiting for a slot
+                    result = await asyncio.wait_for(call(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise TimeoutError(f"{provider} did not respond within {self.timeout:g}s")
+        except Exception as e:
+            self.failed += 1
+            await loop.run_in_executor(self._callbacks, self._callback, on_error, e)
+        else:
+            self.completed += 1
+            await loop.run_in_executor(self._callbacks, self._callback, on_result, result)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _callback(self, callback, value):
+        try:
+            callback(value)
+        except Exception as e:
+            print(f"Warning: Async executor callback failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out
+            }
+
+
+_executor: Optional[AsyncExecutor] = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_async_executor() -> AsyncExecutor:
+    """Return this process's executor (restarted after fork; the loop thread doesn't survive it)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = AsyncExecutor(
+                concurrency={
+                    'openai': Config.ASYNC_OPENAI_CONCURRENCY,
+                    'anthropic': Config.ASYNC_ANTHROPIC_CONCURRENCY,
+                    'google': Config.ASYNC_GOOGLE_CONCURRENCY
+                },
+                default_concurrency=Config.ASYNC_PROVIDER_CONCURRENCY,
+                timeout=Config.ASYNC_PROVIDER_TIMEOUT,
+                max_in_flight=Config.ASYNC_MAX_IN_FLIGHT
+            )
+            _executor_pid = os.getpid()
+        return _executor
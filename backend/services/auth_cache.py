@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+import hashlib
+import json
+import re
+import threading
+import time
+import urllib.request
+import jwt
+from config import Config
+
+# RS256 verification needs the optional `cryptography` backend of PyJWT
+try:
+    from jwt.algorithms import RSAAlgorithm, has_crypto as JWT_CRYPTO_AVAILABLE
+except ImportError:
+    RSAAlgorithm = None
+    JWT_CRYPTO_AVAILABLE = False
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries each carry their own expiry"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value, ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def token_key(token: str) -> str:
+    """Cache key for a bearer token, so raw tokens aren't kept in memory"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class JWKSCache:
+    """Signing keys from a JWKS URL, kept in memory and refreshed in the background
+
+    Keys are refetched on a background thread once they are older than
+    the endpoint's Cache-Control max-age (or `ttl`); requests keep using
+    the current set meanwhile. An unknown key id triggers one synchronous
+    fetch, rate-limited, to pick up rotated keys.
+    """
+
+    def __init__(self, url: str, ttl: float = 3600.0, min_refetch_interval: float = 60.0):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: Dict[str, object] = {}
+        self._fetched_at = float('-inf')
+        self._expires_in = ttl
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def get_key(self, kid: Optional[str]):
+        """The public key for `kid`, or None if the JWKS doesn't have it"""
+        age = time.monotonic() - self._fetched_at
+        key = self._keys.get(kid)
+        if key is not None:
+            if age > self._expires_in:
+                self._refresh_in_background()
+            return key
+        if age > self.min_refetch_interval:
+            self._fetch()
+        return self._keys.get(kid)
+
+    def _fetch(self):
+        with self._fetch_lock:
+            try:
+                with urllib.request.urlopen(self.url, timeout=5) as response:
+                    body = json.load(response)
+                    match = _MAX_AGE.search(response.headers.get('Cache-Control', ''))
+                keys = {jwk['kid']: RSAAlgorithm.from_jwk(json.dumps(jwk)) for jwk in body.get('keys', []) if 'kid' in jwk}
+            except Exception as e:
+                print(f"Warning: Could not fetch JWKS from {self.url}: {e}")
+                # Keep the old keys; try again after min_refetch_interval
+                self._fetched_at = max(self._fetched_at, time.monotonic() - self._expires_in + self.min_refetch_interval)
+                return
+            self._keys = keys
+            self._expires_in = float(match.group(1)) if match else self.ttl
+            self._fetched_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name='jwks-refresh', daemon=True).start()
+
+
+def decode_token(token: str) -> Optional[Dict]:
+    """Claims of a bearer token, or None if it isn't acceptable
+
+    With FIREBASE_PROJECT_ID set, Firebase ID tokens are verified (RS256
+    signature against the cached JWKS, expiry, audience and issuer).
+    Without it tokens are only decoded, as in development.
+    """
+    project_id = Config.FIREBASE_PROJECT_ID
+    if not project_id:
+        return jwt.decode(token, options={"verify_signature": False})
+
+    if not JWT_CRYPTO_AVAILABLE:
+        print("Warning: FIREBASE_PROJECT_ID is set but PyJWT has no RSA support (install cryptography)")
+        return None
+    key = get_jwks_cache().get_key(jwt.get_unverified_header(token).get('kid'))
+    if key is None:
+        return None
+    return jwt.decode(
+        token,
+        key=key,
+        algorithms=['RS256'],
+        audience=project_id,
+        issuer=f"https://securetoken.google.com/{project_id}"
+    )
+
+
+_token_cache: Optional[TTLCache] = None
+_user_cache: Optional[TTLCache] = None
+_jwks_cache: Optional[JWKSCache] = None
+_cache_lock = threading.Lock()
+
+def get_token_cache() -> TTLCache:
+    """token_key(token) -> identity claims, each entry expiring no later than its token"""
+    global _token_cache
+    with _cache_lock:
+        if _token_cache is None:
+            _token_cache = TTLCache(max_entries=Config.AUTH_TOKEN_CACHE_SIZE)
+        return _token_cache
+
+def get_user_cache() -> TTLCache:
+    """user id -> detached User row"""
+    global _user_cache
+    with _cache_lock:
+        if _user_cache is None:
+            _user_cache = TTLCache(max_entries=Config.AUTH_TOKEN_CACHE_SIZE)
+        return _user_cache
+
+def get_jwks_cache() -> JWKSCache:
+    global _jwks_cache
+    with _cache_lock:
+        if _jwks_cache is None:
+            _jwks_cache = JWKSCache(Config.AUTH_JWKS_URL, ttl=Config.AUTH_JWKS_TTL)
+        return _jwks_cache
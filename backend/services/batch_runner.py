@@ -0,0 +1,298 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+from sqlalchemy import or_
+
+
+class BatchRunner:
+    """Worker threads that execute queued batch_job_items
+
+    Items are claimed from the database with a conditional UPDATE, so any
+    number of processes can share one queue. A claim is a lease: items left
+    'running' longer than `lease_timeout` (the process died mid-call) go
+    back to pending, which is what lets a batch resume after a restart.
+    Results are only written while the worker still holds its lease (the
+    item is running with the claimed_at it set), so a call that outlives
+    its lease can't save a second conversation for the same item.
+    At most `provider_concurrency` items per platform run at once in each
+    process; each result is saved as an ordinary conversation.
+    """
+
+    def __init__(self, app, workers: int = 8, provider_concurrency: int = 4, poll_interval: float = 2.0,
+                 lease_timeout: float = 600.0, max_attempts: int = 3):
+        self.app = app
+        self.workers = workers
+        self.provider_concurrency = provider_concurrency
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running: Dict[str, int] = {}  # platform -> items in flight in this process
+        self._stats = {'completed': 0, 'failed': 0, 'deferred': 0, 'reclaimed': 0, 'lease_lost': 0}
+        self._reclaimed_at = float('-inf')
+
+    def ensure_started(self):
+        """Start the workers in this process (threads don't survive fork); cheap when already running"""
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._running = {}
+            self._threads = [
+                threading.Thread(target=self._run, name=f'batch-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def wake(self):
+        """Have idle workers look for new items now instead of at the next poll"""
+        self.ensure_started()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = dict(self._running)
+        stats['workers'] = len(self._threads) if self._pid == os.getpid() else 0
+        return stats
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _run(self):
+        from models import db
+
+        while True:
+            claim = None
+            with self.app.app_context():
+                try:
+                    self._reclaim_expired()
+                    claim = self._claim()
+                    if claim is not None:
+                        self._execute(*claim)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Warning: Batch worker error: {e}")
+                finally:
+                    db.session.remove()
+            if claim is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _reclaim_expired(self):
+        from models import db, BatchJobItem
+
+        # Once at startup (resuming what a dead process left running), then every so often
+        with self._lock:
+            if time.monotonic() - self._reclaimed_at < min(self.lease_timeout, 30.0):
+                return
+            self._reclaimed_at = time.monotonic()
+
+        now = datetime.utcnow()
+        expired = BatchJobItem.query.filter(
+            BatchJobItem.status == 'running',
+            BatchJobItem.claimed_at < now - timedelta(seconds=self.lease_timeout)
+        )
+        # Calls that keep outliving the lease would otherwise be retried forever
+        exhausted = expired.filter(BatchJobItem.attempts >= self.max_attempts).update({
+            'status': 'failed',
+            'error': f"Lease expired on each of {self.max_attempts} attempts (provider call longer than the lease?)",
+            'claimed_at': None,
+            'completed_at': now
+        }, synchronize_session=False)
+        reclaimed = expired.update({'status': 'pending', 'claimed_at': None}, synchronize_session=False)
+        db.session.commit()
+        for _ in range(exhausted):
+            self._count('failed')
+        for _ in range(reclaimed):
+            self._count('reclaimed')
+
+    def _claim(self) -> Optional[Tuple[int, datetime]]:
+        """Mark one runnable pending item as running for this worker; returns (id, claimed_at)
+
+        claimed_at identifies the lease: writes for the item require it to be unchanged.
+        """
+        from models import db, BatchJobItem
+
+        with self._lock:
+            busy = [platform for platform, count in self._running.items() if count >= self.provider_concurrency]
+        now = datetime.utcnow()
+        query = db.session.query(BatchJobItem.id, BatchJobItem.platform).filter(
+            BatchJobItem.status == 'pending',
+            or_(BatchJobItem.available_at.is_(None), BatchJobItem.available_at <= now)
+        )
+        if busy:
+            query = query.filter(BatchJobItem.platform.notin_(busy))
+        candidates = query.order_by(BatchJobItem.id).limit(self.workers).all()
+
+        for candidate in candidates:
+            with self._lock:
+                if self._running.get(candidate.platform, 0) >= self.provider_concurrency:
+                    continue
+                self._running[candidate.platform] = self._running.get(candidate.platform, 0) + 1
+            try:
+                # Only one worker (in any process) sees rowcount 1 for a given item
+                claimed = BatchJobItem.query.filter_by(id=candidate.id, status='pending').update({
+                    'status': 'running',
+                    'claimed_at': now,
+                    'attempts': BatchJobItem.attempts + 1
+                }, synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                self._release(candidate.platform)
+                raise
+            if claimed:
+                return candidate.id, now
+            self._release(candidate.platform)
+        return None
+
+    def _release(self, platform: str):
+        with self._lock:
+            self._running[platform] -= 1
+
+    def _execute(self, item_id: int, claimed_at: datetime):
+        from models import db, BatchJobItem
+        from services.ai_service import AIService, LOCAL_PLATFORM
+        from services.api_key_cache import get_api_key_cache
+        from services.provider_gateway import GatewayError
+
+        item = db.session.get(BatchJobItem, item_id)
+        platform, model, prompt = item.platform, item.model, item.prompt
+        user_id, folder_id = item.batch.user_id, item.batch.folder_id
+        try:
+            api_key = ''
+            if platform != LOCAL_PLATFORM:
+                api_key = get_api_key_cache().get(user_id, platform)
+                if not api_key:
+                    raise ValueError(f"API key not configured for {platform}")
+            # End the read transaction; nothing stays open while the provider answers
+            db.session.commit()
+
+            response_data = AIService().send_message(
+                platform=platform,
+                model=model,
+                api_key=api_key,
+                messages=[{'role': 'user', 'content': prompt}]
+            )
+        except GatewayError as e:
+            # Rate limited or circuit open: try again later without using up an attempt
+            db.session.rollback()
+            self._finish(item_id, claimed_at, status='pending', error=str(e), attempts=BatchJobItem.attempts - 1,
+                         available_at=datetime.utcnow() + timedelta(seconds=e.retry_after))
+            self._count('deferred')
+            return
+        except Exception as e:
+            db.session.rollback()
+            item = db.session.get(BatchJobItem, item_id)
+            retry = item.attempts < self.max_attempts
+            # Retries back off: poll_interval * 2, * 4, ...
+            self._finish(item_id, claimed_at, status='pending' if retry else 'failed', error=str(e),
+                         available_at=datetime.utcnow() + timedelta(seconds=self.poll_interval * 2 ** item.attempts) if retry else None,
+                         completed_at=None if retry else datetime.utcnow())
+            if not retry:
+                self._count('failed')
+            return
+        finally:
+            self._release(platform)
+
+        saved = self._save_result(item_id, claimed_at, user_id, folder_id, platform, model, prompt, response_data)
+        if saved is None:
+            print(f"Warning: Batch item {item_id} lost its lease during the provider call; result discarded")
+            self._count('lease_lost')
+            return
+        user_message, assistant_message = saved
+        self._count('completed')
+
+        from services.indexing_pipeline import enqueue_for_indexing
+        enqueue_for_indexing([user_message, assistant_message], user_id)
+
+    def _finish(self, item_id: int, claimed_at: datetime, **values) -> bool:
+        """Update the item if this worker still holds its lease; returns whether it did"""
+        from models import db, BatchJobItem
+
+        values.setdefault('claimed_at', None)
+        updated = BatchJobItem.query.filter_by(id=item_id, status='running', claimed_at=claimed_at).update(
+            values, synchronize_session=False
+        )
+        db.session.commit()
+        return bool(updated)
+
+    def _save_result(self, item_id, claimed_at, user_id, folder_id, platform, model, prompt, response_data):
+        """One transaction: the conversation, both messages and the completed item
+
+        Returns (user_message, assistant_message), or None without saving
+        anything if the lease was lost (the item was reclaimed meanwhile).
+        """
+        from models import db, BatchJobItem, Conversation, Message
+
+        conversation = Conversation(
+            user_id=user_id,
+            platform=platform,
+            model=model,
+            folder_id=folder_id,
+            title=prompt[:100],
+            total_tokens=response_data.get('tokens') or 0,
+            total_cost=Decimal(str(response_data.get('cost') or 0))
+        )
+        db.session.add(conversation)
+        db.session.flush()
+
+        user_message = Message(conversation_id=conversation.id, role='user', content=prompt)
+        assistant_message = Message(
+            conversation_id=conversation.id,
+            role='assistant',
+            content=response_data['content'],
+            tokens=response_data.get('tokens'),
+            cost=response_data.get('cost'),
+            message_metadata=json.dumps(dict(response_data.get('metadata', {}), batch_item_id=item_id))
+        )
+        db.session.add_all([user_message, assistant_message])
+        db.session.flush()
+
+        completed = BatchJobItem.query.filter_by(id=item_id, status='running', claimed_at=claimed_at).update({
+            'status': 'completed',
+            'conversation_id': conversation.id,
+            'message_id': assistant_message.id,
+            'error': None,
+            'claimed_at': None,
+            'completed_at': datetime.utcnow()
+        }, synchronize_session=False)
+        if not completed:
+            db.session.rollback()
+            return None
+        db.session.commit()
+        return user_message, assistant_message
+
+
+_runner: Optional[BatchRunner] = None
+
+
+def init_batch_runner(app) -> BatchRunner:
+    """Create the process-wide runner for `app`; workers start with the first request each process serves"""
+    global _runner
+    _runner = BatchRunner(
+        app,
+        workers=app.config['BATCH_WORKERS'],
+        provider_concurrency=app.config['BATCH_PROVIDER_CONCURRENCY'],
+        poll_interval=app.config['BATCH_POLL_INTERVAL'],
+        lease_timeout=app.config['BATCH_LEASE_TIMEOUT'],
+        max_attempts=app.config['BATCH_MAX_ATTEMPTS']
+    )
+    app.before_request(_runner.ensure_started)
+    return _runner
+
+
+def get_batch_runner() -> Optional[BatchRunner]:
+    """The runner created by init_batch_runner, if batch jobs are enabled"""
+    return _runner
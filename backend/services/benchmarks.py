@@ -0,0 +1,141 @@
+from typing import Dict, List
+import tempfile
+import time
+import numpy as np
+from services.ann_index import IVFShard
+from services.vector_store import QuantizedVectorMatrix, UserVectorMatrix, normalize_rows, top_k
+
+
+def synthetic_embeddings(rows: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors that roughly resemble sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def recall_at_k(expected: List[List[int]], actual: List[List[int]]) -> float:
+    """Mean fraction of the exact top-k found by the approximate search"""
+    hits = [len(set(e) & set(a)) / max(len(e), 1) for e, a in zip(expected, actual)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def latency_summary(timings: List[float]) -> Dict[str, float]:
+    """p50/p95/mean of a list of durations in seconds, reported in ms"""
+    timings_ms = np.asarray(timings) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(timings_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings_ms, 95)), 3),
+        'mean_ms': round(float(timings_ms.mean()), 3)
+    }
+
+
+def benchmark_ann(rows: int = 100000, dim: int = 384, queries: int = 200, k: int = 10,
+                  nprobes=(4, 16, 64), seed: int = 0) -> Dict:
+    """Compare IVF shard recall/latency against the exact in-memory matrix"""
+    vectors = synthetic_embeddings(rows, dim, seed=seed)
+    ids = np.arange(1, rows + 1, dtype=np.int64)
+    rng = np.random.default_rng(seed + 1)
+    query_vectors = normalize_rows(
+        vectors[rng.integers(0, rows, queries)] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    )
+
+    exact = UserVectorMatrix(dim, capacity=rows)
+    exact.add(ids, vectors)
+    exact_results = []
+    exact_timings = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        exact_results.append([message_id for message_id, _ in exact.search(query, k)])
+        exact_timings.append(time.perf_counter() - start)
+
+    report = {
+        'rows': rows,
+        'dim': dim,
+        'queries': queries,
+        'k': k,
+        'brute_force': latency_summary(exact_timings),
+        'ivf': []
+    }
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        shard = IVFShard.build(path, ids, vectors)
+        report['ivf_build_seconds'] = round(time.perf_counter() - start, 2)
+        report['ivf_lists'] = int(len(shard.centroids))
+
+        for nprobe in nprobes:
+            results = []
+            timings = []
+            for query in query_vectors:
+                start = time.perf_counter()
+                results.append([message_id for message_id, _ in shard.search(query, k, nprobe=nprobe)])
+                timings.append(time.perf_counter() - start)
+            report['ivf'].append({
+                'nprobe': nprobe,
+                f'recall@{k}': round(recall_at_k(exact_results, results), 4),
+                **latency_summary(timings)
+            })
+
+    return report
+
+
+def benchmark_quantization(rows: int = 100000, dim: int = 384, queries: int = 200, k: int = 10,
+                           rescore_candidates: int = 200, seed: int = 0) -> Dict:
+    """Recall@k, latency and resident bytes for int8/binary codes vs. float32"""
+    vectors = synthetic_embeddings(rows, dim, seed=seed)
+    ids = np.arange(1, rows + 1, dtype=np.int64)
+    rng = np.random.default_rng(seed + 1)
+    query_vectors = normalize_rows(
+        vectors[rng.integers(0, rows, queries)] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    )
+
+    exact = UserVectorMatrix(dim, capacity=rows)
+    exact.add(ids, vectors)
+    exact_results = []
+    timings = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        exact_results.append([message_id for message_id, _ in exact.search(query, k)])
+        timings.append(time.perf_counter() - start)
+
+    report = {
+        'rows': rows,
+        'dim': dim,
+        'queries': queries,
+        'k': k,
+        'rescore_candidates': rescore_candidates,
+        'modes': [{
+            'mode': 'none',
+            'resident_bytes': exact.nbytes(),
+            f'recall@{k}': 1.0,
+            **latency_summary(timings)
+        }]
+    }
+
+    for mode in ('int8', 'binary'):
+        matrix = QuantizedVectorMatrix(dim, mode, capacity=rows)
+        matrix.add(ids, vectors)
+        raw_results = []
+        rescored_results = []
+        timings = []
+        for query in query_vectors:
+            start = time.perf_counter()
+            candidates = matrix.search(query, max(k, rescore_candidates))
+            # Full-precision rows normally come from message_embeddings; index them directly here
+            candidate_ids = np.asarray([message_id for message_id, _ in candidates], dtype=np.int64)
+            scores = vectors[candidate_ids - 1] @ query
+            rescored_results.append([message_id for message_id, _ in top_k(candidate_ids, scores, k)])
+            timings.append(time.perf_counter() - start)
+            raw_results.append([message_id for message_id, _ in candidates[:k]])
+        report['modes'].append({
+            'mode': mode,
+            'resident_bytes': matrix.nbytes(),
+            'compression': round(exact.nbytes() / matrix.nbytes(), 1),
+            f'recall@{k}': round(recall_at_k(exact_results, rescored_results), 4),
+            f'recall@{k}_without_rescoring': round(recall_at_k(exact_results, raw_results), 4),
+            **latency_summary(timings)
+        })
+
+    return report
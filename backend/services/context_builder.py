@@ -0,0 +1,261 @@
+from decimal import Decimal
+from typing import Dict, Optional
+import json
+import threading
+from sqlalchemy import func, tuple_
+from config import Config
+from models import db, Conversation, Message, MessageTokenCount, ConversationSummary, insert_ignore
+
+# Local tokenizer (pinned in requirements.txt); without it token counts are estimated as chars/4,
+# which can overshoot the real budget on code or non-English text
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    tiktoken = None
+
+# Role and separator tokens chat formats add around each message's content
+MESSAGE_OVERHEAD_TOKENS = 4
+# Messages read per query while walking back from the newest turn
+HISTORY_BATCH_SIZE = 64
+
+# Context window by model name prefix (checked longest prefix first)
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'claude-3': 200000,
+    'claude': 100000,
+    'gemini-1.5': 1000000,
+    'gemini-2': 1000000,
+    'gemini': 30720
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a long conversation so it can stand in for "
+    "messages that no longer fit in the context window. Update the summary with the new "
+    "messages. Keep facts, decisions, names, numbers and open questions; drop small talk. "
+    "Reply with the summary only."
+)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def tokenizer_name() -> str:
+    return 'cl100k_base' if TIKTOKEN_AVAILABLE else 'chars/4'
+
+
+def count_tokens(text: str) -> int:
+    """Token count from the local tokenizer (cl100k_base approximates every provider well enough to budget)"""
+    global _encoding
+    if not text:
+        return 0
+    if not TIKTOKEN_AVAILABLE:
+        return max(1, len(text) // 4)
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding('cl100k_base')
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model: str) -> int:
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def context_budget(model: str) -> int:
+    """Prompt tokens to send: the model's window minus room for the reply, capped by CONTEXT_MAX_TOKENS"""
+    return max(1, min(context_window(model) - Config.CONTEXT_RESPONSE_RESERVE, Config.CONTEXT_MAX_TOKENS))
+
+
+def is_failed_turn(metadata: Optional[str]) -> bool:
+    """Whether a message's metadata marks it as a turn whose reply failed (see routes/chat.py)
+
+    Failed turns stay in the conversation for the user to see and retry,
+    but are never sent to a provider again.
+    """
+    if not metadata or 'failed' not in metadata:
+        return False
+    try:
+        return json.loads(metadata).get('status') == 'failed'
+    except (ValueError, AttributeError):
+        return False
+
+
+def _token_counts(rows) -> Dict[int, int]:
+    """Cached token counts for history rows, counting (and caching) any that are missing"""
+    tokenizer = tokenizer_name()
+    counts = {}
+    missing = []
+    for row in rows:
+        if row.tokens is not None and row.tokenizer == tokenizer:
+            counts[row.id] = row.tokens
+        else:
+            counts[row.id] = count_tokens(row.content)
+            missing.append(row)
+
+    if missing:
+        stale_ids = [row.id for row in missing if row.tokenizer is not None]
+        if stale_ids:
+            MessageTokenCount.query.filter(MessageTokenCount.message_id.in_(stale_ids)).delete(synchronize_session=False)
+        # Same transaction as the caller: it usually holds the write lock from saving the user's turn
+        insert_ignore(MessageTokenCount.__table__, [
+            {'message_id': row.id, 'tokenizer': tokenizer, 'tokens': counts[row.id]} for row in missing
+        ], session=db.session)
+    return counts
+
+
+def build_context(conversation_id: int, model: str, budget: Optional[int] = None) -> Dict:
+    """The newest messages that fit the model's token budget, oldest first
+
+    History is read newest-first in small batches and stops at the first
+    message that doesn't fit, so a long conversation costs about one
+    window's worth of rows per turn. Turns whose reply failed are skipped.
+    With CONTEXT_SUMMARY_ENABLED a stored
+    summary of earlier messages is sent (as a system message, which the
+    Gemini path folds into the first user turn) in front of what fits.
+    """
+    budget = budget or context_budget(model)
+    summary = db.session.get(ConversationSummary, conversation_id) if Config.CONTEXT_SUMMARY_ENABLED else None
+    used = summary.tokens + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+    selected = []
+    costs = {}
+    dropped_through = None
+    before = None
+    while dropped_through is None:
+        query = db.session.query(
+            Message.id, Message.role, Message.content, Message.created_at, Message.message_metadata,
+            MessageTokenCount.tokens, MessageTokenCount.tokenizer
+        ).outerjoin(MessageTokenCount, MessageTokenCount.message_id == Message.id).filter(
+            Message.conversation_id == conversation_id
+        )
+        if summary:
+            query = query.filter(Message.id > summary.through_message_id)
+        if before:
+            query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(
+                db.literal(before[0], Message.created_at.type), db.literal(before[1], Message.id.type)
+            ))
+        rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(HISTORY_BATCH_SIZE).all()
+
+        counts = _token_counts(rows)
+        for row in rows:
+            if is_failed_turn(row.message_metadata):
+                continue
+            cost = counts[row.id] + MESSAGE_OVERHEAD_TOKENS
+            # The newest message always goes in, even if it alone is over budget
+            if selected and used + cost > budget:
+                dropped_through = row.id
+                break
+            selected.append(row)
+            costs[row.id] = cost
+            used += cost
+
+        if len(rows) < HISTORY_BATCH_SIZE:
+            break
+        before = (rows[-1].created_at, rows[-1].id)
+
+    selected.reverse()
+    # Anthropic and Gemini expect the history to open with a user turn
+    while len(selected) > 1 and selected[0].role == 'assistant':
+        dropped_through = selected.pop(0).id
+        used -= costs[dropped_through]
+
+    messages = [{'role': row.role, 'content': row.content} for row in selected]
+    if summary:
+        messages.insert(0, {
+            'role': 'system',
+            'content': f"Summary of the earlier part of this conversation:\n{summary.content}"
+        })
+
+    return {
+        'messages': messages,
+        'tokens': used,
+        'budget': budget,
+        'truncated': dropped_through is not None,
+        'dropped_through': dropped_through,
+        'summary_through': summary.through_message_id if summary else None
+    }
+
+
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def maybe_refresh_summary(app, conversation_id: int, platform: str, model: str, api_key: str, context: Dict):
+    """Fold messages that fell out of the window into the rolling summary, in the background
+
+    Waits until CONTEXT_SUMMARY_MIN_MESSAGES have been dropped since the
+    last summary so the extra provider call happens every few turns, not
+    every turn.
+    """
+    if not Config.CONTEXT_SUMMARY_ENABLED or not context['truncated']:
+        return
+
+    with _summarizing_lock:
+        if conversation_id in _summarizing:
+            return
+        _summarizing.add(conversation_id)
+
+    def run():
+        try:
+            with app.app_context():
+                _refresh_summary(conversation_id, platform, model, api_key, context['dropped_through'])
+        except Exception as e:
+            print(f"Warning: Could not update summary for conversation {conversation_id}: {e}")
+        finally:
+            with _summarizing_lock:
+                _summarizing.discard(conversation_id)
+
+    threading.Thread(target=run, name='context-summary', daemon=True).start()
+
+
+def _refresh_summary(conversation_id: int, platform: str, model: str, api_key: str, through_message_id: int):
+    from services.ai_service import AIService
+
+    summary = db.session.get(ConversationSummary, conversation_id)
+    after = summary.through_message_id if summary else 0
+    rows = db.session.query(Message.id, Message.role, Message.content, Message.message_metadata).filter(
+        Message.conversation_id == conversation_id,
+        Message.id > after,
+        Message.id <= through_message_id
+    ).order_by(Message.id).limit(Config.CONTEXT_SUMMARY_MAX_MESSAGES).all()
+    if len(rows) < Config.CONTEXT_SUMMARY_MIN_MESSAGES:
+        return
+
+    transcript = '\n\n'.join(
+        f"{row.role}: {row.content}" for row in rows if not is_failed_turn(row.message_metadata)
+    )
+    previous = summary.content if summary else '(none yet)'
+    # One user message rather than a system prompt: Gemini chats drop system messages
+    response = AIService().send_message(platform=platform, model=model, api_key=api_key, messages=[
+        {'role': 'user', 'content': f"{SUMMARY_PROMPT}\n\nCurrent summary:\n{previous}\n\nNew messages:\n{transcript}"}
+    ])
+
+    tokens = response.get('tokens', 0) or 0
+    cost = Decimal(str(response.get('cost', 0) or 0))
+    if summary is None:
+        summary = ConversationSummary(conversation_id=conversation_id, total_tokens=tokens, total_cost=cost)
+        db.session.add(summary)
+    else:
+        summary.total_tokens = func.coalesce(ConversationSummary.total_tokens, 0) + tokens
+        summary.total_cost = func.coalesce(ConversationSummary.total_cost, 0) + cost
+    summary.content = response['content']
+    summary.through_message_id = rows[-1].id
+    summary.tokens = count_tokens(response['content'])
+    summary.model = model
+    # The call is billed to the user's key like a reply, so it counts towards the conversation's usage
+    Conversation.query.filter_by(id=conversation_id).update({
+        'total_tokens': func.coalesce(Conversation.total_tokens, 0) + tokens,
+        'total_cost': func.coalesce(Conversation.total_cost, 0) + cost,
+        'updated_at': Conversation.updated_at
+    }, synchronize_session=False)
+    db.session.commit()
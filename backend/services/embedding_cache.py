@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+import hashlib
+import threading
+import numpy as np
+from sqlalchemy import or_
+from models import db, EmbeddingCacheEntry, insert_ignore
+from services.vector_store import pack_embedding, unpack_embedding
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-level embedding cache keyed by (model, sha256(text))
+
+    Level one is an in-process LRU bounded to `max_entries` vectors; level
+    two is the embedding_cache table, shared by every worker and kept across
+    restarts for `ttl` seconds (prune() deletes older rows). encode() only
+    sends texts that miss both levels to the model.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 10000, persist: bool = True, ttl: float = 7 * 86400.0):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.persist = persist
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for `texts` (None where neither level has one)"""
+        keys = [content_hash(text) for text in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[i] = vector
+                    self._stats['memory_hits'] += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        if missing and self.persist:
+            rows = db.session.query(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.vector).filter(
+                EmbeddingCacheEntry.model == self.model_name,
+                EmbeddingCacheEntry.content_hash.in_(list(missing)),
+                or_(EmbeddingCacheEntry.expires_at.is_(None), EmbeddingCacheEntry.expires_at > datetime.utcnow())
+            ).all()
+            for key, blob in rows:
+                vector = unpack_embedding(blob)
+                self._remember(key, vector)
+                for i in missing.pop(key):
+                    found[i] = vector
+                with self._lock:
+                    self._stats['db_hits'] += 1
+
+        with self._lock:
+            self._stats['misses'] += sum(len(positions) for positions in missing.values())
+        return found
+
+    def store(self, texts: List[str], vectors: np.ndarray, persist: bool = True):
+        """Add freshly encoded vectors to both levels (only the in-process one if not `persist`)"""
+        now = datetime.utcnow()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            key = content_hash(text)
+            vector = np.asarray(vector, dtype=np.float32)
+            self._remember(key, vector)
+            rows[key] = {
+                'model': self.model_name,
+                'content_hash': key,
+                'dim': int(vector.shape[0]),
+                'vector': pack_embedding(vector),
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl)
+            }
+        if rows and self.persist and persist:
+            try:
+                with db.engine.begin() as connection:
+                    # Expired rows for these texts would turn the inserts into no-ops
+                    connection.execute(EmbeddingCacheEntry.__table__.delete().where(
+                        EmbeddingCacheEntry.model == self.model_name,
+                        EmbeddingCacheEntry.content_hash.in_(list(rows)),
+                        EmbeddingCacheEntry.expires_at <= now
+                    ))
+                    insert_ignore(EmbeddingCacheEntry.__table__, list(rows.values()), session=connection)
+            except Exception as e:
+                print(f"Warning: Could not persist embedding cache entries: {e}")
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray],
+               persist: bool = True) -> np.ndarray:
+        """Vectors for `texts`, calling `encode_fn` once for the uncached ones
+
+        With `persist` false, new vectors are only kept in memory: a search
+        query shouldn't take the database write lock on the request thread.
+        """
+        found = self.lookup(texts)
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        if missing:
+            # Encode each distinct uncached text once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = np.asarray(encode_fn(unique_texts), dtype=np.float32)
+            self.store(unique_texts, encoded, persist=persist)
+            by_text = dict(zip(unique_texts, encoded))
+            for i in missing:
+                found[i] = by_text[texts[i]]
+        return np.stack(found) if found else np.zeros((0, 0), dtype=np.float32)
+
+    def prune(self) -> int:
+        """Delete expired (and pre-expiry) rows from the embedding_cache table, for every model; returns how many"""
+        deleted = EmbeddingCacheEntry.query.filter(or_(
+            EmbeddingCacheEntry.expires_at.is_(None),
+            EmbeddingCacheEntry.expires_at <= datetime.utcnow()
+        )).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+        return stats
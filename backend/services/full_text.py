@@ -0,0 +1,181 @@
+from typing import Dict, List, Optional
+import html
+from sqlalchemy import text
+from models import db, Message
+from services.lexical_search import tokenize
+
+# Which native backend is live for this process: 'fts5', 'tsvector' or None (ILIKE fallback)
+_backend: Optional[str] = None
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+# The database brackets matches with these private-use characters; the snippet is
+# HTML-escaped before they become SNIPPET_START/END, so message content can't inject markup
+_MATCH_START = '\ue000'
+_MATCH_END = '\ue001'
+
+_SQLITE_TRIGGERS = {
+    'messages_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """,
+    'messages_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """,
+    'messages_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """
+}
+
+
+def _setup_sqlite(connection) -> bool:
+    existing = {
+        row[0] for row in connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE name = 'messages_fts' OR name LIKE 'messages_fts_a%'"
+        ))
+    }
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, content='messages', content_rowid='id', tokenize='unicode61')"
+    ))
+    for statement in _SQLITE_TRIGGERS.values():
+        connection.execute(text(statement))
+
+    # New index, or the messages table was recreated (dropping its triggers): resync everything
+    if 'messages_fts' not in existing or not set(_SQLITE_TRIGGERS) <= existing:
+        connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    return True
+
+
+def _setup_postgresql(connection) -> bool:
+    connection.execute(text("ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_messages_content_tsv ON messages USING GIN (content_tsv)"
+    ))
+    connection.execute(text("DROP TRIGGER IF EXISTS messages_content_tsv_update ON messages"))
+    connection.execute(text(
+        "CREATE TRIGGER messages_content_tsv_update BEFORE INSERT OR UPDATE OF content ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(content_tsv, 'pg_catalog.simple', content)"
+    ))
+    connection.execute(text(
+        "UPDATE messages SET content_tsv = to_tsvector('pg_catalog.simple', content) WHERE content_tsv IS NULL"
+    ))
+    return True
+
+
+def setup_full_text_search() -> Optional[str]:
+    """Create the native full-text index and sync triggers if the database supports them
+
+    Safe to run on every start. Returns the backend in use, or None when
+    search has to fall back to ILIKE.
+    """
+    global _backend
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as connection:
+            if dialect == 'sqlite' and _setup_sqlite(connection):
+                _backend = 'fts5'
+            elif dialect == 'postgresql' and _setup_postgresql(connection):
+                _backend = 'tsvector'
+            else:
+                _backend = None
+    except Exception as e:
+        print(f"Warning: Full-text index unavailable, falling back to ILIKE search: {e}")
+        _backend = None
+    return _backend
+
+
+def full_text_backend() -> Optional[str]:
+    return _backend
+
+
+def _snippet_html(snippet: Optional[str]) -> Optional[str]:
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MATCH_START, SNIPPET_START).replace(_MATCH_END, SNIPPET_END)
+
+
+def _fts5_query(query: str, prefix: bool) -> str:
+    """Quote each token so user input can't inject FTS5 syntax; AND them together"""
+    terms = [f'"{token}"' for token in tokenize(query)]
+    if prefix and terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _tsquery(query: str, prefix: bool) -> str:
+    # tokenize() only yields \w+ runs, so the tokens are safe tsquery lexemes
+    terms = tokenize(query)
+    if prefix and terms:
+        terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def full_text_search(user_id: str, query: str, limit: int = 20, prefix: bool = True) -> List[Dict]:
+    """Ranked {'message_id', 'score', 'snippet'} matches for one user
+
+    Snippets are HTML: escaped message text with matches in <mark>. Scores are higher-is-better in both backends. With `prefix` the last
+    word also matches longer words, which suits search-as-you-type.
+    """
+    if _backend == 'fts5':
+        match = _fts5_query(query, prefix)
+        if not match:
+            return []
+        rows = db.session.execute(text(
+            "SELECT m.id, bm25(messages_fts) AS rank, "
+            "snippet(messages_fts, 0, :start, :end, '…', 24) AS snippet "
+            "FROM messages_fts "
+            "JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE messages_fts MATCH :match AND c.user_id = :user_id "
+            "ORDER BY rank LIMIT :limit"
+        ), {
+            'match': match, 'user_id': user_id, 'limit': limit,
+            'start': _MATCH_START, 'end': _MATCH_END
+        })
+        # bm25() is lower-is-better
+        return [{'message_id': row[0], 'score': -row[1], 'snippet': _snippet_html(row[2])} for row in rows]
+
+    if _backend == 'tsvector':
+        tsquery = _tsquery(query, prefix)
+        if not tsquery:
+            return []
+        rows = db.session.execute(text(
+            "SELECT m.id, ts_rank_cd(m.content_tsv, q) AS rank, "
+            "ts_headline('pg_catalog.simple', m.content, q, :options) AS snippet "
+            "FROM messages m "
+            "JOIN conversations c ON c.id = m.conversation_id, "
+            "to_tsquery('pg_catalog.simple', :tsquery) q "
+            "WHERE m.content_tsv @@ q AND c.user_id = :user_id "
+            "ORDER BY rank DESC LIMIT :limit"
+        ), {
+            'tsquery': tsquery, 'user_id': user_id, 'limit': limit,
+            'options': f'StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxFragments=1, MaxWords=24, MinWords=8'
+        })
+        return [{'message_id': row[0], 'score': float(row[1]), 'snippet': _snippet_html(row[2])} for row in rows]
+
+    raise RuntimeError('No native full-text index available')
+
+
+def matching_message_ids(query: str, prefix: bool = True):
+    """Selectable of message ids matching `query`, for use in .in_() filters
+
+    Falls back to an ILIKE scan when no native index is available.
+    """
+    if _backend and not tokenize(query):
+        return db.select(Message.id).where(db.false())
+    if _backend == 'fts5':
+        return text(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH :fts_match"
+        ).bindparams(fts_match=_fts5_query(query, prefix)).columns(rowid=db.Integer)
+    if _backend == 'tsvector':
+        return text(
+            "SELECT id FROM messages WHERE content_tsv @@ to_tsquery('pg_catalog.simple', :fts_query)"
+        ).bindparams(fts_query=_tsquery(query, prefix)).columns(id=db.Integer)
+    return db.select(Message.id).where(Message.content.ilike(f'%{query}%'))
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import time
+from services.full_text import full_text_backend, full_text_search
+from services.lexical_search import get_lexical_index
+from services.vector_search import get_vector_search_service
+
+# Shared across requests; each hybrid query runs its two stages here in parallel
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hybrid-search')
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict]], weights: Dict[str, float], k: int = 60) -> List[Dict]:
+    """Merge ranked result lists: score(d) = sum(weight / (k + rank))
+
+    Each entry keeps its per-stage rank and raw score so clients can see why
+    a message was returned.
+    """
+    fused: Dict[int, Dict] = {}
+    for stage, results in rankings.items():
+        weight = weights.get(stage, 1.0)
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result['message_id'], {
+                'message_id': result['message_id'],
+                'score': 0.0,
+                'ranks': {},
+                'stage_scores': {}
+            })
+            entry['score'] += weight / (k + rank)
+            entry['ranks'][stage] = rank
+            entry['stage_scores'][stage] = result['score']
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)
+
+
+def _timed(app, stage, user_id, query, limit):
+    with app.app_context():
+        started = time.perf_counter()
+        try:
+            if stage == 'lexical' and full_text_backend():
+                results = full_text_search(user_id, query, limit, prefix=False)
+            elif stage == 'lexical':
+                results = get_lexical_index().search(user_id, query, limit)
+            else:
+                results = get_vector_search_service().search(user_id, query, limit)
+            error = None
+        except Exception as e:
+            results = []
+            error = str(e)
+        return results, round((time.perf_counter() - started) * 1000, 2), error
+
+
+def hybrid_search(app, user_id: str, query: str, limit: int, weights: Dict[str, float],
+                  rrf_k: int = 60, candidates: int = 50) -> Dict:
+    """Run BM25 and vector search concurrently and fuse them with RRF"""
+    started = time.perf_counter()
+    depth = max(limit, candidates)
+    futures = {
+        stage: _executor.submit(_timed, app, stage, user_id, query, depth)
+        for stage in ('lexical', 'semantic')
+        if weights.get(stage, 0) > 0
+    }
+
+    rankings = {}
+    timings = {}
+    errors = {}
+    for stage, future in futures.items():
+        results, elapsed_ms, error = future.result()
+        rankings[stage] = results
+        timings[f'{stage}_ms'] = elapsed_ms
+        if error:
+            errors[stage] = error
+
+    fusion_started = time.perf_counter()
+    fused = reciprocal_rank_fusion(rankings, weights, k=rrf_k)[:limit]
+    timings['fusion_ms'] = round((time.perf_counter() - fusion_started) * 1000, 2)
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    return {'results': fused, 'timings': timings, 'errors': errors}
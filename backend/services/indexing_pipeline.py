@@ -0,0 +1,148 @@
+from typing import List, Optional, Tuple
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class IndexingPipeline:
+    """Background worker that embeds new messages in micro-batches
+
+    Requests call enqueue() and return immediately. A single worker thread
+    drains the bounded queue, waiting up to `max_wait` seconds to fill a
+    batch of `batch_size`, then does one encode + bulk upsert through the
+    shared VectorSearchService. When the queue is full, enqueue() blocks for
+    at most `enqueue_timeout` seconds and then drops the item; dropped
+    messages simply have no SearchIndex row and are picked up by
+    `flask embeddings reindex`.
+    """
+
+    def __init__(self, app, maxsize: int = 10000, batch_size: int = 64,
+                 max_wait: float = 0.5, enqueue_timeout: float = 0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'indexed': 0, 'failed': 0, 'dropped': 0, 'batches': 0}
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='indexing-pipeline', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, message_id: int, content: str, user_id: str) -> bool:
+        """Queue a message for indexing; returns False if it had to be dropped"""
+        if not content:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put((message_id, content, user_id), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Flush what is queued and stop the worker"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        """Block for one item, then gather more until the batch is full or max_wait passes"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        from models import db
+        from services.vector_search import get_vector_search_service
+
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            with self.app.app_context():
+                try:
+                    indexed = get_vector_search_service().index_messages(batch)
+                    self._count('indexed', indexed)
+                    self._count('batches')
+                except Exception as e:
+                    db.session.rollback()
+                    self._count('failed', len(batch))
+                    print(f"Warning: Indexing batch of {len(batch)} messages failed: {e}")
+                finally:
+                    db.session.remove()
+
+
+_pipeline: Optional[IndexingPipeline] = None
+
+
+def init_indexing_pipeline(app) -> IndexingPipeline:
+    """Create the process-wide pipeline for `app` (the worker starts on first enqueue)"""
+    global _pipeline
+    _pipeline = IndexingPipeline(
+        app,
+        maxsize=app.config['INDEXING_QUEUE_SIZE'],
+        batch_size=app.config['INDEXING_BATCH_SIZE'],
+        max_wait=app.config['INDEXING_MAX_WAIT']
+    )
+    return _pipeline
+
+
+def get_indexing_pipeline() -> Optional[IndexingPipeline]:
+    """The pipeline created by init_indexing_pipeline, if indexing is enabled"""
+    return _pipeline
+
+
+def enqueue_for_indexing(messages, user_id: str):
+    """Add Message rows to the lexical index and queue them for embedding"""
+    from services.lexical_search import get_lexical_index
+
+    get_lexical_index().add(user_id, [(message.id, message.content) for message in messages])
+    if _pipeline is None:
+        return
+    for message in messages:
+        _pipeline.enqueue(message.id, message.content, user_id)
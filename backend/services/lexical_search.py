@@ -0,0 +1,184 @@
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import math
+import re
+import threading
+import time
+from config import Config
+from models import db, Conversation, Message
+
+# Words, numbers and identifiers like snake_case names or E1234 error codes
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class UserLexicalIndex:
+    """In-memory inverted index over one user's messages, scored with BM25"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._terms: Dict[int, List[str]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, documents: Iterable[Tuple[int, str]]):
+        """Insert or replace (message_id, content) documents"""
+        with self._lock:
+            for message_id, content in documents:
+                self._remove_locked(message_id)
+                counts = Counter(tokenize(content))
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[message_id] = count
+                length = sum(counts.values())
+                self._lengths[message_id] = length
+                self._terms[message_id] = list(counts)
+                self._total_length += length
+
+    def remove(self, message_ids: Iterable[int]):
+        with self._lock:
+            for message_id in message_ids:
+                self._remove_locked(message_id)
+
+    def _remove_locked(self, message_id: int):
+        terms = self._terms.pop(message_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(message_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(message_id, 0)
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Top (message_id, BM25 score) pairs, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._lengths)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for message_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[message_id] / average_length)
+                    scores[message_id] = scores.get(message_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+class LexicalSearchIndex:
+    """Per-user BM25 indexes, built from the database on first use (LRU-bounded)
+
+    Best-effort fallback for the hybrid search lexical stage when the
+    database has no full-text index (services/full_text.py). Each process
+    keeps its own copy, updated only by its own writes, so messages written
+    through other workers or outside the indexing path can be missing or
+    stale. A user's index is therefore rebuilt once it is `max_age` seconds
+    old, and early (at most every `miss_rebuild_interval` seconds) when a
+    query matches nothing.
+    """
+
+    def __init__(self, max_users: int = 128, max_age: float = 300.0, miss_rebuild_interval: float = 10.0):
+        self._max_users = max_users
+        self.max_age = max_age
+        self.miss_rebuild_interval = miss_rebuild_interval
+        self._users: 'OrderedDict[str, UserLexicalIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def _get_loaded(self, user_id: str, max_age: Optional[float] = None) -> Optional[UserLexicalIndex]:
+        """The user's index, unless it isn't loaded or is older than `max_age` seconds"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return None
+            if max_age is not None and time.monotonic() - index.loaded_at > max_age:
+                return None
+            self._users.move_to_end(user_id)
+            return index
+
+    def _load(self, user_id: str, max_age: Optional[float] = None) -> UserLexicalIndex:
+        max_age = self.max_age if max_age is None else max_age
+        index = self._get_loaded(user_id, max_age)
+        if index is not None:
+            return index
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(user_id, threading.Lock())
+
+        with load_lock:
+            index = self._get_loaded(user_id, max_age)
+            if index is not None:
+                return index
+
+            index = UserLexicalIndex()
+            rows = db.session.query(Message.id, Message.content).join(
+                Conversation, Message.conversation_id == Conversation.id
+            ).filter(Conversation.user_id == user_id).yield_per(2000)
+            index.add(rows)
+
+            with self._lock:
+                self._users[user_id] = index
+                self._users.move_to_end(user_id)
+                while len(self._users) > self._max_users:
+                    evicted, _ = self._users.popitem(last=False)
+                    self._load_locks.pop(evicted, None)
+            return index
+
+    def add(self, user_id: str, documents: Iterable[Tuple[int, str]]):
+        """Index new messages if the user's index is loaded (otherwise the next load sees them)"""
+        index = self._get_loaded(user_id)
+        if index is not None:
+            index.add(documents)
+
+    def remove(self, user_id: str, message_ids: Iterable[int]):
+        index = self._get_loaded(user_id)
+        if index is not None:
+            index.remove(message_ids)
+
+    def search(self, user_id: str, query: str, limit: int = 10) -> List[Dict]:
+        """BM25-ranked matches for one user, shaped like VectorSearchService.search"""
+        matches = self._load(user_id).search(query, limit)
+        if not matches:
+            # The message may have been written by another process since the index was built
+            matches = self._load(user_id, max_age=self.miss_rebuild_interval).search(query, limit)
+        return [
+            {
+                'message_id': message_id,
+                'score': score
+            }
+            for message_id, score in matches
+        ]
+
+
+_index: Optional[LexicalSearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalSearchIndex:
+    """Return the process-wide lexical index"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalSearchIndex(
+                max_users=Config.LEXICAL_INDEX_MAX_USERS,
+                max_age=Config.LEXICAL_INDEX_MAX_AGE
+            )
+        return _index
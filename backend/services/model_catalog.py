@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+from config import Config
+from services.provider_clients import key_fingerprint
+
+# Background refreshes; a couple of threads is plenty for occasional list calls
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='model-catalog')
+
+
+class ModelCatalog:
+    """Per-(platform, API key) cache of the models a key can use
+
+    Fresh entries are served directly. Stale ones are still served while a
+    background refresh runs (stale-while-revalidate), and failed lookups are
+    remembered briefly so a bad key or an outage doesn't cost a round trip
+    on every request.
+    """
+
+    def __init__(self, ttl: float = 3600.0, stale_ttl: float = 86400.0, negative_ttl: float = 60.0,
+                 max_entries: int = 1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, Dict]' = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[tuple, threading.Lock] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, platform: str, api_key: str, fetch: Callable[[str], List[str]]) -> List[str]:
+        """Models for this key, or [] if listing is failing (callers fall back to defaults)"""
+        key = (platform, key_fingerprint(api_key))
+        entry = self._lookup(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry['fetched_at']
+            if entry['error'] is not None:
+                if age < self.negative_ttl:
+                    self.hits += 1
+                    return []
+            elif age < self.ttl:
+                self.hits += 1
+                return entry['models']
+            elif age < self.stale_ttl:
+                self.stale_hits += 1
+                # Don't retry a failing refresh on every request
+                if now - entry.get('failed_at', float('-inf')) >= self.negative_ttl:
+                    self._refresh_in_background(key, api_key, fetch)
+                return entry['models']
+
+        self.misses += 1
+        return self._fetch(key, api_key, fetch)['models']
+
+    def _lookup(self, key: tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: tuple, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._fetch_locks.pop(evicted, None)
+
+    def _fetch(self, key: tuple, api_key: str, fetch: Callable[[str], List[str]]) -> Dict:
+        """Fetch and store; concurrent callers for the same key share one upstream call"""
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+
+        with fetch_lock:
+            # Another thread may have just filled it
+            entry = self._lookup(key)
+            if entry is not None:
+                fresh_for = self.negative_ttl if entry['error'] else self.ttl
+                if time.monotonic() - entry['fetched_at'] < fresh_for:
+                    return entry
+
+            try:
+                entry = {'models': list(fetch(api_key)), 'error': None, 'fetched_at': time.monotonic()}
+            except Exception as e:
+                print(f"Warning: Could not list {key[0]} models: {e}")
+                previous = self._lookup(key)
+                if previous is not None and previous['error'] is None and \
+                        time.monotonic() - previous['fetched_at'] < self.stale_ttl:
+                    # Keep serving the last good list rather than forgetting it on a blip
+                    previous['failed_at'] = time.monotonic()
+                    return previous
+                entry = {'models': [], 'error': str(e), 'fetched_at': time.monotonic()}
+            self._store(key, entry)
+            return entry
+
+    def _refresh_in_background(self, key: tuple, api_key: str, fetch: Callable[[str], List[str]]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, api_key, fetch)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        _refresh_executor.submit(refresh)
+
+    def invalidate(self, platform: str, api_key: str):
+        with self._lock:
+            self._entries.pop((platform, key_fingerprint(api_key)), None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses
+            }
+
+
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_model_catalog() -> ModelCatalog:
+    """Return the process-wide model catalog"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog(
+                ttl=Config.MODEL_CATALOG_TTL,
+                stale_ttl=Config.MODEL_CATALOG_STALE_TTL,
+                negative_ttl=Config.MODEL_CATALOG_NEGATIVE_TTL
+            )
+        return _catalog
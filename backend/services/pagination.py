@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import func, tuple_
+from models import db
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we didn't issue"""
+
+
+def encode_cursor(updated_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past the row with this (updated_at, id)"""
+    payload = json.dumps([updated_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        updated_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(updated_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def keyset_page(query, updated_column, id_column, cursor: Optional[str], per_page: int,
+                fallback_column=None):
+    """One newest-first page of `query` after `cursor`, ordered by (updated_at, id)
+
+    Returns (rows, next_cursor); next_cursor is None on the last page. Each
+    page is a range scan on the (updated_at, id) index, so page 500 costs the
+    same as page 1. Rows should not have a NULL updated_at (upgrade_schema
+    backfills them); if the last row of a page does, its `fallback_column`
+    value goes in the cursor instead.
+    """
+    if cursor:
+        updated_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(updated_column, id_column) < tuple_(
+            db.literal(updated_at, updated_column.type), db.literal(row_id, id_column.type)
+        ))
+
+    # Fetch one extra row to learn whether another page exists without counting
+    rows = query.order_by(updated_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+
+    rows = rows[:per_page]
+    last = rows[-1]
+    updated_at = getattr(last, updated_column.key)
+    if updated_at is None and fallback_column is not None:
+        updated_at = getattr(last, fallback_column.key)
+    if updated_at is None:
+        updated_at = datetime.min
+    return rows, encode_cursor(updated_at, getattr(last, id_column.key))
+
+
+def capped_count(query, id_column, cap: int) -> Tuple[int, bool]:
+    """Count at most `cap` + 1 matching rows; returns (count, exact)
+
+    Past the cap the result is reported as an estimate instead of scanning
+    every matching row.
+    """
+    limited = query.order_by(None).with_entities(id_column).limit(cap + 1).subquery()
+    count = db.session.query(func.count()).select_from(limited).scalar()
+    if count > cap:
+        return cap, False
+    return count, True
@@ -0,0 +1,163 @@
+from collections import OrderedDict, namedtuple
+from typing import Dict, Optional
+import atexit
+import hashlib
+import os
+import threading
+import time
+import httpx
+import openai
+from anthropic import Anthropic, AsyncAnthropic
+import google.ai.generativelanguage as glm
+from config import Config
+
+# Per-key Gemini clients; genai.configure() is process-global and would leak keys across threads
+GoogleClients = namedtuple('GoogleClients', ['generative', 'models'])
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable id for an API key that is safe to keep in dict keys, logs and stats"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class ProviderClientPool:
+    """Reusable SDK clients keyed by (platform, API key), LRU-bounded with idle eviction
+
+    OpenAI and Anthropic clients for different keys share one httpx
+    connection pool per platform, so keep-alive connections survive across
+    users; credentials are sent per request, so keys never mix. Gemini
+    clients own their gRPC channel and are created per key.
+
+    Async clients (asynchronous=True) are cached separately and must only
+    be used from the async executor's event loop.
+    """
+
+    def __init__(self, max_clients: int = 256, idle_timeout: float = 600.0,
+                 max_connections: int = 100, max_keepalive: int = 20, timeout: float = 120.0):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._timeout = timeout
+        self._clients: 'OrderedDict[tuple, list]' = OrderedDict()  # key -> [client, last_used]
+        self._http: Dict[tuple, httpx.Client] = {}  # (platform, asynchronous) -> pool
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+
+    def get(self, platform: str, api_key: str, asynchronous: bool = False):
+        """Return the cached client for this key, creating it on first use"""
+        key = (platform, key_fingerprint(api_key), asynchronous)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+
+        # Build outside the lock; SDK constructors can be slow
+        client = self._create(platform, api_key, asynchronous)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                return entry[0]
+            self._clients[key] = [client, now]
+            self.created += 1
+            while len(self._clients) > self.max_clients:
+                # Dropped clients stay usable by requests already holding them
+                self._clients.popitem(last=False)
+                self.evicted += 1
+        return client
+
+    def _evict_idle(self, now: float):
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._clients[key]
+            self.evicted += 1
+
+    def _http_client(self, platform: str, asynchronous: bool = False):
+        with self._lock:
+            client = self._http.get((platform, asynchronous))
+            if client is None:
+                client_class = httpx.AsyncClient if asynchronous else httpx.Client
+                client = self._http[(platform, asynchronous)] = client_class(limits=self._limits, timeout=self._timeout)
+            return client
+
+    def _create(self, platform: str, api_key: str, asynchronous: bool = False):
+        http_client = self._http_client(platform, asynchronous) if platform in ('openai', 'anthropic') else None
+        # Retries happen in the provider gateway, which also honors rate limits
+        if platform == 'openai':
+            client_class = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+            return client_class(api_key=api_key, http_client=http_client, max_retries=0)
+        elif platform == 'anthropic':
+            client_class = AsyncAnthropic if asynchronous else Anthropic
+            return client_class(api_key=api_key, http_client=http_client, max_retries=0)
+        elif platform == 'google':
+            options = {'api_key': api_key}
+            if asynchronous:
+                return GoogleClients(
+                    generative=glm.GenerativeServiceAsyncClient(client_options=options),
+                    models=glm.ModelServiceAsyncClient(client_options=options)
+                )
+            return GoogleClients(
+                generative=glm.GenerativeServiceClient(client_options=options),
+                models=glm.ModelServiceClient(client_options=options)
+            )
+        else:
+            raise ValueError(f"Unsupported platform: {platform}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'created': self.created,
+                'evicted': self.evicted
+            }
+
+    def close(self):
+        """Drop every client and close the shared synchronous connection pools
+
+        Async pools belong to the executor's event loop and are released
+        with it.
+        """
+        with self._lock:
+            self._clients.clear()
+            http_clients = [client for (_, asynchronous), client in self._http.items() if not asynchronous]
+            self._http.clear()
+        for client in http_clients:
+            client.close()
+
+
+_pool: Optional[ProviderClientPool] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_provider_clients() -> ProviderClientPool:
+    """Return this process's client pool (rebuilt after fork; sockets can't be shared)"""
+    global _pool, _pool_pid
+
+    pool = _pool
+    if pool is not None and _pool_pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProviderClientPool(
+                max_clients=Config.PROVIDER_CLIENT_CACHE_SIZE,
+                idle_timeout=Config.PROVIDER_CLIENT_IDLE_TIMEOUT,
+                max_connections=Config.PROVIDER_MAX_CONNECTIONS,
+                max_keepalive=Config.PROVIDER_MAX_KEEPALIVE,
+                timeout=Config.PROVIDER_REQUEST_TIMEOUT
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+def shutdown_provider_clients():
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+
+atexit.register(shutdown_provider_clients)
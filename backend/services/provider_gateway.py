@@ -0,0 +1,350 @@
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import random
+import threading
+import time
+from config import Config
+from services.provider_clients import key_fingerprint
+
+T = TypeVar('T')
+
+# Statuses that mean "try again later" rather than "this request is wrong"
+UNAVAILABLE_STATUSES = {408, 500, 502, 503, 504, 529}
+
+
+class GatewayError(ValueError):
+    """The gateway refused to call the provider; retry_after says when trying again makes sense"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(GatewayError):
+    """The provider has been failing and calls to it are being skipped for now"""
+
+
+class RateLimitedError(GatewayError):
+    """This key and model are over their request rate for longer than the gateway will wait"""
+
+
+def error_status(e: Exception) -> Optional[int]:
+    """HTTP status of an OpenAI/Anthropic (status_code) or Google API (code) error"""
+    status = getattr(e, 'status_code', None)
+    if status is None:
+        status = getattr(e, 'code', None)
+    return int(status) if isinstance(status, int) else None
+
+
+def classify_error(e: Exception) -> str:
+    """'rate_limited', 'unavailable' (worth retrying, counts against the breaker) or 'fatal'"""
+    status = error_status(e)
+    if status == 429:
+        return 'rate_limited'
+    if status in UNAVAILABLE_STATUSES:
+        return 'unavailable'
+    # SDK connection and timeout errors have no status
+    if status is None and (isinstance(e, (ConnectionError, TimeoutError))
+                           or type(e).__name__ in ('APIConnectionError', 'APITimeoutError')):
+        return 'unavailable'
+    return 'fatal'
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """The provider's Retry-After hint (retry-after-ms, seconds or an HTTP date), if it sent one"""
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Request-rate limiter that halves its rate on upstream 429s and creeps back on success"""
+
+    def __init__(self, rate: float, capacity: float, min_rate: float):
+        self.base_rate = rate  # Tokens per second
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.slowed_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a token; returns how long to wait before using it, or None if that's over max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def slow_down(self):
+        with self._lock:
+            now = time.monotonic()
+            # Concurrent requests hit the same limit together; count that as one signal
+            if now - self.slowed_at < 1.0:
+                return
+            self.slowed_at = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop the burst allowance; the provider just said we're going too fast
+            self.tokens = min(self.tokens, 0.0)
+
+    def speed_up(self):
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures; one probe call after `reset_timeout`"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.transitions = {self.OPEN: 0, self.HALF_OPEN: 0, self.CLOSED: 0}
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def _move(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.transitions[state] += 1
+
+    def allow(self) -> Optional[float]:
+        """None if a call may go ahead, else seconds until the next probe"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if self.state == self.OPEN and remaining <= 0:
+                self._move(self.HALF_OPEN)
+                self._probing = False
+            # A probe that never reported back (e.g. a cancelled coroutine) stops blocking after reset_timeout
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started > self.reset_timeout):
+                self._probing = True
+                self._probe_started = now
+                return None
+            return max(remaining, 1.0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._move(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._move(self.OPEN)
+
+
+class ProviderGateway:
+    """Every provider request goes through call() / call_async()
+
+    - A token bucket per (platform, API key, model) spaces out requests and
+      adapts to the provider's 429s, so one user's burst waits briefly
+      instead of failing.
+    - Rate limits, 5xx and connection errors are retried with full-jitter
+      exponential backoff, never sooner than the provider's Retry-After.
+    - A circuit breaker per platform fails fast while the provider is down.
+    """
+
+    def __init__(self, rate_per_minute: float = 120, burst: float = 20, max_wait: float = 30.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0, max_buckets: int = 4096):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.max_buckets = max_buckets
+        self._buckets: 'OrderedDict[tuple, TokenBucket]' = OrderedDict()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, platform: str, api_key: str, model: str) -> TokenBucket:
+        key = (platform, key_fingerprint(api_key), model)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self.rate / 10)
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def _breaker(self, platform: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(platform)
+            if breaker is None:
+                breaker = self._breakers[platform] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def _count(self, platform: str, counter: str):
+        with self._lock:
+            counters = self._counters.setdefault(platform, {
+                'calls': 0, 'successes': 0, 'failures': 0, 'rate_limited': 0, 'retries': 0,
+                'throttled': 0, 'rejected': 0, 'short_circuited': 0
+            })
+            counters[counter] += 1
+
+    def _admit(self, platform: str, bucket: TokenBucket) -> float:
+        """Seconds to wait for a rate-limit token; raises RateLimitedError past max_wait"""
+        wait = bucket.reserve(self.max_wait)
+        if wait is None:
+            self._count(platform, 'rejected')
+            raise RateLimitedError(f"Too many {platform} requests for this API key, please retry shortly",
+                                   retry_after=self.max_wait)
+        if wait > 0:
+            self._count(platform, 'throttled')
+        return wait
+
+    def _check_breaker(self, platform: str, breaker: CircuitBreaker):
+        retry_after = breaker.allow()
+        if retry_after is not None:
+            self._count(platform, 'short_circuited')
+            raise CircuitOpenError(f"{platform} is unavailable, please retry in {retry_after:.0f}s",
+                                   retry_after=retry_after)
+        self._count(platform, 'calls')
+
+    def _succeeded(self, platform: str, bucket: TokenBucket, breaker: CircuitBreaker):
+        self._count(platform, 'successes')
+        breaker.record_success()
+        bucket.speed_up()
+
+    def _retry_delay(self, platform: str, bucket: TokenBucket, breaker: CircuitBreaker,
+                     e: Exception, attempt: int) -> Optional[float]:
+        """Record a failed call; returns the backoff before retrying, or None to give up"""
+        kind = classify_error(e)
+        if kind == 'rate_limited':
+            self._count(platform, 'rate_limited')
+            bucket.slow_down()
+            breaker.record_success()  # The provider is up, just busy
+        elif kind == 'unavailable':
+            self._count(platform, 'failures')
+            breaker.record_failure()
+        else:
+            breaker.record_success()  # The provider answered; the request itself was bad
+            return None
+
+        if attempt >= self.max_retries or breaker.state == CircuitBreaker.OPEN:
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = retry_after_seconds(e)
+        if retry_after is not None:
+            if retry_after > self.backoff_max:
+                return None  # Not worth holding the request that long
+            delay = max(delay, retry_after)
+        self._count(platform, 'retries')
+        return delay
+
+    def call(self, platform: str, api_key: str, model: str, request: Callable[[], T]) -> T:
+        """Run request() under the limits, retrying transient failures; re-raises the last error"""
+        bucket = self._bucket(platform, api_key, model)
+        breaker = self._breaker(platform)
+        attempt = 0
+        while True:
+            wait = self._admit(platform, bucket)
+            if wait:
+                time.sleep(wait)
+            self._check_breaker(platform, breaker)
+            try:
+                result = request()
+            except Exception as e:
+                delay = self._retry_delay(platform, bucket, breaker, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._succeeded(platform, bucket, breaker)
+            return result
+
+    async def call_async(self, platform: str, api_key: str, model: str, request: Callable[[], Awaitable[T]]) -> T:
+        """call() for coroutines; waits with asyncio.sleep so the event loop keeps running"""
+        bucket = self._bucket(platform, api_key, model)
+        breaker = self._breaker(platform)
+        attempt = 0
+        while True:
+            wait = self._admit(platform, bucket)
+            if wait:
+                await asyncio.sleep(wait)
+            self._check_breaker(platform, breaker)
+            try:
+                result = await request()
+            except Exception as e:
+                delay = self._retry_delay(platform, bucket, breaker, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(platform, bucket, breaker)
+            return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            platforms = {platform: dict(counters) for platform, counters in self._counters.items()}
+            breakers = dict(self._breakers)
+            buckets = len(self._buckets)
+        for platform, breaker in breakers.items():
+            entry = platforms.setdefault(platform, {})
+            entry['state'] = breaker.state
+            entry['transitions'] = dict(breaker.transitions)
+        return {'platforms': platforms, 'buckets': buckets}
+
+
+_gateway: Optional[ProviderGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_provider_gateway() -> ProviderGateway:
+    """Return the process-wide provider gateway"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ProviderGateway(
+                rate_per_minute=Config.PROVIDER_RATE_LIMIT_RPM,
+                burst=Config.PROVIDER_RATE_LIMIT_BURST,
+                max_wait=Config.PROVIDER_RATE_LIMIT_MAX_WAIT,
+                max_retries=Config.PROVIDER_MAX_RETRIES,
+                backoff_base=Config.PROVIDER_BACKOFF_BASE,
+                backoff_max=Config.PROVIDER_BACKOFF_MAX,
+                breaker_threshold=Config.PROVIDER_BREAKER_THRESHOLD,
+                breaker_reset=Config.PROVIDER_BREAKER_RESET
+            )
+        return _gateway
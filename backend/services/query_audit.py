@@ -0,0 +1,63 @@
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from typing import List
+import threading
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statement lists of the capture_queries() blocks active on each thread
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """An endpoint issued more SQL statements than its declared budget"""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    captures = getattr(_local, 'captures', None)
+    if captures:
+        for statements in captures:
+            statements.append((statement, parameters))
+
+
+@contextmanager
+def capture_queries():
+    """Collect (statement, parameters) for every query this thread runs inside the block"""
+    statements: List = []
+    captures = getattr(_local, 'captures', None)
+    if captures is None:
+        captures = _local.captures = []
+    captures.append(statements)
+    try:
+        yield statements
+    finally:
+        captures.remove(statements)
+
+
+def query_budget(limit: int):
+    """Fail the request if the view runs more than `limit` queries
+
+    Only enforced in debug mode or with QUERY_BUDGET_ENFORCED, so an N+1
+    regression shows up in development instead of production latency.
+    Place it under @require_auth so the user lookup isn't counted.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not (current_app.debug or current_app.config.get('QUERY_BUDGET_ENFORCED')):
+                return f(*args, **kwargs)
+            with capture_queries() as statements:
+                response = f(*args, **kwargs)
+            if len(statements) > limit:
+                # The most repeated statement is usually the N+1
+                repeated = Counter(statement for statement, _ in statements).most_common(3)
+                raise QueryBudgetExceeded(
+                    f"{f.__name__} ran {len(statements)} queries (budget {limit}); most repeated:\n"
+                    + '\n'.join(f"{count}x {statement}" for statement, count in repeated)
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import random
+import re
+from sqlalchemy import insert
+from models import db, User, Folder, Tag, Conversation, Message, conversation_tags
+from services.pagination import encode_cursor
+from services.query_audit import capture_queries
+
+AUDIT_USER_ID = 'demo_user_123'  # The user behind development mock tokens (routes/auth.py)
+AUDIT_HEADERS = {'Authorization': 'Bearer mock_token_audit'}
+
+# Tables that grow with usage; a full scan of any of these fails the audit
+LARGE_TABLES = {
+    'conversations', 'messages', 'conversation_tags', 'message_embeddings',
+    'search_index', 'embedding_cache'
+}
+
+# (method, path, json body) issued against the seeded database; {names} come from seed_database()
+AUDITED_REQUESTS = [
+    ('GET', '/api/conversations', None),
+    ('GET', '/api/conversations?include_total=true', None),
+    ('GET', '/api/conversations?cursor={cursor}', None),
+    ('GET', '/api/conversations?platform=anthropic', None),
+    ('GET', '/api/conversations?model=gpt-4', None),
+    ('GET', '/api/conversations?folder_id={folder_id}', None),
+    ('GET', '/api/conversations?tag_id={tag_id}', None),
+    ('GET', '/api/conversations?search=needle', None),
+    ('GET', '/api/conversations/{conversation_id}', None),
+    ('POST', '/api/conversations/compare', {'conversation_ids': '{conversation_ids}'}),
+    ('GET', '/api/export/conversation/{conversation_id}?format=markdown', None),
+    ('POST', '/api/export/bulk', {'conversation_ids': '{conversation_ids}', 'format': 'json'}),
+    ('GET', '/api/search/text?q=needle', None),
+    ('GET', '/api/stats', None),
+    ('GET', '/api/folders', None),
+    ('GET', '/api/tags', None),
+    ('DELETE', '/api/conversations/{conversation_id}', None),
+]
+
+_SCAN_PATTERN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?')
+_EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def seed_database(users: int = 20, conversations_per_user: int = 200, messages_per_conversation: int = 10,
+                  seed: int = 0) -> Dict:
+    """Fill an empty database with enough rows that the planner prefers indexes, and ANALYZE it
+
+    Returns the ids that AUDITED_REQUESTS paths are formatted with.
+    """
+    rng = random.Random(seed)
+    platforms = ['openai', 'anthropic', 'google']
+    models = ['gpt-4', 'claude-3-opus', 'gemini-pro']
+    base = datetime(2024, 1, 1)
+    user_ids = [AUDIT_USER_ID] + [f'audit_user_{i}' for i in range(1, users)]
+
+    db.session.execute(insert(User), [
+        {'id': user_id, 'email': f'{user_id}@example.com', 'name': user_id} for user_id in user_ids
+    ])
+    db.session.execute(insert(Folder), [
+        {'user_id': user_id, 'name': f'Folder {i}'} for user_id in user_ids for i in range(5)
+    ])
+    db.session.execute(insert(Tag), [
+        {'user_id': user_id, 'name': f'tag-{i}', 'color': '#888888'} for user_id in user_ids for i in range(5)
+    ])
+    folder_ids = {row.user_id: row.id for row in db.session.query(Folder.user_id, Folder.id)}
+    tag_ids = {row.user_id: row.id for row in db.session.query(Tag.user_id, Tag.id)}
+
+    conversation_rows = []
+    for user_id in user_ids:
+        for i in range(conversations_per_user):
+            index = rng.randrange(len(platforms))
+            updated_at = base + timedelta(minutes=rng.randrange(500000))
+            conversation_rows.append({
+                'user_id': user_id,
+                'folder_id': folder_ids[user_id] if i % 4 == 0 else None,
+                'title': f'Conversation {i}',
+                'platform': platforms[index],
+                'model': models[index],
+                'total_tokens': rng.randrange(10000),
+                'total_cost': 0,
+                'created_at': updated_at,
+                'updated_at': updated_at
+            })
+    db.session.execute(insert(Conversation), conversation_rows)
+
+    conversations = db.session.query(Conversation.id, Conversation.user_id, Conversation.updated_at).all()
+    db.session.execute(insert(conversation_tags), [
+        {'conversation_id': row.id, 'tag_id': tag_ids[row.user_id]} for row in conversations if row.id % 3 == 0
+    ])
+
+    words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel']
+    message_rows = []
+    for row in conversations:
+        for i in range(messages_per_conversation):
+            content = ' '.join(rng.choice(words) for _ in range(12))
+            if rng.random() < 0.01:
+                content += ' needle'
+            message_rows.append({
+                'conversation_id': row.id,
+                'role': 'user' if i % 2 == 0 else 'assistant',
+                'content': content,
+                'tokens': 12,
+                'cost': 0,
+                'created_at': row.updated_at + timedelta(seconds=i)
+            })
+        if len(message_rows) >= 10000:
+            db.session.execute(insert(Message), message_rows)
+            message_rows = []
+    if message_rows:
+        db.session.execute(insert(Message), message_rows)
+    db.session.commit()
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+    own = sorted((row for row in conversations if row.user_id == AUDIT_USER_ID),
+                 key=lambda row: (row.updated_at, row.id), reverse=True)
+    middle = own[len(own) // 2]
+    return {
+        'conversation_id': own[0].id,
+        'conversation_ids': [row.id for row in own[:10]],
+        'cursor': encode_cursor(middle.updated_at, middle.id),
+        'folder_id': folder_ids[AUDIT_USER_ID],
+        'tag_id': tag_ids[AUDIT_USER_ID]
+    }
+
+
+def _format(value, ids: Dict):
+    if isinstance(value, dict):
+        return {key: _format(item, ids) for key, item in value.items()}
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}') and value[1:-1] in ids:
+            return ids[value[1:-1]]
+        return value.format(**ids)
+    return value
+
+
+def explain(connection, statement: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for one captured statement"""
+    if isinstance(parameters, list):  # executemany: one parameter set is enough to plan
+        parameters = parameters[0] if parameters else ()
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: List[str], tables=LARGE_TABLES) -> List[str]:
+    """Plan lines that read a large table end to end (including full index scans)"""
+    scans = []
+    for line in plan:
+        match = _SCAN_PATTERN.match(line)
+        if match and match.group(1) in tables and 'VIRTUAL TABLE' not in line:
+            scans.append(line)
+    return scans
+
+
+def audit_query_plans(app, requests=AUDITED_REQUESTS, report: Optional[Callable[[str], None]] = None,
+                      **seed_options) -> List[Dict]:
+    """Issue each request against a freshly seeded SQLite database and collect full scans
+
+    Returns one {'request', 'status', 'queries', 'violations'} entry per
+    request; an empty 'violations' list everywhere means the audit passed.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('The query plan audit runs against a seeded SQLite database')
+
+    ids = seed_database(**seed_options)
+    client = app.test_client()
+    results = []
+
+    for method, path, body in requests:
+        path = _format(path, ids)
+        with capture_queries() as statements:
+            response = client.open(path, method=method, json=_format(body, ids), headers=AUDIT_HEADERS)
+
+        violations = []
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+                    continue
+                plan = explain(connection, statement, parameters)
+                scans = full_scans(plan)
+                if scans:
+                    violations.append({'statement': statement, 'plan': plan, 'scans': scans})
+
+        results.append({
+            'request': f'{method} {path}',
+            'status': response.status_code,
+            'queries': len(statements),
+            'violations': violations
+        })
+        if report:
+            state = 'FAIL' if violations or response.status_code >= 400 else 'ok'
+            report(f"{state:4} {method} {path} ({response.status_code}, {len(statements)} queries)")
+            for violation in violations:
+                report(f"     {' '.join(violation['statement'].split())}")
+                for line in violation['scans']:
+                    report(f"       -> {line}")
+
+    return results
@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+import multiprocessing
+import os
+import time
+import numpy as np
+from sqlalchemy import and_
+from config import Config
+from models import db, Conversation, Message, SearchIndex
+
+# Per-process embedding model for pool workers
+_worker_model = None
+
+
+def _init_encoder(model_name: str):
+    """Pool initializer: load the model once per worker process"""
+    global _worker_model
+    # Each process gets one core's worth of BLAS threads; the pool provides the parallelism
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_chunk(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.encode(texts, batch_size=64), dtype=np.float32)
+
+
+def iter_unindexed_chunks(chunk_size: int, restart: bool = False,
+                          user_id: Optional[str] = None) -> Iterator[List[Tuple[int, str, str]]]:
+    """Keyset-paginate (message_id, content, user_id) rows still needing embeddings
+
+    A message counts as done when it has a SearchIndex row for the current
+    embedding model, so a crashed run resumes where it stopped and a model
+    change re-embeds everything. `restart` ignores existing progress.
+    """
+    last_id = 0
+    while True:
+        query = db.session.query(Message.id, Message.content, Conversation.user_id).join(
+            Conversation, Message.conversation_id == Conversation.id
+        ).filter(Message.id > last_id)
+
+        if not restart:
+            query = query.outerjoin(
+                SearchIndex,
+                and_(SearchIndex.message_id == Message.id, SearchIndex.model == Config.EMBEDDING_MODEL)
+            ).filter(SearchIndex.id.is_(None))
+        if user_id:
+            query = query.filter(Conversation.user_id == user_id)
+
+        rows = query.order_by(Message.id.asc()).limit(chunk_size).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [(message_id, content, owner) for message_id, content, owner in rows if content]
+
+
+def reindex_messages(service, chunk_size: int = 1000, workers: int = 1, restart: bool = False,
+                     user_id: Optional[str] = None, report: Callable[[str], None] = print) -> int:
+    """Embed and upsert every unindexed message, returning how many were indexed
+
+    With workers > 1 chunks are encoded in a spawn-based process pool while
+    the main process keeps paging rows and upserting finished chunks.
+    """
+    started = time.perf_counter()
+    total = 0
+
+    def upsert(chunk, vectors):
+        nonlocal total
+        total += service.upsert_embeddings([(message_id, owner) for message_id, _, owner in chunk], vectors)
+        db.session.expunge_all()
+        elapsed = time.perf_counter() - started
+        report(f"Indexed {total} messages (up to message {chunk[-1][0]}), {total / elapsed:.1f} messages/s")
+
+    chunks = iter_unindexed_chunks(chunk_size, restart=restart, user_id=user_id)
+
+    if workers <= 1:
+        for chunk in chunks:
+            if chunk:
+                upsert(chunk, service.encode([content for _, content, _ in chunk]))
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_encoder, initargs=(Config.EMBEDDING_MODEL,)) as pool:
+            cache = service.embedding_cache
+            in_flight = []
+            
+            def finish(chunk, cached, missing, future):
+                vectors = cached
+                if future is not None:
+                    encoded = future.result()
+                    cache.store([chunk[i][1] for i in missing], encoded)
+                    for row, i in enumerate(missing):
+                        vectors[i] = encoded[row]
+                upsert(chunk, np.stack(vectors))
+            
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                # Only content the cache hasn't seen goes to the pool
+                cached = cache.lookup([content for _, content, _ in chunk])
+                missing = [i for i, vector in enumerate(cached) if vector is None]
+                future = pool.submit(_encode_chunk, [chunk[i][1] for i in missing]) if missing else None
+                in_flight.append((chunk, cached, missing, future))
+                # Keep the pool busy but bound memory to two chunks per worker
+                while len(in_flight) >= workers * 2:
+                    finish(*in_flight.pop(0))
+            for item in in_flight:
+                finish(*item)
+
+    elapsed = time.perf_counter() - started
+    report(f"Done. {total} messages indexed in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} messages/s)")
+    return total
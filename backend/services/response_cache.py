@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import hashlib
+import json
+import threading
+from config import Config
+from models import db, ResponseCacheEntry, insert_ignore
+
+
+def normalize_messages(messages: List[Dict]) -> List[Dict]:
+    """Messages with line endings and surrounding whitespace normalized, so trivially different prompts share a key"""
+    return [
+        {'role': msg['role'], 'content': msg['content'].replace('\r\n', '\n').strip()}
+        for msg in messages
+    ]
+
+
+def cache_key(user_id: str, platform: str, model: str, messages: List[Dict], parameters: Optional[Dict] = None) -> str:
+    """Key of one user's exact request; users never share entries, since replies can carry private context"""
+    payload = json.dumps({
+        'user_id': user_id,
+        'platform': platform,
+        'model': model,
+        'messages': normalize_messages(messages),
+        'parameters': parameters or {}
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two-level cache of provider replies keyed by cache_key()
+
+    Level one is an in-process LRU bounded to `max_entries` replies; level
+    two is the response_cache table, shared by every worker and kept across
+    restarts. Both levels expire entries `ttl` seconds after the original
+    call. Only exact (normalized) matches hit, so it suits templated and
+    regression prompts rather than free-form chat.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400.0, persist: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def _remember(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, key: str, user_id: str) -> Optional[Dict]:
+        """The cached reply ({'content', 'tokens', 'cost', 'metadata', 'cached_at', 'tier'}) or None"""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['user_id'] == user_id:
+                if entry['expires_at'] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return dict(entry, tier='memory')
+                del self._entries[key]
+
+        if self.persist:
+            row = ResponseCacheEntry.query.filter(
+                ResponseCacheEntry.cache_key == key,
+                ResponseCacheEntry.user_id == user_id,
+                ResponseCacheEntry.expires_at > now
+            ).first()
+            if row is not None:
+                entry = {
+                    'user_id': row.user_id,
+                    'content': row.content,
+                    'tokens': row.tokens,
+                    'cost': float(row.cost) if row.cost is not None else None,
+                    'metadata': json.loads(row.response_metadata) if row.response_metadata else {},
+                    'cached_at': row.created_at,
+                    'expires_at': row.expires_at
+                }
+                self._remember(key, entry)
+                with self._lock:
+                    self._stats['db_hits'] += 1
+                return dict(entry, tier='database')
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def store(self, key: str, user_id: str, platform: str, model: str, response_data: Dict, session=None):
+        """Cache a provider reply in both levels
+
+        The row is written in `session` (default db.session) and commits
+        with the caller's transaction.
+        """
+        now = datetime.utcnow()
+        entry = {
+            'user_id': user_id,
+            'content': response_data['content'],
+            'tokens': response_data.get('tokens'),
+            'cost': response_data.get('cost'),
+            'metadata': response_data.get('metadata', {}),
+            'cached_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl)
+        }
+        self._remember(key, entry)
+        if not self.persist:
+            return
+
+        session = session or db.session
+        try:
+            # A savepoint, so a failed write can't spoil the caller's transaction
+            with session.begin_nested():
+                # An expired row for this key would make the insert a no-op
+                session.query(ResponseCacheEntry).filter(
+                    ResponseCacheEntry.cache_key == key,
+                    ResponseCacheEntry.expires_at <= now
+                ).delete(synchronize_session=False)
+                insert_ignore(ResponseCacheEntry.__table__, [{
+                    'cache_key': key,
+                    'user_id': user_id,
+                    'platform': platform,
+                    'model': model,
+                    'content': entry['content'],
+                    'tokens': entry['tokens'],
+                    'cost': entry['cost'],
+                    'response_metadata': json.dumps(entry['metadata']),
+                    'created_at': now,
+                    'expires_at': entry['expires_at']
+                }], session=session)
+        except Exception as e:
+            print(f"Warning: Could not persist response cache entry: {e}")
+
+    def prune(self) -> int:
+        """Delete expired rows, and ones no user can hit, from the response_cache table; returns how many"""
+        deleted = ResponseCacheEntry.query.filter(db.or_(
+            ResponseCacheEntry.expires_at <= datetime.utcnow(),
+            ResponseCacheEntry.user_id.is_(None)
+        )).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                max_entries=Config.RESPONSE_CACHE_SIZE,
+                ttl=Config.RESPONSE_CACHE_TTL,
+                persist=Config.RESPONSE_CACHE_PERSIST
+            )
+        return _cache
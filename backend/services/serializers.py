@@ -0,0 +1,119 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List
+from flask.json.provider import DefaultJSONProvider
+from models import db, Conversation, Message, Tag, conversation_tags
+
+# Optional fast JSON encoder
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+# Columns read for list/export views; plain rows skip ORM identity-map and relationship setup
+CONVERSATION_COLUMNS = (
+    Conversation.id, Conversation.title, Conversation.platform, Conversation.model,
+    Conversation.folder_id, Conversation.total_tokens, Conversation.total_cost,
+    Conversation.created_at, Conversation.updated_at
+)
+MESSAGE_COLUMNS = (
+    Message.id, Message.conversation_id, Message.role, Message.content,
+    Message.tokens, Message.cost, Message.created_at
+)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib for anything it can't encode"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs.get('indent') or kwargs.get('cls'):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def load_conversation_rows(user_id: str, conversation_ids: Iterable[int]) -> List:
+    """Column rows for the user's conversations among `conversation_ids`"""
+    return db.session.query(*CONVERSATION_COLUMNS).filter(
+        Conversation.id.in_(list(conversation_ids)),
+        Conversation.user_id == user_id
+    ).all()
+
+
+def load_tags(conversation_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Tags for many conversations in one query"""
+    tags = defaultdict(list)
+    if not conversation_ids:
+        return tags
+    rows = db.session.query(
+        conversation_tags.c.conversation_id, Tag.id, Tag.name, Tag.color
+    ).join(Tag, Tag.id == conversation_tags.c.tag_id).filter(
+        conversation_tags.c.conversation_id.in_(conversation_ids)
+    ).order_by(Tag.id)
+    for conversation_id, tag_id, name, color in rows:
+        tags[conversation_id].append({'id': tag_id, 'name': name, 'color': color})
+    return tags
+
+
+def load_messages(conversation_ids: List[int]) -> Dict[int, List]:
+    """Message rows for many conversations in one query, oldest first"""
+    messages = defaultdict(list)
+    if not conversation_ids:
+        return messages
+    rows = db.session.query(*MESSAGE_COLUMNS).filter(
+        Message.conversation_id.in_(conversation_ids)
+    ).order_by(Message.conversation_id, Message.created_at, Message.id)
+    for row in rows:
+        messages[row.conversation_id].append(row)
+    return messages
+
+
+def serialize_message(message) -> Dict:
+    return {
+        'id': message.id,
+        'role': message.role,
+        'content': message.content,
+        'tokens': message.tokens,
+        'cost': float(message.cost) if message.cost else 0,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def serialize_conversations(conversations: List, include_messages: bool = False) -> List[Dict]:
+    """Serialize conversations (ORM objects or column rows) with batched tag/message loads
+
+    Costs one query for tags plus one for messages however many
+    conversations are passed in.
+    """
+    conversation_ids = [conversation.id for conversation in conversations]
+    tags = load_tags(conversation_ids)
+    messages = load_messages(conversation_ids) if include_messages else None
+
+    results = []
+    for conversation in conversations:
+        data = {
+            'id': conversation.id,
+            'title': conversation.title,
+            'platform': conversation.platform,
+            'model': conversation.model,
+            'folder_id': conversation.folder_id,
+            'total_tokens': conversation.total_tokens,
+            'total_cost': float(conversation.total_cost) if conversation.total_cost else 0,
+            'tags': tags.get(conversation.id, []),
+            'created_at': conversation.created_at.isoformat(),
+            'updated_at': conversation.updated_at.isoformat()
+        }
+        if messages is not None:
+            data['messages'] = [serialize_message(message) for message in messages.get(conversation.id, [])]
+        results.append(data)
+    return results
+
+
+def serialize_conversation(conversation, include_messages: bool = False) -> Dict:
+    return serialize_conversations([conversation], include_messages=include_messages)[0]
@@ -1,5 +1,14 @@
+from flask import current_app
 from config import Config
-from models import db, Message, SearchIndex
+from models import db, Message, MessageEmbedding, SearchIndex
+from services.vector_store import InMemoryVectorStore, QuantizedVectorMatrix, pack_embedding, unpack_embeddings
+from services.ann_index import LocalANNStore
+from services.embedding_cache import EmbeddingCache
+from datetime import datetime
+import atexit
+import os
+import threading
+import time
 import numpy as np
 
 # Optional imports for vector search
@@ -11,19 +20,39 @@ except ImportError:
     SentenceTransformer = None
 
 class VectorSearchService:
-    """Service for vector/semantic search"""
+    """Service for vector/semantic search
+
+    Loading the embedding model and connecting to the vector store is
+    expensive, so routes should use get_vector_search_service() rather than
+    constructing this class per request.
+    """
     
     def __init__(self):
+        self.use_in_memory = False
+        self.index = None
+        self.qdrant_client = None
+        self._embedding_model = None
+        self._model_failed_at = None
+        self._model_lock = threading.Lock()
         if SENTENCE_TRANSFORMERS_AVAILABLE:
-            try:
-                self.embedding_model = SentenceTransformer(Config.EMBEDDING_MODEL)
-            except Exception as e:
-                print(f"Warning: Could not load embedding model: {e}")
-                self.embedding_model = None
+            self._load_model()
         else:
-            self.embedding_model = None
             print("Warning: sentence-transformers not available. Vector search disabled.")
         self.provider = Config.VECTOR_SEARCH_PROVIDER
+        self.memory_store = InMemoryVectorStore(
+            self._load_user_embeddings,
+            max_users=Config.VECTOR_MEMORY_MAX_USERS,
+            quantization=Config.VECTOR_QUANTIZATION,
+            rescore_loader=self._load_embeddings_by_id,
+            rescore_candidates=Config.VECTOR_RESCORE_CANDIDATES
+        )
+        self.ann_store = get_local_ann_store()
+        self.embedding_cache = EmbeddingCache(
+            Config.EMBEDDING_MODEL,
+            max_entries=Config.EMBEDDING_CACHE_SIZE,
+            persist=Config.EMBEDDING_CACHE_PERSIST,
+            ttl=Config.EMBEDDING_CACHE_TTL
+        )
         
         if self.provider == 'pinecone':
             self._init_pinecone()
@@ -33,6 +62,70 @@ class VectorSearchService:
             # Fallback to in-memory search
             self.use_in_memory = True
     
+    def _load_model(self):
+        try:
+            self._embedding_model = SentenceTransformer(Config.EMBEDDING_MODEL)
+            self._model_failed_at = None
+        except Exception as e:
+            print(f"Warning: Could not load embedding model: {e}")
+            self._model_failed_at = time.monotonic()
+    
+    @property
+    def embedding_model(self):
+        """The SentenceTransformer, or None; a failed load is retried every EMBEDDING_MODEL_RETRY_INTERVAL seconds"""
+        if self._embedding_model is None and self._model_failed_at is not None:
+            if time.monotonic() - self._model_failed_at >= Config.EMBEDDING_MODEL_RETRY_INTERVAL:
+                if self._model_lock.acquire(blocking=False):
+                    try:
+                        if self._embedding_model is None:
+                            self._load_model()
+                    finally:
+                        self._model_lock.release()
+        return self._embedding_model
+    
+    def health(self) -> dict:
+        """Report whether the model is loaded and the vector store is reachable"""
+        store_ok = True
+        store_error = None
+        if self.provider == 'qdrant' and not self.use_in_memory:
+            try:
+                self.qdrant_client.get_collection(Config.PINECONE_INDEX_NAME)
+            except Exception as e:
+                store_ok = False
+                store_error = e
+        elif self.provider == 'pinecone' and not self.use_in_memory:
+            try:
+                self.index.describe_index_stats()
+            except Exception as e:
+                store_ok = False
+                store_error = e
+        if store_error is not None:
+            # Details go to the log only; this endpoint is unauthenticated
+            print(f"Warning: Vector store health check failed: {store_error}")
+            store_error = type(store_error).__name__
+        
+        model_loaded = self.embedding_model is not None
+        return {
+            'ready': model_loaded and store_ok,
+            'model_loaded': model_loaded,
+            'model': Config.EMBEDDING_MODEL,
+            'provider': 'local' if self.use_in_memory else self.provider,
+            'store_ok': store_ok,
+            'store_error': store_error,
+            'embedding_cache': self.embedding_cache.stats(),
+            'quantization': self.memory_store.quantization,
+            'resident_vector_bytes': self.memory_store.resident_bytes()
+        }
+    
+    def close(self):
+        """Release vector store connections"""
+        if self.qdrant_client is not None:
+            try:
+                self.qdrant_client.close()
+            except Exception as e:
+                print(f"Warning: Could not close Qdrant client: {e}")
+            self.qdrant_client = None
+    
     def _init_pinecone(self):
         """Initialize Pinecone client"""
         try:
@@ -77,39 +170,116 @@ class VectorSearchService:
     
     def index_message(self, message_id: int, content: str, user_id: str):
         """Index a message for search"""
-        if not self.embedding_model:
-            return  # Vector search not available
-        embedding = self.embedding_model.encode(content).tolist()
+        self.index_messages([(message_id, content, user_id)])
+    
+    def index_messages(self, items) -> int:
+        """Index a batch of (message_id, content, user_id) with one encode call
+        
+        Returns the number of messages indexed.
+        """
+        if not self.embedding_model or not items:
+            return 0  # Vector search not available
+        vectors = self.encode([content for _, content, _ in items])
+        return self.upsert_embeddings(
+            [(message_id, user_id) for message_id, _, user_id in items],
+            vectors
+        )
+    
+    def encode(self, texts, persist: bool = True) -> np.ndarray:
+        """Embed texts, skipping the model for content seen before (see EmbeddingCache.encode)"""
+        return self.embedding_cache.encode(
+            list(texts),
+            lambda missing: self.embedding_model.encode(missing),
+            persist=persist
+        )
+    
+    def upsert_embeddings(self, keys, vectors: np.ndarray) -> int:
+        """Write precomputed vectors for (message_id, user_id) keys to the provider"""
+        if not keys:
+            return 0
         
         if self.provider == 'pinecone' and not self.use_in_memory:
-            self.index.upsert([(str(message_id), embedding)])
+            self.index.upsert([
+                (str(message_id), vector.tolist(), {'user_id': user_id})
+                for (message_id, user_id), vector in zip(keys, vectors)
+            ])
         elif self.provider == 'qdrant' and not self.use_in_memory:
             self.qdrant_client.upsert(
                 collection_name=Config.PINECONE_INDEX_NAME,
                 points=[{
                     'id': message_id,
-                    'vector': embedding,
+                    'vector': vector.tolist(),
                     'payload': {'user_id': user_id}
-                }]
+                } for (message_id, user_id), vector in zip(keys, vectors)]
             )
         else:
-            # Store in database
-            message = Message.query.get(message_id)
-            if message:
-                message.embedding = embedding
-                db.session.commit()
+            # Store packed float32 bytes in the database
+            existing = set(row.id for row in db.session.query(Message.id).filter(
+                Message.id.in_([message_id for message_id, _ in keys])
+            ))
+            rows = [(key, vector) for key, vector in zip(keys, vectors) if key[0] in existing]
+            keys = [key for key, _ in rows]
+            vectors = np.asarray([vector for _, vector in rows], dtype=np.float32)
+            for (message_id, user_id), vector in rows:
+                db.session.merge(MessageEmbedding(
+                    message_id=message_id,
+                    user_id=user_id,
+                    model=Config.EMBEDDING_MODEL,
+                    dim=vector.shape[0],
+                    vector=pack_embedding(vector)
+                ))
+        
+        self._record_progress(keys)
+        db.session.commit()
+        
+        if self.use_in_memory:
+            by_user = {}
+            for row, (message_id, user_id) in enumerate(keys):
+                by_user.setdefault(user_id, []).append(row)
+            for user_id, rows in by_user.items():
+                message_ids = [keys[row][0] for row in rows]
+                if not self.ann_store.add(user_id, message_ids, vectors[rows]):
+                    self.memory_store.add(user_id, message_ids, vectors[rows])
+        
+        return len(keys)
+    
+    def _record_progress(self, keys):
+        """Upsert SearchIndex rows marking these messages as indexed"""
+        message_ids = [message_id for message_id, _ in keys]
+        existing = {
+            row.message_id: row
+            for row in SearchIndex.query.filter(SearchIndex.message_id.in_(message_ids))
+        }
+        provider = 'local' if self.use_in_memory else self.provider
+        for message_id, user_id in keys:
+            row = existing.get(message_id)
+            if row is None:
+                row = SearchIndex(message_id=message_id, user_id=user_id)
+                db.session.add(row)
+            row.vector_id = str(message_id)
+            row.provider = provider
+            row.model = Config.EMBEDDING_MODEL
+            row.indexed_at = datetime.utcnow()
+    
+    def remove_messages(self, user_id: str, message_ids):
+        """Drop deleted messages from the local indexes"""
+        message_ids = list(message_ids)
+        self.memory_store.remove(user_id, message_ids)
+        self.ann_store.remove(user_id, message_ids)
     
     def search(self, user_id: str, query: str, limit: int = 10):
         """Search for similar messages"""
         if not self.embedding_model:
             return []  # Vector search not available
-        query_embedding = self.embedding_model.encode(query).tolist()
+        # Queries stay in the in-process cache; only indexing writes embedding_cache rows
+        query_embedding = self.encode([query], persist=False)[0].tolist()
         
         if self.provider == 'pinecone' and not self.use_in_memory:
             results = self.index.query(
                 vector=query_embedding,
                 top_k=limit,
-                include_metadata=True
+                include_metadata=True,
+                filter={'user_id': user_id}
             )
             return [
                 {
@@ -137,30 +307,146 @@ class VectorSearchService:
             ]
         
         else:
-            # In-memory search using database embeddings
-            messages = Message.query.join(Message.conversation).filter(
-                Message.embedding.isnot(None)
-            ).all()
-            
-            if not messages:
-                return []
-            
-            # Calculate cosine similarity
-            query_vec = np.array(query_embedding)
-            results = []
-            
-            for msg in messages:
-                if msg.embedding:
-                    msg_vec = np.array(msg.embedding)
-                    similarity = np.dot(query_vec, msg_vec) / (
-                        np.linalg.norm(query_vec) * np.linalg.norm(msg_vec)
-                    )
-                    results.append({
-                        'message_id': msg.id,
-                        'score': float(similarity)
-                    })
-            
-            # Sort by score and return top results
-            results.sort(key=lambda x: x['score'], reverse=True)
-            return results[:limit]
+            # Local search: ANN shard for large histories, exact matrix otherwise
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            shard = self.ann_store.get(user_id, dim=query_vector.shape[-1])
+            if shard is not None:
+                matches = shard.search(query_vector, limit)
+            else:
+                matches = self.memory_store.search(user_id, query_vector, limit)
+                self._maybe_build_ann(user_id)
+            return [
+                {
+                    'message_id': message_id,
+                    'score': score
+                }
+                for message_id, score in matches
+            ]
+    
+    def _maybe_build_ann(self, user_id: str):
+        """Move a user to an ANN shard once their exact matrix gets large"""
+        if not Config.LOCAL_ANN_ENABLED:
+            return
+        matrix = self.memory_store.get(user_id)
+        if matrix is None or len(matrix) < self.ann_store.min_rows:
+            return
+        if isinstance(matrix, QuantizedVectorMatrix):
+            # Only codes are resident; the shard needs full-precision vectors
+            ids, vectors = self._load_user_embeddings(user_id)
+            built_ids = np.asarray(ids, dtype=np.int64)
+        else:
+            ids, vectors = matrix.snapshot()
+            built_ids, vectors = ids.copy(), vectors.copy()
+        app = current_app._get_current_object()
+        
+        def catch_up(shard):
+            # The matrix kept taking writes during the build; forward the difference
+            # to the shard's log, then drop the matrix to free memory
+            current_ids, _ = matrix.snapshot()
+            added_ids = current_ids[~np.isin(current_ids, built_ids)]
+            if len(added_ids):
+                with app.app_context():
+                    added_ids, added_vectors = self._load_embeddings_by_id(user_id, added_ids.tolist())
+                shard.append(added_ids, added_vectors)
+            shard.delete(built_ids[~np.isin(built_ids, current_ids)])
+            self.memory_store.invalidate(user_id)
+        
+        self.ann_store.build_in_background(user_id, built_ids, vectors, on_built=catch_up)
+    
+    def _load_embeddings_by_id(self, user_id: str, message_ids):
+        """Full-precision vectors for specific messages (used for rescoring)"""
+        dim = self.embedding_model.get_sentence_embedding_dimension()
+        rows = db.session.query(MessageEmbedding.message_id, MessageEmbedding.vector).filter(
+            MessageEmbedding.user_id == user_id,
+            MessageEmbedding.message_id.in_(list(message_ids)),
+            MessageEmbedding.model == Config.EMBEDDING_MODEL,
+            MessageEmbedding.dim == dim
+        ).all()
+        return [message_id for message_id, _ in rows], unpack_embeddings([vector for _, vector in rows], dim)
+    
+    def _load_user_embeddings(self, user_id: str):
+        """Load (message_ids, vectors) for one user's embedded messages"""
+        dim = self.embedding_model.get_sentence_embedding_dimension()
+        rows = db.session.query(MessageEmbedding.message_id, MessageEmbedding.vector).join(
+            Message, Message.id == MessageEmbedding.message_id
+        ).filter(
+            MessageEmbedding.user_id == user_id,
+            MessageEmbedding.model == Config.EMBEDDING_MODEL,
+            MessageEmbedding.dim == dim
+        ).all()
+        
+        message_ids = [message_id for message_id, _ in rows]
+        vectors = unpack_embeddings([vector for _, vector in rows], dim)
+        return message_ids, vectors
+
+
+_ann_store = None
+_ann_store_lock = threading.Lock()
+
+def get_local_ann_store() -> LocalANNStore:
+    """Return the process-wide on-disk ANN shard store (cheap; no model load)"""
+    global _ann_store
+    with _ann_store_lock:
+        if _ann_store is None:
+            _ann_store = LocalANNStore(
+                Config.LOCAL_INDEX_DIR,
+                nprobe=Config.LOCAL_ANN_NPROBE,
+                min_rows=Config.LOCAL_ANN_MIN_ROWS,
+                model=Config.EMBEDDING_MODEL
+            )
+        return _ann_store
+
+def discard_message_vectors(user_id: str, message_ids):
+    """Remove deleted messages from local (vector and lexical) indexes without loading the model"""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    service = _service
+    if service is not None and _service_pid == os.getpid():
+        service.remove_messages(user_id, message_ids)
+    else:
+        get_local_ann_store().remove(user_id, message_ids)
+    
+    from services.lexical_search import get_lexical_index
+    get_lexical_index().remove(user_id, message_ids)
+
+# Process-wide service instance. Each worker process builds its own on first
+# use (the pid check covers servers that fork after the module is imported).
+_service = None
+_service_pid = None
+_service_lock = threading.Lock()
+
+def get_vector_search_service() -> VectorSearchService:
+    """Return the shared VectorSearchService, creating it on first use"""
+    global _service, _service_pid
+    
+    service = _service
+    if service is not None and _service_pid == os.getpid():
+        return service
+    
+    with _service_lock:
+        if _service is None or _service_pid != os.getpid():
+            _service = VectorSearchService()
+            _service_pid = os.getpid()
+        return _service
+
+def preload_vector_search_service():
+    """Warm the shared service in the background so the first query is fast"""
+    thread = threading.Thread(
+        target=get_vector_search_service,
+        name='vector-search-preload',
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+def shutdown_vector_search_service():
+    """Close the shared service's connections (registered with atexit)"""
+    global _service, _service_pid
+    with _service_lock:
+        if _service is not None and _service_pid == os.getpid():
+            _service.close()
+        _service = None
+        _service_pid = None
 
+atexit.register(shutdown_vector_search_service)
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+
+# Importing app.py builds an app from the environment, so point it at a scratch database first
+_scratch = tempfile.mkdtemp(prefix='ai-chat-tests-')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(_scratch, 'import.db')}"
+os.environ.pop('DATABASE_URL', None)
+os.environ.setdefault('INDEXING_ENABLED', 'false')
+os.environ.setdefault('BATCH_ENABLED', 'false')
+os.environ.setdefault('VECTOR_SEARCH_PRELOAD', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        QUERY_BUDGET_ENFORCED = True
+
+    app = create_app(TestConfig)
+    yield app
+    with app.app_context():
+        from models import db
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """Each test gets a new database and new keys, so process-wide caches must start empty"""
+    from services import api_key_cache, auth_cache, lexical_search, model_catalog, provider_gateway, response_cache
+
+    for module, name in ((auth_cache, '_token_cache'), (auth_cache, '_user_cache'), (api_key_cache, '_cache'),
+                         (response_cache, '_cache'), (lexical_search, '_index'), (provider_gateway, '_gateway'),
+                         (model_catalog, '_catalog')):
+        monkeypatch.setattr(module, name, None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
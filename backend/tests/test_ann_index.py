@@ -0,0 +1,112 @@
+"""IVF shards on disk: build, log appends and deletes, cross-process refresh and compaction"""
+import os
+import numpy as np
+import pytest
+from services.ann_index import IVFShard
+
+DIM = 16
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def exhaustive(shard):
+    """Search every inverted list so results are exact"""
+    return lambda query, limit: shard.search(query, limit, nprobe=len(shard.centroids))
+
+
+@pytest.fixture
+def shard_path(tmp_path):
+    return os.path.join(tmp_path, 'shard')
+
+
+@pytest.fixture
+def shard(shard_path):
+    return IVFShard.build(shard_path, np.arange(1, 401), random_vectors(400), model='test-embedding')
+
+
+def test_build_and_search(shard):
+    vectors = random_vectors(400)
+    assert len(shard) == 400
+    assert shard.model == 'test-embedding'
+
+    for row in (0, 123, 399):
+        top_id, score = exhaustive(shard)(vectors[row], 1)[0]
+        assert (top_id, score) == (row + 1, pytest.approx(1.0, abs=1e-5))
+    # The default nprobe still finds exact matches
+    assert shard.search(vectors[42], 1)[0][0] == 43
+
+
+def test_append_replace_and_delete(shard):
+    new = random_vectors(3, seed=1)
+    shard.append([1001, 1002, 1003], new)
+    assert len(shard) == 403
+    assert exhaustive(shard)(new[1], 1)[0][0] == 1002
+
+    # Re-inserting a base id hides its old vector
+    shard.append([10], new[2:3])
+    assert [i for i, _ in exhaustive(shard)(new[2], 2)] in ([10, 1003], [1003, 10])
+    assert 10 not in [i for i, _ in exhaustive(shard)(random_vectors(400)[9], 5)]
+
+    shard.delete([1002, 20, 999999])
+    results = [i for i, _ in exhaustive(shard)(new[1], 500)]
+    assert 1002 not in results and 20 not in results
+    assert len(shard) == 401
+    assert shard.pending_changes() == len(shard._delta) + len(shard._hidden) == 5
+
+
+def test_log_replay_keeps_the_last_record_per_id(shard_path, shard):
+    new = random_vectors(4, seed=2)
+    shard.append([500, 501], new[:2])
+    shard.delete([500])
+    shard.append([501, 502], new[2:4])
+    shard.delete([502])
+    shard.append([502], new[:1])
+
+    # A fresh reader replays the whole log in one pass
+    reader = IVFShard(shard_path)
+    for opened in (shard, reader):
+        ids, vectors = opened._delta.snapshot()
+        by_id = dict(zip(ids.tolist(), vectors))
+        assert sorted(by_id) == [501, 502]
+        np.testing.assert_allclose(by_id[501], new[2] / np.linalg.norm(new[2]), atol=1e-6)
+        np.testing.assert_allclose(by_id[502], new[0] / np.linalg.norm(new[0]), atol=1e-6)
+        assert len(opened) == 402
+
+
+def test_refresh_picks_up_other_writers(shard_path, shard):
+    reader = IVFShard(shard_path)
+    vector = random_vectors(1, seed=3)
+    shard.append([777], vector)
+    shard.delete([1])
+
+    assert exhaustive(reader)(vector[0], 1)[0][0] == 777
+    assert 1 not in [i for i, _ in exhaustive(reader)(random_vectors(400)[0], 5)]
+
+    compacted = shard.compact()
+    assert compacted.generation == shard.generation + 1
+    reader.refresh()
+    assert reader.generation == compacted.generation
+    assert len(reader) == len(compacted) == 400
+
+
+def test_compact_folds_the_log_into_a_new_generation(shard_path, shard):
+    new = random_vectors(5, seed=4)
+    shard.append(range(2000, 2005), new)
+    shard.delete(range(1, 11))
+    before = {i: s for i, s in exhaustive(shard)(new[0], 50)}
+
+    compacted = shard.compact()
+
+    assert compacted.pending_changes() == 0
+    assert compacted.count == len(compacted) == 395
+    assert os.path.getsize(compacted._file('log') + '.bin') == 0
+    after = {i: s for i, s in exhaustive(compacted)(new[0], 50)}
+    assert after.keys() == before.keys()
+    for message_id, score in after.items():
+        assert score == pytest.approx(before[message_id], abs=1e-5)
+    # The replaced generation stays for readers mid-open; older ones are removed
+    compacted.compact()
+    generations = {name.split('-')[1].split('.')[0] for name in os.listdir(shard_path) if name.startswith('ids-')}
+    assert generations == {str(compacted.generation), str(compacted.generation + 1)}
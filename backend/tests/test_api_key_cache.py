@@ -0,0 +1,105 @@
+"""APIKeyCache: invalidation within this process and, through api_key_versions, in others"""
+import pytest
+from models import db, APIKey, User
+from services import api_key_cache
+from services.api_key_cache import APIKeyCache
+from services.query_audit import capture_queries
+from services.query_plans import AUDIT_HEADERS
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(api_key_cache.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        db.session.add(User(id='owner', email='owner@example.com'))
+        db.session.add(APIKey(user_id='owner', platform='openai', api_key='sk-old'))
+        db.session.commit()
+        yield 'owner'
+
+
+def change_keys(user_id, change):
+    """Change the user's keys the way the api_keys routes do, from another process's cache"""
+    writer = APIKeyCache()
+    change(APIKey.query.filter_by(user_id=user_id, platform='openai').one())
+    writer.bump_version(user_id)
+    db.session.commit()
+
+
+def test_hits_skip_the_database(clock, user_id):
+    cache = APIKeyCache(poll_interval=5)
+    assert cache.get(user_id, 'openai') == 'sk-old'
+
+    with capture_queries() as statements:
+        assert cache.keys(user_id) == {'openai': 'sk-old'}
+    assert statements == []
+    assert cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('change, expected', [
+    (lambda key: setattr(key, 'api_key', 'sk-rotated'), 'sk-rotated'),
+    (lambda key: db.session.delete(key), None),
+    (lambda key: setattr(key, 'is_active', False), None),
+])
+def test_other_processes_see_changes_after_the_poll_interval(clock, user_id, change, expected):
+    cache = APIKeyCache(poll_interval=5, ttl=300)
+    assert cache.get(user_id, 'openai') == 'sk-old'
+    # Let this process's first poll happen before the change, as in a long-running worker
+    clock.now += 5
+    cache.get(user_id, 'openai')
+
+    change_keys(user_id, change)
+
+    clock.now += 4
+    assert cache.get(user_id, 'openai') == 'sk-old'  # Within the poll interval
+    clock.now += 1
+    assert cache.get(user_id, 'openai') == expected
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_entries_are_bounded_by_ttl_without_a_version_bump(clock, user_id):
+    cache = APIKeyCache(poll_interval=5, ttl=60)
+    assert cache.get(user_id, 'openai') == 'sk-old'
+    # A write that skipped bump_version (e.g. by hand in SQL)
+    APIKey.query.filter_by(user_id=user_id).update({'api_key': 'sk-manual'})
+    db.session.commit()
+
+    clock.now += 59
+    assert cache.get(user_id, 'openai') == 'sk-old'
+    clock.now += 1
+    assert cache.get(user_id, 'openai') == 'sk-manual'
+
+
+def test_routes_invalidate_their_own_process_immediately(app, client):
+    def cached_key():
+        with app.app_context():
+            return api_key_cache.get_api_key_cache().get('demo_user_123', 'openai')
+
+    created = client.post('/api/api-keys', json={'platform': 'openai', 'api_key': 'sk-1'}, headers=AUDIT_HEADERS)
+    key_id = created.get_json()['id']
+    assert cached_key() == 'sk-1'
+
+    client.post('/api/api-keys', json={'platform': 'openai', 'api_key': 'sk-2'}, headers=AUDIT_HEADERS)
+    assert cached_key() == 'sk-2'
+
+    client.put(f'/api/api-keys/{key_id}/toggle', headers=AUDIT_HEADERS)
+    assert cached_key() is None
+
+    client.put(f'/api/api-keys/{key_id}/toggle', headers=AUDIT_HEADERS)
+    assert cached_key() == 'sk-2'
+
+    client.delete(f'/api/api-keys/{key_id}', headers=AUDIT_HEADERS)
+    assert cached_key() is None
@@ -0,0 +1,111 @@
+"""require_auth's token and user caches: expiry, verification and query-free requests"""
+import time
+import jwt
+import pytest
+from config import Config
+from routes import auth
+from services import auth_cache
+from services.auth_cache import TTLCache
+from services.query_audit import capture_queries
+
+PROJECT = 'demo-project'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth_cache.time, 'monotonic', clock.monotonic)
+    cache = TTLCache(max_entries=2)
+    cache.put('a', 1, ttl=10)
+    cache.put('b', 2, ttl=30)
+    cache.put('never', 3, ttl=0)
+
+    assert cache.get('never') is None
+    clock.now += 10
+    assert (cache.get('a'), cache.get('b')) == (None, 2)
+
+    cache.put('c', 3, ttl=30)
+    cache.get('b')
+    cache.put('d', 4, ttl=30)
+    assert (cache.get('b'), cache.get('c'), cache.get('d')) == (2, None, 4)
+
+
+@pytest.fixture
+def rsa():
+    # RS256 needs PyJWT's optional cryptography backend
+    return pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+
+
+@pytest.fixture
+def signer(monkeypatch, rsa):
+    """Verify tokens as in production, against a key pair made for the test"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    class JWKS:
+        def get_key(self, kid):
+            return private_key.public_key() if kid == 'test-key' else None
+
+    monkeypatch.setattr(Config, 'FIREBASE_PROJECT_ID', PROJECT)
+    monkeypatch.setattr(auth_cache, '_jwks_cache', JWKS())
+    decoded = []
+
+    def counting_decode(token):
+        decoded.append(token)
+        return auth_cache.decode_token(token)
+    monkeypatch.setattr(auth, 'decode_token', counting_decode)
+
+    def sign(lifetime, subject='firebase-user'):
+        now = time.time()
+        token = jwt.encode({
+            'sub': subject, 'email': f'{subject}@example.com', 'aud': PROJECT,
+            'iss': f'https://securetoken.google.com/{PROJECT}', 'iat': int(now) - 1, 'exp': now + lifetime
+        }, private_key, algorithm='RS256', headers={'kid': 'test-key'})
+        return {'Authorization': f'Bearer {token}'}
+    sign.decoded = decoded
+    return sign
+
+
+def test_tokens_are_verified_once_while_cached(client, signer):
+    headers = signer(lifetime=600)
+
+    for _ in range(3):
+        assert client.get('/api/auth/me', headers=headers).get_json()['id'] == 'firebase-user'
+
+    assert len(signer.decoded) == 1
+
+
+def test_expired_token_is_not_served_from_cache(client, signer):
+    headers = signer(lifetime=1.0)
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+
+    # The cache entry lives no longer than the token, so the next request re-verifies and fails
+    time.sleep(1.1)
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+    assert len(signer.decoded) == 2
+
+
+def test_bad_signatures_are_rejected(client, signer, rsa):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode({'sub': 'mallory', 'aud': PROJECT, 'iss': f'https://securetoken.google.com/{PROJECT}',
+                        'exp': time.time() + 600}, other_key, algorithm='RS256', headers={'kid': 'test-key'})
+
+    assert client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}).status_code == 401
+    assert len(auth_cache.get_token_cache()) == 0
+
+
+def test_cached_user_is_attached_without_a_query(client, signer):
+    headers = signer(lifetime=600)
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+
+    with capture_queries() as statements:
+        payload = client.get('/api/auth/me', headers=headers).get_json()
+
+    assert statements == []
+    assert payload['email'] == 'firebase-user@example.com'
@@ -0,0 +1,192 @@
+"""Batch pipeline against the local stand-in provider, driving BatchRunner by hand (no worker threads)"""
+from datetime import datetime, timedelta
+import pytest
+from config import Config
+from models import db, BatchJobItem, Conversation, Message
+from services import batch_runner
+from services.ai_service import AIService
+from services.batch_runner import BatchRunner
+from services.provider_gateway import GatewayError
+from services.query_plans import AUDIT_HEADERS as HEADERS
+
+
+@pytest.fixture
+def runner(app, monkeypatch):
+    monkeypatch.setattr(Config, 'LOCAL_PROVIDER_ENABLED', True)
+    monkeypatch.setattr(Config, 'LOCAL_PROVIDER_LATENCY', 0)
+    runner = BatchRunner(app, workers=2, provider_concurrency=2, poll_interval=0.01, lease_timeout=60, max_attempts=3)
+    monkeypatch.setattr(runner, 'wake', lambda: None)
+    monkeypatch.setattr(batch_runner, '_runner', runner)
+    return runner
+
+
+def submit(client, items, model='echo'):
+    response = client.post('/api/batch', json={'platform': 'local', 'model': model, 'items': items}, headers=HEADERS)
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()['id']
+
+
+def run_one(app, runner):
+    """Claim and execute one item as a worker would; returns (item_id, claimed_at)"""
+    with app.app_context():
+        claim = runner._claim()
+        assert claim is not None
+        runner._execute(*claim)
+        return claim
+
+
+def item_state(app, item_id):
+    with app.app_context():
+        return db.session.get(BatchJobItem, item_id)
+
+
+def make_available(app, item_id):
+    """Skip the retry backoff"""
+    with app.app_context():
+        BatchJobItem.query.filter_by(id=item_id).update({'available_at': None})
+        db.session.commit()
+
+
+def test_item_completes_as_a_conversation(app, client, runner):
+    batch_id = submit(client, ['hello there'])
+
+    item_id, _ = run_one(app, runner)
+
+    item = item_state(app, item_id)
+    assert item.status == 'completed'
+    assert item.attempts == 1
+    assert item.claimed_at is None
+    with app.app_context():
+        conversation = db.session.get(Conversation, item.conversation_id)
+        messages = Message.query.filter_by(conversation_id=conversation.id).order_by(Message.id).all()
+        assert [(m.role, m.content) for m in messages] == [('user', 'hello there'), ('assistant', '[echo] hello there')]
+        assert item.message_id == messages[1].id
+    assert runner.stats()['completed'] == 1
+
+    payload = client.get(f'/api/batch/{batch_id}', headers=HEADERS).get_json()
+    assert payload['status'] == 'completed'
+    assert payload['items'][0]['result'] == '[echo] hello there'
+
+
+def test_failing_item_backs_off_then_fails_after_max_attempts(app, client, runner):
+    submit(client, ['doomed'], model='fail')
+
+    for attempt in range(1, runner.max_attempts):
+        started = datetime.utcnow()
+        item_id, _ = run_one(app, runner)
+        item = item_state(app, item_id)
+        assert item.status == 'pending'
+        assert item.attempts == attempt
+        assert item.available_at >= started + timedelta(seconds=runner.poll_interval * 2 ** attempt)
+        assert 'fail' in item.error
+        with app.app_context():
+            assert runner._claim() is None  # Still backing off
+        make_available(app, item_id)
+
+    item_id, _ = run_one(app, runner)
+    item = item_state(app, item_id)
+    assert item.status == 'failed'
+    assert item.attempts == runner.max_attempts
+    assert item.completed_at is not None
+    assert runner.stats()['failed'] == 1
+    with app.app_context():
+        assert Conversation.query.count() == 0
+
+
+def test_gateway_refusal_defers_without_using_an_attempt(app, client, runner, monkeypatch):
+    def refuse(self, **kwargs):
+        raise GatewayError('rate limited', retry_after=30)
+    monkeypatch.setattr(AIService, 'send_message', refuse)
+    submit(client, ['later'])
+
+    started = datetime.utcnow()
+    item_id, _ = run_one(app, runner)
+
+    item = item_state(app, item_id)
+    assert item.status == 'pending'
+    assert item.attempts == 0
+    assert item.available_at >= started + timedelta(seconds=30)
+    assert item.claimed_at is None
+    assert runner.stats()['deferred'] == 1
+
+
+def test_result_is_discarded_when_the_lease_was_lost(app, client, runner, monkeypatch):
+    send = AIService.send_message
+    taken_over_at = datetime(2030, 1, 1)
+
+    def reclaimed_during_call(self, **kwargs):
+        # Another worker reclaimed and re-claimed the item while this call ran
+        with db.engine.begin() as connection:
+            connection.execute(BatchJobItem.__table__.update().values(claimed_at=taken_over_at))
+        return send(self, **kwargs)
+    monkeypatch.setattr(AIService, 'send_message', reclaimed_during_call)
+    submit(client, ['slow'])
+
+    item_id, _ = run_one(app, runner)
+
+    item = item_state(app, item_id)
+    assert item.status == 'running'
+    assert item.claimed_at == taken_over_at
+    assert item.conversation_id is None
+    with app.app_context():
+        assert Conversation.query.count() == 0
+        assert Message.query.count() == 0
+    assert runner.stats()['lease_lost'] == 1
+    assert runner.stats()['completed'] == 0
+
+
+def test_expired_leases_are_reclaimed(app, client, runner):
+    submit(client, ['resumed', 'exhausted'])
+    with app.app_context():
+        first, _ = runner._claim()
+        second, _ = runner._claim()
+        # As if the process died mid-call long ago; the second item has no attempts left
+        stale = datetime.utcnow() - timedelta(seconds=runner.lease_timeout + 1)
+        BatchJobItem.query.filter_by(id=first).update({'claimed_at': stale})
+        BatchJobItem.query.filter_by(id=second).update({'claimed_at': stale, 'attempts': runner.max_attempts})
+        db.session.commit()
+        runner._release('local')
+        runner._release('local')
+
+        runner._reclaim_expired()
+
+    assert (item_state(app, first).status, item_state(app, first).claimed_at) == ('pending', None)
+    assert item_state(app, second).status == 'failed'
+    assert runner.stats()['reclaimed'] == 1
+
+    run_one(app, runner)
+    assert item_state(app, first).status == 'completed'
+
+
+def test_cancel_and_retry(app, client, runner):
+    batch_id = submit(client, ['a', 'b', 'c'])
+    run_one(app, runner)
+
+    response = client.post(f'/api/batch/{batch_id}/cancel', headers=HEADERS)
+    assert response.get_json() == {'cancelled': 2}
+    with app.app_context():
+        assert runner._claim() is None
+    assert client.get(f'/api/batch/{batch_id}', headers=HEADERS).get_json()['counts'] == {'completed': 1, 'cancelled': 2}
+
+    response = client.post(f'/api/batch/{batch_id}/retry', headers=HEADERS)
+    assert response.get_json() == {'requeued': 2}
+    run_one(app, runner)
+    run_one(app, runner)
+    payload = client.get(f'/api/batch/{batch_id}', headers=HEADERS).get_json()
+    assert payload['status'] == 'completed'
+    assert [item['attempts'] for item in payload['items']] == [1, 1, 1]
+
+
+@pytest.mark.parametrize('body', [
+    {'items': 'hello'},
+    {'items': [{'prompt': ['hello']}]},
+    {'items': [{'prompt': 'hello', 'model': 42}]},
+    {'items': ['hello'], 'platform': {'name': 'local'}},
+    {'items': [None]},
+])
+def test_malformed_items_are_rejected(app, client, runner, body):
+    response = client.post('/api/batch', json=dict({'platform': 'local', 'model': 'echo'}, **body), headers=HEADERS)
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert BatchJobItem.query.count() == 0
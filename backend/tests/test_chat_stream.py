@@ -0,0 +1,76 @@
+"""/api/chat/stream: Server-Sent Events framing and what a stream leaves in the database"""
+import json
+import pytest
+from models import Message
+from routes import chat
+from services.ai_service import AIService
+from services.context_builder import is_failed_turn
+from services.query_plans import AUDIT_HEADERS as HEADERS
+
+
+@pytest.fixture
+def openai_key(client):
+    response = client.post('/api/api-keys', json={'platform': 'openai', 'api_key': 'sk-test'}, headers=HEADERS)
+    assert response.status_code == 201
+
+
+def fake_stream(*chunks, error=None):
+    def stream(self, platform, model, api_key, messages):
+        for chunk in chunks:
+            yield {'type': 'delta', 'content': chunk}
+        if error:
+            raise error
+        yield {'type': 'done', 'content': ''.join(chunks), 'tokens': 3, 'cost': 0, 'metadata': {'model': model}}
+    return stream
+
+
+def events(response):
+    parsed = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        parsed.append((fields['event'], json.loads(fields['data'])))
+    return parsed
+
+
+def stream(client, message='hi'):
+    return client.post('/api/chat/stream', json={'platform': 'openai', 'model': 'gpt-4', 'message': message},
+                       headers=HEADERS)
+
+
+def saved_messages(app):
+    with app.app_context():
+        return [(m.role, m.content, m.message_metadata)
+                for m in Message.query.order_by(Message.id)]
+
+
+def test_stream_saves_the_reply(app, client, openai_key, monkeypatch):
+    monkeypatch.setattr(AIService, 'stream_message', fake_stream('Hel', 'lo'))
+
+    names = [name for name, _ in events(stream(client))]
+
+    assert names == ['start', 'delta', 'delta', 'done']
+    assert [(role, content) for role, content, _ in saved_messages(app)] == [('user', 'hi'), ('assistant', 'Hello')]
+
+
+def test_upstream_error_marks_the_turn_failed(app, client, openai_key, monkeypatch):
+    monkeypatch.setattr(AIService, 'stream_message', fake_stream('Hel', error=RuntimeError('upstream broke')))
+
+    name, payload = events(stream(client))[-1]
+
+    assert (name, payload) == ('error', {'error': 'upstream broke'})
+    [(role, _, metadata)] = saved_messages(app)
+    assert role == 'user' and is_failed_turn(metadata)
+
+
+def test_side_effects_after_commit_do_not_fail_the_turn(app, client, openai_key, monkeypatch):
+    def broken_indexing(messages, user_id):
+        raise RuntimeError('index unavailable')
+    monkeypatch.setattr(AIService, 'stream_message', fake_stream('Hello'))
+    monkeypatch.setattr(chat, 'enqueue_for_indexing', broken_indexing)
+
+    with pytest.raises(RuntimeError):
+        stream(client).get_data()
+
+    messages = saved_messages(app)
+    assert [(role, content) for role, content, _ in messages] == [('user', 'hi'), ('assistant', 'Hello')]
+    assert not any(is_failed_turn(metadata) for _, _, metadata in messages)
@@ -0,0 +1,131 @@
+"""build_context: the keyset walk back through history, the token budget, summaries and cached token counts"""
+from datetime import datetime
+import json
+import pytest
+from config import Config
+from models import db, Conversation, ConversationSummary, Message, MessageTokenCount, User
+from services import context_builder
+from services.context_builder import HISTORY_BATCH_SIZE, MESSAGE_OVERHEAD_TOKENS, build_context
+
+# 40 characters is 10 tokens under the chars/4 tokenizer
+CONTENT_TOKENS = 10
+MESSAGE_COST = CONTENT_TOKENS + MESSAGE_OVERHEAD_TOKENS
+
+
+@pytest.fixture
+def conversation(app, monkeypatch):
+    monkeypatch.setattr(context_builder, 'TIKTOKEN_AVAILABLE', False)
+    with app.app_context():
+        db.session.add(User(id='reader', email='reader@example.com'))
+        conversation = Conversation(user_id='reader', platform='openai', model='gpt-4')
+        db.session.add(conversation)
+        db.session.commit()
+        yield conversation
+
+
+def add_messages(conversation, count, failed=(), created_at=datetime(2030, 1, 1)):
+    """`count` alternating user/assistant messages, all sharing one created_at; returns them oldest first"""
+    messages = []
+    for i in range(count):
+        metadata = json.dumps({'status': 'failed', 'error': 'boom'}) if i in failed else None
+        messages.append(Message(conversation_id=conversation.id, role='user' if i % 2 == 0 else 'assistant',
+                                content=f'message {i:04d} '.ljust(40, '.'), message_metadata=metadata,
+                                created_at=created_at))
+    db.session.add_all(messages)
+    db.session.commit()
+    return messages
+
+
+def contents(context):
+    return [message['content'][:12] for message in context['messages']]
+
+
+def test_walks_back_across_batches_until_the_budget(conversation):
+    messages = add_messages(conversation, 151)
+    # Room for 100 messages: more than one batch, fewer than the whole conversation
+    assert HISTORY_BATCH_SIZE < 100 < len(messages)
+
+    context = build_context(conversation.id, 'gpt-4', budget=100 * MESSAGE_COST)
+
+    # 51..150 fit; 51 is an assistant reply, so it is trimmed to open on a user turn
+    assert contents(context) == [f'message {i:04d}' for i in range(52, 151)]
+    assert context['messages'][0]['role'] == 'user'
+    assert context['tokens'] == 99 * MESSAGE_COST
+    assert context['truncated'] is True
+    assert context['dropped_through'] == messages[51].id
+    assert context['summary_through'] is None
+
+
+def test_short_history_fits_whole(conversation):
+    add_messages(conversation, 5)
+
+    context = build_context(conversation.id, 'gpt-4', budget=10_000)
+
+    assert contents(context) == [f'message {i:04d}' for i in range(5)]
+    assert (context['truncated'], context['dropped_through']) == (False, None)
+
+
+def test_newest_message_is_sent_even_over_budget(conversation):
+    add_messages(conversation, 3)
+
+    context = build_context(conversation.id, 'gpt-4', budget=1)
+
+    assert contents(context) == ['message 0002']
+    assert context['truncated'] is True
+
+
+def test_failed_turns_are_left_out(conversation):
+    messages = add_messages(conversation, 5, failed={2})
+
+    context = build_context(conversation.id, 'gpt-4', budget=10_000)
+
+    assert contents(context) == ['message 0000', 'message 0001', 'message 0003', 'message 0004']
+    assert context['tokens'] == 4 * MESSAGE_COST
+    # Still counted (and cached) like any other row
+    assert db.session.get(MessageTokenCount, messages[2].id) is not None
+
+
+def test_summary_stands_in_for_earlier_messages(conversation, monkeypatch):
+    monkeypatch.setattr(Config, 'CONTEXT_SUMMARY_ENABLED', True)
+    messages = add_messages(conversation, 20)
+    db.session.add(ConversationSummary(conversation_id=conversation.id, content='They agreed on a plan.',
+                                       through_message_id=messages[9].id, tokens=6))
+    db.session.commit()
+
+    context = build_context(conversation.id, 'gpt-4', budget=6 + MESSAGE_OVERHEAD_TOKENS + 4 * MESSAGE_COST)
+
+    assert context['messages'][0] == {
+        'role': 'system',
+        'content': 'Summary of the earlier part of this conversation:\nThey agreed on a plan.'
+    }
+    assert contents(context)[1:] == ['message 0016', 'message 0017', 'message 0018', 'message 0019']
+    assert context['summary_through'] == messages[9].id
+    assert context['dropped_through'] == messages[15].id
+
+
+def test_token_counts_are_cached_per_tokenizer(conversation, monkeypatch):
+    messages = add_messages(conversation, 4)
+
+    build_context(conversation.id, 'gpt-4', budget=10_000)
+    db.session.commit()
+    rows = MessageTokenCount.query.order_by(MessageTokenCount.message_id).all()
+    assert [(row.message_id, row.tokenizer, row.tokens) for row in rows] == [
+        (message.id, 'chars/4', CONTENT_TOKENS) for message in messages
+    ]
+
+    # Cached counts are read back instead of recounted
+    counted = []
+    monkeypatch.setattr(context_builder, 'count_tokens', lambda text: counted.append(text) or 99)
+    assert build_context(conversation.id, 'gpt-4', budget=10_000)['tokens'] == 4 * MESSAGE_COST
+    assert counted == []
+
+    # Counts from another tokenizer are recomputed and replaced
+    monkeypatch.setattr(context_builder, 'tokenizer_name', lambda: 'words')
+    monkeypatch.setattr(context_builder, 'count_tokens', lambda text: len(text.split()))
+    context = build_context(conversation.id, 'gpt-4', budget=10_000)
+    db.session.commit()
+
+    assert context['tokens'] == 4 * (3 + MESSAGE_OVERHEAD_TOKENS)
+    db.session.expire_all()
+    assert {(row.tokenizer, row.tokens) for row in MessageTokenCount.query} == {('words', 3)}
+    assert MessageTokenCount.query.count() == 4
@@ -0,0 +1,62 @@
+"""EmbeddingCache: both levels, and which callers may write the embedding_cache table"""
+import numpy as np
+import pytest
+from models import EmbeddingCacheEntry
+from services.embedding_cache import EmbeddingCache
+from services.query_audit import capture_queries
+
+
+class Encoder:
+    """Stands in for the embedding model, recording what it was asked to encode"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def encoder(app):
+    with app.app_context():
+        yield Encoder()
+
+
+def test_encodes_each_uncached_text_once(encoder):
+    cache = EmbeddingCache('test-model')
+
+    vectors = cache.encode(['a', 'bb', 'a'], encoder)
+    again = cache.encode(['bb', 'ccc'], encoder)
+
+    assert encoder.calls == [['a', 'bb'], ['ccc']]
+    np.testing.assert_array_equal(vectors[:, 0], [1, 2, 1])
+    np.testing.assert_array_equal(again[:, 0], [2, 3])
+    assert cache.stats()['memory_hits'] == 1
+
+
+def test_indexed_texts_are_shared_through_the_table(encoder):
+    EmbeddingCache('test-model').encode(['indexed message'], encoder)
+
+    other_worker = EmbeddingCache('test-model')
+    other_worker.encode(['indexed message'], encoder)
+
+    assert encoder.calls == [['indexed message']]
+    assert other_worker.stats()['db_hits'] == 1
+    assert EmbeddingCache('other-model').lookup(['indexed message']) == [None]
+
+
+def test_search_queries_never_write(encoder):
+    cache = EmbeddingCache('test-model')
+
+    with capture_queries() as statements:
+        cache.encode(['what did we decide?'], encoder, persist=False)
+        cache.encode(['what did we decide?'], encoder, persist=False)
+
+    assert encoder.calls == [['what did we decide?']]
+    assert statements and all(statement.lstrip().upper().startswith('SELECT') for statement, _ in statements)
+    assert EmbeddingCacheEntry.query.count() == 0
+    # The vector still serves later lookups in this process, and indexing the same text persists it
+    cache.encode(['what did we decide?'], lambda texts: pytest.fail('should be cached'))
+    cache.store(['what did we decide?'], encoder(['what did we decide?']))
+    assert EmbeddingCacheEntry.query.count() == 1
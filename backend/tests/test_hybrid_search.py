@@ -0,0 +1,90 @@
+"""Reciprocal rank fusion and request validation for POST /api/search/hybrid"""
+import pytest
+from config import Config
+from routes import search
+from services.hybrid_search import reciprocal_rank_fusion
+from services.query_plans import AUDIT_HEADERS
+
+
+def ranked(*message_ids):
+    return [{'message_id': message_id, 'score': 1.0 - rank / 10} for rank, message_id in enumerate(message_ids)]
+
+
+def fused_ids(rankings, weights):
+    return [entry['message_id'] for entry in reciprocal_rank_fusion(rankings, weights)]
+
+
+def test_fusion_rewards_agreement_between_stages():
+    fused = reciprocal_rank_fusion({
+        'lexical': ranked(1, 2, 3),
+        'semantic': ranked(3, 4, 1)
+    }, {'lexical': 1.0, 'semantic': 1.0}, k=60)
+
+    assert [entry['message_id'] for entry in fused] == [1, 3, 2, 4]
+    first = fused[0]
+    assert first['score'] == pytest.approx(1 / 61 + 1 / 63)
+    assert first['ranks'] == {'lexical': 1, 'semantic': 3}
+    assert first['stage_scores'] == {'lexical': 1.0, 'semantic': pytest.approx(0.8)}
+    assert fused[-1]['ranks'] == {'semantic': 2}
+
+
+def test_fusion_weights_and_k():
+    rankings = {'lexical': ranked(1, 2), 'semantic': ranked(2, 1)}
+
+    # Equal weights tie; the heavier stage's order wins
+    tied = reciprocal_rank_fusion(rankings, {'lexical': 1.0, 'semantic': 1.0})
+    assert tied[0]['score'] == pytest.approx(tied[1]['score'])
+    assert fused_ids(rankings, {'lexical': 2.0, 'semantic': 1.0}) == [1, 2]
+    assert fused_ids(rankings, {'lexical': 1.0, 'semantic': 2.0}) == [2, 1]
+    # A zero weight drops a stage's influence but keeps its results
+    assert fused_ids({'lexical': ranked(1), 'semantic': ranked(2)}, {'lexical': 0.0, 'semantic': 1.0}) == [2, 1]
+
+    # Small k sharpens the gap between ranks; large k flattens it
+    sharp = reciprocal_rank_fusion({'lexical': ranked(1, 2)}, {}, k=1)
+    flat = reciprocal_rank_fusion({'lexical': ranked(1, 2)}, {}, k=1000)
+    assert sharp[0]['score'] / sharp[1]['score'] > flat[0]['score'] / flat[1]['score']
+
+
+@pytest.fixture
+def searched(monkeypatch):
+    calls = []
+
+    def fake_hybrid_search(app, user_id, query, limit, weights, rrf_k):
+        calls.append({'limit': limit, 'weights': weights, 'rrf_k': rrf_k})
+        return {'results': [], 'timings': {}, 'errors': {}}
+    monkeypatch.setattr(search, 'hybrid_search', fake_hybrid_search)
+    return calls
+
+
+@pytest.mark.parametrize('body', [
+    {'limit': 'x'},
+    {'limit': -1},
+    {'limit': 0},
+    {'limit': 2.5},
+    {'limit': True},
+    {'limit': Config.HYBRID_MAX_LIMIT + 1},
+    {'rrf_k': 0},
+    {'rrf_k': '60'},
+    {'weights': [1, 2]},
+    {'weights': {'lexical': 'heavy'}},
+    {'weights': {'semantic': -1}},
+])
+def test_invalid_parameters_are_rejected(client, searched, body):
+    response = client.post('/api/search/hybrid', json=dict(body, query='release notes'), headers=AUDIT_HEADERS)
+
+    assert response.status_code == 400
+    assert searched == []
+
+
+def test_valid_parameters_reach_the_search(client, searched):
+    response = client.post('/api/search/hybrid', json={
+        'query': 'release notes', 'limit': 25, 'rrf_k': 10, 'weights': {'semantic': 0.5}
+    }, headers=AUDIT_HEADERS)
+
+    assert response.status_code == 200
+    assert response.get_json()['results'] == []
+    assert searched == [{
+        'limit': 25,
+        'weights': {'lexical': Config.HYBRID_LEXICAL_WEIGHT, 'semantic': 0.5},
+        'rrf_k': 10
+    }]
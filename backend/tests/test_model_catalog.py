@@ -0,0 +1,45 @@
+"""GET /api/chat/models and the ModelCatalog behind it"""
+from services.ai_service import AIService
+from services.model_catalog import ModelCatalog
+from services.query_plans import AUDIT_HEADERS
+
+
+def test_models_lists_google_models_once_per_key(client, monkeypatch):
+    fetched = []
+
+    def fetch(self, api_key):
+        fetched.append(api_key)
+        return ['gemini-1.5-pro', 'gemini-2.0-flash']
+    monkeypatch.setattr(AIService, 'fetch_google_models', fetch)
+    client.post('/api/api-keys', json={'platform': 'google', 'api_key': 'g-key'}, headers=AUDIT_HEADERS)
+
+    for _ in range(2):
+        google = client.get('/api/chat/models', headers=AUDIT_HEADERS).get_json()['google']
+        assert [model['id'] for model in google] == ['gemini-1.5-pro', 'gemini-2.0-flash']
+    assert fetched == ['g-key']
+
+
+def test_models_falls_back_to_defaults_while_listing_fails(client, monkeypatch):
+    def fetch(self, api_key):
+        raise RuntimeError('listing is down')
+    monkeypatch.setattr(AIService, 'fetch_google_models', fetch)
+    client.post('/api/api-keys', json={'platform': 'google', 'api_key': 'g-key'}, headers=AUDIT_HEADERS)
+
+    response = client.get('/api/chat/models', headers=AUDIT_HEADERS)
+
+    assert response.status_code == 200
+    assert 'gemini-pro' in [model['id'] for model in response.get_json()['google']]
+
+
+def test_failures_are_remembered_for_negative_ttl():
+    catalog = ModelCatalog(negative_ttl=60)
+    calls = []
+
+    def fetch(api_key):
+        calls.append(api_key)
+        raise RuntimeError('bad key')
+
+    assert catalog.get('google', 'bad', fetch) == []
+    assert catalog.get('google', 'bad', fetch) == []
+    assert calls == ['bad']
+    assert catalog.stats()['hits'] == 1
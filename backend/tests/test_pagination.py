@@ -0,0 +1,97 @@
+"""Keyset pagination of GET /api/conversations"""
+import base64
+from datetime import datetime, timedelta
+import pytest
+from config import Config
+from models import db, Conversation
+from services.pagination import InvalidCursor, decode_cursor, encode_cursor
+from services.query_plans import AUDIT_HEADERS
+
+
+@pytest.fixture
+def conversation_ids(app, client):
+    """25 conversations, newest first, with runs of equal updated_at around page boundaries"""
+    assert client.get('/api/auth/me', headers=AUDIT_HEADERS).status_code == 200
+    start = datetime(2030, 1, 1)
+    # Pages of 5 end inside the run of 7 at [5..11] and the run of 3 at [19..21]
+    offsets = [25, 24, 23, 22, 21] + [20] * 7 + [13, 12, 11, 10, 9, 8, 7] + [6] * 3 + [3, 2, 1]
+    with app.app_context():
+        conversations = [
+            Conversation(user_id='demo_user_123', title=f'c{i}', platform='openai', model='gpt-4',
+                         created_at=start, updated_at=start + timedelta(minutes=offset))
+            for i, offset in enumerate(offsets)
+        ]
+        db.session.add_all(conversations)
+        db.session.commit()
+        ids = [conversation.id for conversation in conversations]
+    # Newest first, ties broken by the higher id
+    return [conversation_id for _, conversation_id in sorted(zip(offsets, ids), reverse=True)]
+
+
+def get(client, path):
+    response = client.get(path, headers=AUDIT_HEADERS)
+    return response.status_code, response.get_json()
+
+
+def test_cursor_round_trip():
+    updated_at = datetime(2030, 5, 17, 8, 30, 15, 123456)
+    cursor = encode_cursor(updated_at, 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (updated_at, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    '!!!!',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(b'[1]').decode(),
+    base64.urlsafe_b64encode(b'5').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 1]').decode(),
+    base64.urlsafe_b64encode(b'[null, 1]').decode(),
+])
+def test_malformed_cursors_are_rejected(client, conversation_ids, cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+    status, payload = get(client, f'/api/conversations?cursor={cursor}')
+    assert (status, payload) == (400, {'error': 'Invalid cursor'})
+
+
+def test_pages_cover_every_row_once_across_equal_timestamps(client, conversation_ids):
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        path = '/api/conversations?per_page=5' + (f'&cursor={cursor}' if cursor else '')
+        status, payload = get(client, path)
+        assert status == 200
+        pages += 1
+        seen.extend(conversation['id'] for conversation in payload['conversations'])
+        assert payload['has_more'] is (payload['next_cursor'] is not None)
+        cursor = payload['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == conversation_ids
+    assert pages == 5
+
+
+def test_last_full_page_has_no_cursor(client, conversation_ids):
+    status, payload = get(client, f'/api/conversations?per_page={len(conversation_ids)}')
+    assert status == 200
+    assert len(payload['conversations']) == len(conversation_ids)
+    assert (payload['next_cursor'], payload['has_more']) == (None, False)
+
+
+def test_total_is_opt_in_and_capped(client, conversation_ids, monkeypatch):
+    _, payload = get(client, '/api/conversations?per_page=5')
+    assert 'total' not in payload
+
+    _, payload = get(client, '/api/conversations?per_page=5&include_total=true')
+    assert (payload['total'], payload['total_exact']) == (len(conversation_ids), True)
+
+    _, payload = get(client, '/api/conversations?per_page=5&include_total=true&model=gpt-3.5-turbo')
+    assert (payload['total'], payload['total_exact']) == (0, True)
+
+    monkeypatch.setattr(Config, 'CONVERSATIONS_COUNT_LIMIT', 10)
+    _, payload = get(client, '/api/conversations?per_page=5&include_total=true')
+    assert (payload['total'], payload['total_exact']) == (10, False)
@@ -0,0 +1,170 @@
+"""Retry, backoff, rate limiting and circuit breaking in ProviderGateway, on a fake clock"""
+import pytest
+from services import provider_gateway
+from services.provider_gateway import CircuitBreaker, CircuitOpenError, ProviderGateway, RateLimitedError
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class ProviderError(Exception):
+    """Shaped like the OpenAI/Anthropic SDK errors: status_code and response.headers"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+        self.response = FakeResponse(headers or {})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(provider_gateway.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(provider_gateway.time, 'sleep', clock.sleep)
+    # Full jitter picks the low end, so any longer sleep comes from Retry-After
+    monkeypatch.setattr(provider_gateway.random, 'uniform', lambda low, high: low)
+    return clock
+
+
+def failing(*outcomes):
+    """A request that raises (or returns) each outcome in turn, counting its calls"""
+    outcomes = list(outcomes)
+
+    def request():
+        request.calls += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    request.calls = 0
+    return request
+
+
+def gateway(**options):
+    options.setdefault('rate_per_minute', 6000)
+    options.setdefault('burst', 100)
+    return ProviderGateway(**options)
+
+
+def test_rate_limit_slows_the_bucket_and_honors_retry_after(clock):
+    gw = gateway(backoff_max=20)
+    request = failing(ProviderError(429, {'retry-after': '3'}), 'ok')
+
+    assert gw.call('openai', 'key', 'gpt-4', request) == 'ok'
+
+    assert request.calls == 2
+    assert max(clock.sleeps) >= 3
+    bucket = gw._bucket('openai', 'key', 'gpt-4')
+    assert bucket.rate < bucket.base_rate
+    stats = gw.stats()['platforms']['openai']
+    assert (stats['rate_limited'], stats['retries'], stats['state']) == (1, 1, 'closed')
+
+
+def test_retry_after_past_backoff_max_gives_up(clock):
+    gw = gateway(backoff_max=5)
+    error = ProviderError(429, {'retry-after': '60'})
+    request = failing(error, 'ok')
+
+    with pytest.raises(ProviderError) as raised:
+        gw.call('openai', 'key', 'gpt-4', request)
+
+    assert raised.value is error
+    assert request.calls == 1
+    assert sum(clock.sleeps) == 0
+
+
+def test_server_errors_open_the_circuit_then_allow_one_probe(clock):
+    gw = gateway(max_retries=0, breaker_threshold=3, breaker_reset=30)
+    for _ in range(3):
+        with pytest.raises(ProviderError):
+            gw.call('anthropic', 'key', 'claude', failing(ProviderError(503)))
+    assert gw._breaker('anthropic').state == CircuitBreaker.OPEN
+
+    skipped = failing('ok')
+    with pytest.raises(CircuitOpenError) as raised:
+        gw.call('anthropic', 'key', 'claude', skipped)
+    assert skipped.calls == 0
+    assert raised.value.retry_after > 0
+
+    clock.now += 30
+
+    def probe():
+        # While the probe is out, every other call is still short-circuited
+        assert gw._breaker('anthropic').state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            gw.call('anthropic', 'key', 'claude', failing('ok'))
+        return 'recovered'
+
+    assert gw.call('anthropic', 'key', 'claude', probe) == 'recovered'
+    assert gw._breaker('anthropic').state == CircuitBreaker.CLOSED
+    assert gw.stats()['platforms']['anthropic']['transitions'] == {'open': 1, 'half_open': 1, 'closed': 1}
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    gw = gateway(max_retries=0, breaker_threshold=1, breaker_reset=30)
+    with pytest.raises(ProviderError):
+        gw.call('google', 'key', 'gemini', failing(ProviderError(500)))
+    clock.now += 30
+
+    with pytest.raises(ProviderError):
+        gw.call('google', 'key', 'gemini', failing(ProviderError(502)))
+
+    assert gw._breaker('google').state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        gw.call('google', 'key', 'gemini', failing('ok'))
+
+
+def test_fatal_errors_are_not_retried_or_held_against_the_provider(clock):
+    gw = gateway(breaker_threshold=1)
+    request = failing(ProviderError(400), 'ok')
+
+    with pytest.raises(ProviderError):
+        gw.call('openai', 'key', 'gpt-4', request)
+
+    assert request.calls == 1
+    breaker = gw._breaker('openai')
+    assert (breaker.state, breaker.failures) == (CircuitBreaker.CLOSED, 0)
+    assert gw.stats()['platforms']['openai'].get('retries', 0) == 0
+
+
+def test_transient_errors_retry_with_exponential_backoff(clock, monkeypatch):
+    monkeypatch.setattr(provider_gateway.random, 'uniform', lambda low, high: high)
+    gw = gateway(max_retries=3, backoff_base=0.5, backoff_max=20, breaker_threshold=10)
+    request = failing(ProviderError(503), ProviderError(503), 'ok')
+
+    assert gw.call('openai', 'key', 'gpt-4', request) == 'ok'
+
+    assert request.calls == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_waits_for_a_token_but_rejects_past_max_wait(clock):
+    gw = gateway(rate_per_minute=60, burst=1, max_wait=5)
+    assert gw.call('openai', 'key', 'gpt-4', failing('first')) == 'first'
+    assert gw.call('openai', 'key', 'gpt-4', failing('second')) == 'second'
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+    impatient = gateway(rate_per_minute=60, burst=1, max_wait=0.5)
+    impatient.call('openai', 'key', 'gpt-4', failing('first'))
+    request = failing('second')
+    with pytest.raises(RateLimitedError) as raised:
+        impatient.call('openai', 'key', 'gpt-4', request)
+    assert request.calls == 0
+    assert raised.value.retry_after == 0.5
+    # Other keys have their own bucket
+    assert impatient.call('openai', 'other-key', 'gpt-4', failing('ok')) == 'ok'
@@ -0,0 +1,59 @@
+"""Query counts of the conversation endpoints, which @query_budget only checks at runtime"""
+import pytest
+from models import db
+from services.query_audit import capture_queries
+from services.query_plans import AUDIT_HEADERS, seed_database
+
+
+@pytest.fixture
+def ids(app, client):
+    with app.app_context():
+        ids = seed_database(users=3, conversations_per_user=60, messages_per_conversation=5)
+    # Authenticate once so the token and user caches are warm and later requests count only the view
+    assert client.get('/api/auth/me', headers=AUDIT_HEADERS).status_code == 200
+    return ids
+
+
+def count_queries(client, path):
+    with capture_queries() as statements:
+        response = client.get(path, headers=AUDIT_HEADERS)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+
+@pytest.mark.parametrize('path', [
+    '/api/conversations',
+    '/api/conversations?include_total=true',
+    '/api/conversations?platform=anthropic',
+    '/api/conversations?search=needle',
+])
+def test_conversation_list_within_budget(client, ids, path):
+    assert count_queries(client, path) <= 3
+
+
+def test_conversation_list_queries_do_not_grow_with_page_size(client, ids):
+    small = count_queries(client, '/api/conversations?per_page=5')
+    large = count_queries(client, '/api/conversations?per_page=50')
+    assert small == large
+
+
+def test_conversation_list_next_page_within_budget(client, ids):
+    first = client.get('/api/conversations?per_page=10', headers=AUDIT_HEADERS).get_json()
+    assert first['next_cursor']
+    assert count_queries(client, f"/api/conversations?per_page=10&cursor={first['next_cursor']}") <= 3
+
+
+def test_conversation_detail_within_budget(client, ids):
+    assert count_queries(client, f"/api/conversations/{ids['conversation_id']}") <= 3
+
+
+def test_conversation_detail_queries_do_not_grow_with_messages(app, client, ids):
+    before = count_queries(client, f"/api/conversations/{ids['conversation_id']}")
+    with app.app_context():
+        from models import Message
+        db.session.add_all([
+            Message(conversation_id=ids['conversation_id'], role='user', content=f'extra {i}')
+            for i in range(20)
+        ])
+        db.session.commit()
+    assert count_queries(client, f"/api/conversations/{ids['conversation_id']}") == before
@@ -0,0 +1,22 @@
+"""The `flask perf explain` audit as a test: no audited endpoint may fully scan a large table"""
+from services.query_plans import AUDITED_REQUESTS, audit_query_plans, full_scans
+
+
+def test_full_scans_are_detected():
+    assert full_scans(['SCAN messages', 'SEARCH conversations USING INDEX ix_conversations_user_updated (user_id=?)'])
+    assert full_scans(['SCAN c USING COVERING INDEX ix_conversations_user_updated']) == []
+    assert full_scans(['SCAN messages_fts VIRTUAL TABLE INDEX 0:M1']) == []
+    assert full_scans(['SCAN folders']) == []
+
+
+def test_audited_requests_use_indexed_plans(app):
+    with app.app_context():
+        results = audit_query_plans(app, users=5, conversations_per_user=60, messages_per_conversation=4)
+
+    assert len(results) == len(AUDITED_REQUESTS)
+    for result in results:
+        assert result['status'] < 400, result['request']
+        assert result['violations'] == [], (
+            f"{result['request']} scans a large table:\n"
+            + '\n'.join(f"{' '.join(v['statement'].split())}\n  -> {v['scans']}" for v in result['violations'])
+        )
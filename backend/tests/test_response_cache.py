@@ -0,0 +1,140 @@
+"""ResponseCache: per-user keys, LRU and TTL on both tiers, and the /send integration"""
+from datetime import datetime, timedelta
+import pytest
+from config import Config
+from models import db, ResponseCacheEntry, User
+from services import response_cache
+from services.response_cache import ResponseCache, cache_key
+from services.query_plans import AUDIT_HEADERS as HEADERS
+
+MESSAGES = [{'role': 'user', 'content': 'Summarize the release notes'}]
+REPLY = {'content': 'They fixed things.', 'tokens': 12, 'cost': 0.001, 'metadata': {'model': 'gpt-4'}}
+
+
+class Clock(datetime):
+    """datetime whose utcnow() the test controls"""
+    current = datetime(2030, 1, 1)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(response_cache, 'datetime', Clock)
+    monkeypatch.setattr(Clock, 'current', datetime(2030, 1, 1))
+    return Clock
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        db.session.add_all([User(id='alice', email='alice@example.com'), User(id='bob', email='bob@example.com')])
+        db.session.commit()
+        yield
+
+
+def store(cache, user_id, reply=REPLY, messages=MESSAGES):
+    key = cache_key(user_id, 'openai', 'gpt-4', messages)
+    cache.store(key, user_id, 'openai', 'gpt-4', reply)
+    db.session.commit()
+    return key
+
+
+def test_keys_are_normalized_and_scoped_to_the_user():
+    key = cache_key('alice', 'openai', 'gpt-4', MESSAGES)
+    assert key == cache_key('alice', 'openai', 'gpt-4', [{'role': 'user', 'content': ' Summarize the release notes\r\n'}])
+    assert key != cache_key('bob', 'openai', 'gpt-4', MESSAGES)
+    assert key != cache_key('alice', 'openai', 'gpt-4o', MESSAGES)
+    assert key != cache_key('alice', 'openai', 'gpt-4', MESSAGES, {'temperature': 0})
+
+
+def test_entries_never_leak_across_users(users):
+    cache = ResponseCache()
+    key = store(cache, 'alice')
+
+    assert cache.lookup(key, 'alice')['content'] == REPLY['content']
+    # Even if bob somehow presented alice's key, neither tier answers him
+    assert cache.lookup(key, 'bob') is None
+    cache._entries.clear()
+    assert cache.lookup(key, 'bob') is None
+    assert cache.lookup(cache_key('bob', 'openai', 'gpt-4', MESSAGES), 'bob') is None
+    assert cache.stats()['misses'] == 3
+
+
+def test_database_tier_serves_after_memory_is_cleared(users):
+    cache = ResponseCache()
+    key = store(cache, 'alice')
+    assert cache.lookup(key, 'alice')['tier'] == 'memory'
+
+    restarted = ResponseCache()
+    hit = restarted.lookup(key, 'alice')
+    assert (hit['tier'], hit['content'], hit['tokens'], hit['metadata']) == ('database', REPLY['content'], 12, REPLY['metadata'])
+    assert hit['cost'] == pytest.approx(0.001)
+    # The database hit is promoted to memory
+    assert restarted.lookup(key, 'alice')['tier'] == 'memory'
+    assert restarted.stats() == {'memory_hits': 1, 'db_hits': 1, 'misses': 0, 'entries': 1, 'hit_rate': 1.0}
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2, persist=False)
+    keys = [cache_key('alice', 'openai', 'gpt-4', [{'role': 'user', 'content': f'prompt {i}'}]) for i in range(3)]
+    cache.store(keys[0], 'alice', 'openai', 'gpt-4', REPLY)
+    cache.store(keys[1], 'alice', 'openai', 'gpt-4', REPLY)
+    assert cache.lookup(keys[0], 'alice') is not None
+
+    cache.store(keys[2], 'alice', 'openai', 'gpt-4', REPLY)
+
+    assert list(cache._entries) == [keys[0], keys[2]]
+    assert cache.lookup(keys[1], 'alice') is None
+
+
+def test_entries_expire_in_both_tiers(users, clock):
+    cache = ResponseCache(ttl=60)
+    key = store(cache, 'alice')
+
+    clock.current += timedelta(seconds=59)
+    assert cache.lookup(key, 'alice')['tier'] == 'memory'
+
+    clock.current += timedelta(seconds=1)
+    assert cache.lookup(key, 'alice') is None
+    assert key not in cache._entries
+    assert ResponseCache(ttl=60).lookup(key, 'alice') is None
+    assert ResponseCacheEntry.query.count() == 1
+    assert cache.prune() == 1
+    assert ResponseCacheEntry.query.count() == 0
+
+
+def test_store_replaces_an_expired_row(users, clock):
+    cache = ResponseCache(ttl=60)
+    key = store(cache, 'alice')
+    clock.current += timedelta(seconds=120)
+
+    fresh = dict(REPLY, content='They fixed more things.')
+    store(cache, 'alice', reply=fresh)
+
+    [row] = ResponseCacheEntry.query.all()
+    assert row.content == fresh['content']
+    assert row.expires_at == clock.current + timedelta(seconds=60)
+    assert ResponseCache(ttl=60).lookup(key, 'alice')['content'] == fresh['content']
+
+
+def test_send_reuses_the_cached_reply(app, client, monkeypatch):
+    monkeypatch.setattr(Config, 'LOCAL_PROVIDER_ENABLED', True)
+    monkeypatch.setattr(Config, 'LOCAL_PROVIDER_LATENCY', 0)
+    client.post('/api/api-keys', json={'platform': 'local', 'api_key': 'unused'}, headers=HEADERS)
+
+    def send():
+        body = {'platform': 'local', 'model': 'echo', 'message': 'ping', 'cache': True}
+        response = client.post('/api/chat/send', json=body, headers=HEADERS)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    first = send()
+    second = send()
+
+    assert (first['cached'], second['cached']) == (False, True)
+    assert second['message']['content'] == first['message']['content'] == '[echo] ping'
+    with app.app_context():
+        assert ResponseCacheEntry.query.count() == 1
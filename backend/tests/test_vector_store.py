@@ -0,0 +1,95 @@
+"""In-memory embedding matrices against a brute-force numpy reference"""
+import numpy as np
+import pytest
+from services.vector_store import QuantizedVectorMatrix, UserVectorMatrix, normalize_rows
+
+DIM = 32
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def brute_force(ids, vectors, query, limit):
+    scores = normalize_rows(vectors) @ normalize_rows(query)[0]
+    order = np.argsort(-scores, kind='stable')[:limit]
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+def test_top_k_matches_brute_force():
+    ids = np.arange(1000, 1500)
+    vectors = random_vectors(len(ids))
+    # Starts small so adds grow the buffers several times
+    matrix = UserVectorMatrix(DIM, capacity=4)
+    for start in range(0, len(ids), 70):
+        matrix.add(ids[start:start + 70], vectors[start:start + 70])
+
+    query = random_vectors(1, seed=1)[0]
+    expected = brute_force(ids, vectors, query, 10)
+    results = matrix.search(query, 10)
+
+    assert [i for i, _ in results] == [i for i, _ in expected]
+    assert [s for _, s in results] == pytest.approx([s for _, s in expected], abs=1e-5)
+    assert len(matrix.search(query, 10_000)) == len(ids)
+
+
+def test_replace_and_remove():
+    ids = np.arange(200)
+    vectors = random_vectors(len(ids))
+    matrix = UserVectorMatrix(DIM)
+    matrix.add(ids, vectors)
+    ids_before, _ = matrix.snapshot()
+
+    query = random_vectors(1, seed=2)[0]
+    vectors[5] = query
+    matrix.add([5], vectors[5:6])
+    removed = [0, 7, 199, 100]
+    matrix.remove(removed + [12345])
+
+    assert len(matrix) == len(ids) - len(removed)
+    keep = ~np.isin(ids, removed)
+    assert matrix.search(query, 20) == pytest.approx(brute_force(ids[keep], vectors[keep], query, 20))
+    assert matrix.search(query, 1)[0][0] == 5
+    # Views handed out earlier are never written in place
+    assert list(ids_before) == list(ids)
+
+
+def test_add_rejects_mismatched_shapes():
+    with pytest.raises(ValueError):
+        UserVectorMatrix(DIM).add([1, 2], random_vectors(1))
+
+
+def test_int8_codes_track_float_scores():
+    ids = np.arange(2000)
+    vectors = random_vectors(len(ids))
+    matrix = QuantizedVectorMatrix(DIM, 'int8')
+    matrix.add(ids, vectors)
+    query = random_vectors(1, seed=3)[0]
+
+    expected = brute_force(ids, vectors, query, 50)
+    results = matrix.search(query, 50)
+
+    expected_scores = dict(brute_force(ids, vectors, query, len(ids)))
+    for message_id, score in results:
+        assert score == pytest.approx(expected_scores[message_id], abs=0.02)
+    assert len({i for i, _ in results[:10]} & {i for i, _ in expected[:10]}) >= 9
+
+
+def test_binary_codes_rank_by_hamming_distance():
+    ids = np.arange(2000)
+    vectors = random_vectors(len(ids))
+    matrix = QuantizedVectorMatrix(DIM, 'binary')
+    matrix.add(ids, vectors)
+    query = random_vectors(1, seed=4)[0]
+
+    distance = ((vectors > 0) != (query > 0)).sum(axis=1)
+    expected_scores = 1.0 - 2.0 * distance / DIM
+    results = matrix.search(query, 25)
+
+    assert [s for _, s in results] == pytest.approx(sorted(expected_scores, reverse=True)[:25])
+    for message_id, score in results:
+        assert score == pytest.approx(expected_scores[message_id])
+
+    matrix.remove([i for i, _ in results])
+    assert len(matrix) == len(ids) - 25
+    assert not {i for i, _ in matrix.search(query, 25)} & {i for i, _ in results}
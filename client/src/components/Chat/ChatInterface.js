@@ -112,7 +112,7 @@ const ChatInterface = ({ user }) => {
     setLoading(true);
 
     try {
-      const response = await fetch(`${API_BASE}/chat/send`, {
+      const response = await fetch(`${API_BASE}/chat/stream`, {
         method: 'POST',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -124,28 +124,62 @@ const ChatInterface = ({ user }) => {
         })
       });
 
-      const data = await response.json();
-
       if (!response.ok) {
         // Handle error response
+        const data = await response.json().catch(() => ({}));
         const errorMsg = data.error || `Error: ${response.status} ${response.statusText}`;
         console.error('API Error:', errorMsg, data);
         alert(`Error: ${errorMsg}\n\nPlease check:\n1. Your API key is configured in Settings\n2. The API key is correct\n3. You have sufficient credits`);
         return;
       }
 
-      if (data.conversation_id) {
-        if (!conversationId) {
-          window.history.pushState({}, '', `/chat/${data.conversation_id}`);
+      // Server-Sent Events: blocks separated by a blank line, each with "event:" and "data:" lines
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streaming = false;
+
+      const handleEvent = (event, data) => {
+        if (event === 'start') {
+          if (!conversationId) {
+            window.history.pushState({}, '', `/chat/${data.conversation_id}`);
+          }
+          setConversation({ id: data.conversation_id });
+        } else if (event === 'delta') {
+          if (!streaming) {
+            streaming = true;
+            setMessages(prev => [...prev, { role: 'assistant', content: data.content }]);
+          } else {
+            setMessages(prev => {
+              const last = prev[prev.length - 1];
+              return [...prev.slice(0, -1), { ...last, content: last.content + data.content }];
+            });
+          }
+        } else if (event === 'done') {
+          setMessages(prev => (streaming ? [...prev.slice(0, -1), data.message] : [...prev, data.message]));
+        } else if (event === 'error') {
+          console.error('Stream error:', data.error);
+          alert(`Error: ${data.error}`);
         }
-        setConversation({ id: data.conversation_id });
-      }
+      };
 
-      if (data.message) {
-        setMessages(prev => [...prev, data.message]);
-      } else {
-        console.error('No message in response:', data);
-        alert('Received response but no message content. Check console for details.');
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = 'message';
+          let data = '';
+          block.split('\n').forEach((line) => {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          });
+          if (data) handleEvent(event, JSON.parse(data));
+        }
       }
     } catch (error) {
       console.error('Error sending message:', error);
@@ -263,7 +297,7 @@ const ChatInterface = ({ user }) => {
             </motion.div>
           ))}
 
-          {loading && (
+          {loading && messages[messages.length - 1]?.role === 'user' && (
             <motion.div
               initial={{ opacity: 0, scale: 0.9 }}
               animate={{ opacity: 1, scale: 1 }}
@@ -7,6 +7,8 @@ import API_BASE, { getAuthHeaders } from '../../config/api';
 const ConversationsList = ({ user }) => {
   const [conversations, setConversations] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filters, setFilters] = useState({
     platform: '',
     model: '',
@@ -20,20 +22,25 @@ const ConversationsList = ({ user }) => {
     fetchFolders();
   }, [filters]);
 
+  const buildParams = (cursor) => {
+    const params = new URLSearchParams();
+    if (filters.platform) params.append('platform', filters.platform);
+    if (filters.model) params.append('model', filters.model);
+    if (filters.folder_id) params.append('folder_id', filters.folder_id);
+    if (filters.search) params.append('search', filters.search);
+    if (cursor) params.append('cursor', cursor);
+    return params;
+  };
+
   const fetchConversations = async () => {
     setLoading(true);
     try {
-      const params = new URLSearchParams();
-      if (filters.platform) params.append('platform', filters.platform);
-      if (filters.model) params.append('model', filters.model);
-      if (filters.folder_id) params.append('folder_id', filters.folder_id);
-      if (filters.search) params.append('search', filters.search);
-
-      const response = await fetch(`${API_BASE}/conversations?${params}`, {
+      const response = await fetch(`${API_BASE}/conversations?${buildParams()}`, {
         headers: getAuthHeaders()
       });
       const data = await response.json();
       setConversations(data.conversations || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Error fetching conversations:', error);
     } finally {
@@ -41,6 +48,23 @@ const ConversationsList = ({ user }) => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(`${API_BASE}/conversations?${buildParams(nextCursor)}`, {
+        headers: getAuthHeaders()
+      });
+      const data = await response.json();
+      setConversations((current) => [...current, ...(data.conversations || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more conversations:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchFolders = async () => {
     try {
       const response = await fetch(`${API_BASE}/folders`, {
@@ -242,6 +266,20 @@ const ConversationsList = ({ user }) => {
           )}
         </AnimatePresence>
       </div>
+
+      {nextCursor && (
+        <div className="flex justify-center">
+          <motion.button
+            onClick={loadMore}
+            disabled={loadingMore}
+            whileHover={{ scale: 1.02 }}
+            whileTap={{ scale: 0.98 }}
+            className="px-4 py-2.5 border border-gray-200/50 rounded-xl hover:bg-gray-50 transition-all duration-200 font-medium text-[15px] bg-white/80 backdrop-blur-sm shadow-sm"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </motion.button>
+        </div>
+      )}
     </div>
   );
 };